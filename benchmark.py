@@ -0,0 +1,551 @@
+# Imports
+import argparse
+import csv
+import gc
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from py_code import CaseArchive, NameIndex, SearchAlgorithm, SortingAlgorithm
+
+# ------------------------ Archive Generator ------------------------
+
+class CaseGenerator:
+    # Writes synthetic archives in the layout of case_archive.csv. The same
+    # seed and row count always give the same file. Names are drawn with
+    # Zipf-like weights, so some suspects and victims appear in many cases, as
+    # repeat offenders do, and crime types, severities and statuses follow the
+    # patterns of the real archive: unknown suspects leave cases unsolved,
+    # murders are severity 10 and thefts 1 or 2.
+    first_names = (
+        "James", "Mary", "Michael", "Jennifer", "Robert", "Linda", "David",
+        "Patricia", "John", "Elizabeth", "William", "Jessica", "Daniel",
+        "Sarah", "Christopher", "Karen", "Matthew", "Nancy", "Anthony", "Lisa",
+        "Mark", "Angela", "Paul", "Melissa", "Steven", "Michelle", "Kenneth",
+        "Nicole", "Jeffery", "Heidi", "Travis", "Christina", "Jeremy", "Paula",
+        "Dale", "Julia", "Darren", "Latoya", "Douglas", "Brandy", "Larry",
+        "Carrie", "Ernest", "Angelica", "Jim", "Michele", "Kevin",
+        "Laura", "Brian", "Amy", "Jason", "Rebecca", "Ryan", "Sharon", "Gary",
+        "Cynthia", "Eric", "Kathleen", "Jacob", "Helen",
+    )
+    last_names = (
+        "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+        "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez",
+        "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+        "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark",
+        "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen", "King",
+        "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green",
+        "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell",
+        "Carter", "Roberts", "Castillo", "Ross", "Rollins", "Long", "Wilkerson",
+        "Mckinney", "Bartlett", "Gilmore", "Reed", "Potter", "Holt", "Guerrero",
+        "Burns", "Hamilton", "Hutchinson", "Stark", "Durham", "Fuller",
+        "Fitzgerald", "Patton", "Peterson", "Delgado", "Rosales", "Dawson",
+        "Butler", "Kaiser", "Singh", "Pearson", "Li",
+    )
+    # (crime type, share of cases, lowest severity, highest severity)
+    crime_types = (
+        ("Theft", 30, 1, 2),
+        ("Burglary", 20, 2, 3),
+        ("Fraud", 18, 3, 5),
+        ("Assault", 17, 5, 6),
+        ("Arson", 8, 5, 7),
+        ("Murder", 7, 10, 10),
+    )
+    unknown_suspect_share = 0.45
+    unknown_victim_share = 0.02
+    first_date = datetime(1980, 1, 1)
+    last_date = datetime(2023, 12, 31)
+
+    def __init__(self, seed=42):
+        self.random = random.Random(seed)
+        self.first_name_weights = CaseGenerator.zipf_weights(
+            len(CaseGenerator.first_names)
+        )
+        self.last_name_weights = CaseGenerator.zipf_weights(
+            len(CaseGenerator.last_names)
+        )
+        self.crime_type_weights = list(
+            CaseGenerator.cumulative(share for _, share, _, _ in CaseGenerator.crime_types)
+        )
+
+    def cumulative(weights):
+        total = 0
+        for weight in weights:
+            total += weight
+            yield total
+
+    def zipf_weights(count, exponent=1.0):
+        return list(
+            CaseGenerator.cumulative(1 / (rank ** exponent) for rank in range(1, count + 1))
+        )
+
+    def case_ids(self, count):
+        # Unique IDs in a random-looking order without holding them all: an
+        # affine map i -> (a * i + b) mod m visits every number below m once
+        # when a and m are coprime.
+        modulus = max(100000, count * 10)
+        multiplier = self.random.randrange(modulus // 3, modulus)
+        while math.gcd(multiplier, modulus) != 1:
+            multiplier += 1
+        offset = self.random.randrange(modulus)
+        for i in range(count):
+            yield (multiplier * i + offset) % modulus + 1
+
+    def names(self, count):
+        firsts = self.random.choices(
+            CaseGenerator.first_names, cum_weights=self.first_name_weights, k=count
+        )
+        lasts = self.random.choices(
+            CaseGenerator.last_names, cum_weights=self.last_name_weights, k=count
+        )
+        return [f"{first} {last}" for first, last in zip(firsts, lasts)]
+
+    def rows(self, count, batch_size=10000):
+        # Yields CSV rows (without the header) in batches of batch_size.
+        day_span = (CaseGenerator.last_date - CaseGenerator.first_date).days
+        case_ids = self.case_ids(count)
+        rng = self.random
+
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            suspects = self.names(size)
+            victims = self.names(size)
+            crimes = rng.choices(
+                CaseGenerator.crime_types, cum_weights=self.crime_type_weights, k=size
+            )
+
+            for i in range(size):
+                crime_type, _, low, high = crimes[i]
+                suspect = suspects[i]
+                victim = victims[i]
+                if rng.random() < CaseGenerator.unknown_suspect_share:
+                    suspect = "Unknown"
+                if rng.random() < CaseGenerator.unknown_victim_share:
+                    victim = "Jane Doe" if rng.random() < 0.5 else "John Doe"
+
+                date = CaseGenerator.first_date + timedelta(days=rng.randrange(day_span + 1))
+                yield [
+                    next(case_ids),
+                    date.strftime("%d/%m/%Y"),
+                    crime_type,
+                    suspect,
+                    victim,
+                    rng.randint(low, high),
+                    "Unsolved" if suspect == "Unknown" else "Solved",
+                ]
+
+    def write(self, path, count):
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(
+                ["CaseID", "Date", "CrimeType", "MainSuspect", "Victim", "CaseSeverity", "Status"]
+            )
+            writer.writerows(self.rows(count))
+
+
+class NameGenerator:
+    # Distinct "First Last" names for the name index benchmark. The first
+    # names are those of CaseGenerator, and the last names are made of two or
+    # three syllables, so there are enough of them for millions of distinct
+    # names while many of them are only an edit or two apart, as real names
+    # are.
+    syllables = (
+        "an", "ber", "cas", "del", "ed", "fer", "gar", "hal", "in", "jo",
+        "kin", "la", "mar", "ne", "ol", "per", "quin", "ros", "son", "til",
+        "lo", "ur", "van", "wil", "ton", "ber", "ley", "ski", "man", "ger",
+        "ri", "co", "den", "ford", "ham", "mo", "ra", "sen", "tor", "ve",
+    )
+
+    def __init__(self, seed=42):
+        self.random = random.Random(seed)
+
+    def last_name(self):
+        rng = self.random
+        syllables = NameGenerator.syllables
+        return "".join(
+            rng.choice(syllables) for _ in range(rng.randint(2, 3))
+        ).capitalize()
+
+    def names(self, count):
+        rng = self.random
+        last_names = sorted({self.last_name() for _ in range(count // 10 + 1)})
+        names = set()
+        while len(names) < count:
+            names.add(f"{rng.choice(CaseGenerator.first_names)} {rng.choice(last_names)}")
+        return sorted(names)
+
+
+# ------------------------ Benchmark Harness ------------------------
+
+class Benchmark:
+    # Times every archive operation on one generated archive. Each operation is
+    # run repeat times and the best time is kept; peak memory is measured in a
+    # separate run under tracemalloc, which slows code down too much to time
+    # it at the same time. Query results are not cached (cache_size=0).
+    query_count = 100
+    linear_query_count = 5
+
+    def __init__(self, path, repeat=3, measure_memory=True, seed=42):
+        self.path = path
+        self.repeat = repeat
+        self.measure_memory = measure_memory
+        self.random = random.Random(seed)
+        self.results = {}
+
+    def measure(self, name, operation):
+        seconds = None
+        for _ in range(self.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            operation()
+            elapsed = time.perf_counter() - start
+            if seconds is None or elapsed < seconds:
+                seconds = elapsed
+
+        result = {"seconds": seconds}
+        if self.measure_memory:
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            operation()
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1] - before
+            tracemalloc.stop()
+
+        self.results[name] = result
+        print(
+            f"{name:28} {seconds * 1000:12.3f} ms"
+            + (
+                f" {result['peak_bytes'] / 1048576:10.2f} MiB"
+                if "peak_bytes" in result
+                else ""
+            ),
+            file=sys.stderr,
+        )
+
+    def run(self):
+        self.measure("load_cases", lambda: CaseArchive(cache_size=0).load_cases(self.path))
+
+        case_archive = CaseArchive(cache_size=0)
+        case_archive.load_cases(self.path)
+        cases = case_archive.case_list
+        samples = [self.random.choice(cases) for _ in range(Benchmark.query_count)]
+        suspects = [case.suspect.name for case in samples]
+        victims = [case.victim.name for case in samples]
+        case_ids = [case.case_id for case in samples]
+        misspelled = [name[:-1] + "x" for name in victims]
+        by_case_id = SortingAlgorithm().merge_sort(cases, "case_id")
+
+        # Searches run query_count lookups (linear searches fewer) per timing.
+        def run_all(search, values):
+            return lambda: [search(value) for value in values]
+
+        self.measure("search_suspect", run_all(case_archive.search_suspect, suspects))
+        self.measure("search_victim", run_all(case_archive.search_victim, victims))
+        self.measure("search_case_id", run_all(case_archive.search_case_id, case_ids))
+        self.measure(
+            "search_suspect_prefix",
+            run_all(case_archive.search_suspect_prefix, [name[:4] for name in suspects]),
+        )
+        self.measure(
+            "search_victim_fuzzy", run_all(case_archive.search_victim_fuzzy, misspelled)
+        )
+        self.measure(
+            "binary_search",
+            run_all(
+                lambda case_id: SearchAlgorithm.binary_search(by_case_id, "case_id", case_id),
+                case_ids,
+            ),
+        )
+        self.measure(
+            "linear_search",
+            run_all(
+                lambda name: SearchAlgorithm.linear_search(cases, "suspect", name),
+                suspects[:Benchmark.linear_query_count],
+            ),
+        )
+
+        self.measure(
+            "filter_crime_type", lambda: case_archive.filter_cases("Theft", None, None)
+        )
+        self.measure("filter_severity", lambda: case_archive.filter_cases(None, 5, None))
+        self.measure("filter_status", lambda: case_archive.filter_cases(None, None, "Unsolved"))
+        self.measure(
+            "filter_combined", lambda: case_archive.filter_cases("Arson", 7, "Unsolved")
+        )
+        self.measure(
+            "range_query",
+            lambda: case_archive.range_query(
+                datetime(2000, 1, 1), datetime(2000, 12, 31), 5, None
+            ),
+        )
+
+        for attribute in SortingAlgorithm.sort_keys:
+            self.measure(
+                f"sort_{attribute}", lambda: case_archive.sort_cases(attribute)
+            )
+        self.measure(
+            "sort_severity_desc_date",
+            lambda: case_archive.sort_cases([("severity", True), ("date", False)]),
+        )
+        self.measure(
+            "top_50_severity",
+            lambda: case_archive.top_cases(50, "severity", True, status="Unsolved"),
+        )
+
+        return self.results
+
+    def compare(results, baseline, tolerance):
+        # Returns one line per operation that got slower (or used more memory)
+        # than the baseline by more than the tolerance, e.g. 0.25 for 25 %.
+        # Very short timings are compared with a small absolute allowance, so
+        # timer noise on sub-millisecond operations is not reported.
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+
+            for metric, allowance in (("seconds", 0.001), ("peak_bytes", 65536)):
+                if metric not in result or metric not in expected:
+                    continue
+                limit = expected[metric] * (1 + tolerance) + allowance
+                if result[metric] > limit:
+                    regressions.append(
+                        f"{name}: {metric} {result[metric]:.6g} > "
+                        f"baseline {expected[metric]:.6g}"
+                    )
+        return regressions
+
+
+class NameIndexBenchmark:
+    # Builds one NameIndex over count distinct names and times prefix and
+    # fuzzy lookups on it one by one. The targets are those of the archive's
+    # name searches: every lookup (at the 99th percentile) under a
+    # millisecond, and the index at most memory_target bytes per name on top
+    # of the name strings themselves.
+    query_count = 1000
+    latency_target = 0.001
+    memory_target = 200
+
+    def __init__(self, count, seed=42):
+        self.count = count
+        self.random = random.Random(seed)
+        self.names = [
+            CaseArchive.normalize_name(name) for name in NameGenerator(seed).names(count)
+        ]
+
+    def build(self):
+        name_index = NameIndex()
+        for name in self.names:
+            name_index.add(name)
+        return name_index.freeze()
+
+    def misspell(self, name):
+        # One substituted letter, which fuzzy lookups must still find.
+        i = self.random.choice([i for i, char in enumerate(name) if char != " "])
+        return name[:i] + ("X" if name[i] != "X" else "Y") + name[i + 1:]
+
+    def latencies(self, lookup, queries):
+        seconds = []
+        for query in queries:
+            start = time.perf_counter()
+            lookup(query)
+            seconds.append(time.perf_counter() - start)
+        seconds.sort()
+        return {
+            "mean_ms": sum(seconds) / len(seconds) * 1000,
+            "p99_ms": seconds[int(len(seconds) * 0.99)] * 1000,
+        }
+
+    def run(self):
+        gc.collect()
+        start = time.perf_counter()
+        self.build()
+        build_seconds = time.perf_counter() - start
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        name_index = self.build()
+        index_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        samples = [self.random.choice(self.names) for _ in range(NameIndexBenchmark.query_count)]
+        misspelled = [self.misspell(name) for name in samples]
+        results = {
+            "names": self.count,
+            "build_seconds": build_seconds,
+            "bytes_per_name": index_bytes / self.count,
+            "prefix": self.latencies(
+                name_index.prefix_matches,
+                [name.split(" ")[-1][:4] for name in samples],
+            ),
+            "fuzzy": self.latencies(name_index.fuzzy_matches, misspelled),
+            "fuzzy_found": sum(
+                name in name_index.fuzzy_matches(query)
+                for name, query in zip(samples, misspelled)
+            ) / len(samples),
+        }
+
+        print(
+            f"{self.count} names: built in {build_seconds:.2f} s, "
+            f"{results['bytes_per_name']:.0f} bytes per name",
+            file=sys.stderr,
+        )
+        for lookup in ("prefix", "fuzzy"):
+            print(
+                f"{lookup:8} mean {results[lookup]['mean_ms']:.3f} ms, "
+                f"p99 {results[lookup]['p99_ms']:.3f} ms",
+                file=sys.stderr,
+            )
+        print(
+            f"fuzzy lookups found the misspelled name {results['fuzzy_found']:.1%} of the time",
+            file=sys.stderr,
+        )
+        return results
+
+    def missed_targets(results):
+        missed = []
+        for lookup in ("prefix", "fuzzy"):
+            if results[lookup]["p99_ms"] > NameIndexBenchmark.latency_target * 1000:
+                missed.append(
+                    f"{lookup} lookups: p99 {results[lookup]['p99_ms']:.3f} ms > "
+                    f"{NameIndexBenchmark.latency_target * 1000:.0f} ms"
+                )
+        if results["bytes_per_name"] > NameIndexBenchmark.memory_target:
+            missed.append(
+                f"memory: {results['bytes_per_name']:.0f} bytes per name > "
+                f"{NameIndexBenchmark.memory_target}"
+            )
+        return missed
+
+
+def data_path(data_dir, rows, seed):
+    return os.path.join(data_dir, f"cases_{rows}_{seed}.csv")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the case archive.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="write a synthetic archive")
+    generate.add_argument("--rows", type=int, default=100000)
+    generate.add_argument("--seed", type=int, default=42)
+    generate.add_argument("--output", default="case_archive_generated.csv")
+
+    run = subparsers.add_parser("run", help="run the benchmarks")
+    run.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="archive sizes to benchmark (from 10^3 up to 10^7)",
+    )
+    run.add_argument("--seed", type=int, default=42)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument(
+        "--no-memory", action="store_true", help="skip the peak memory runs"
+    )
+    run.add_argument(
+        "--data-dir",
+        default="benchmark_data",
+        help="where generated archives are kept between runs",
+    )
+    run.add_argument("--output", help="write the results to this JSON file")
+    run.add_argument(
+        "--baseline",
+        default="benchmark_baseline.json",
+        help="results to compare against",
+    )
+    run.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store these results as the new baseline",
+    )
+    run.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown before a result counts as a regression",
+    )
+    names = subparsers.add_parser(
+        "names", help="benchmark the name index against its targets"
+    )
+    names.add_argument("--names", type=int, default=1000000)
+    names.add_argument("--seed", type=int, default=42)
+    names.add_argument("--output", help="write the results to this JSON file")
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "names":
+        results = NameIndexBenchmark(arguments.names, arguments.seed).run()
+        if arguments.output:
+            with open(arguments.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+        missed = NameIndexBenchmark.missed_targets(results)
+        if missed:
+            print("\nMissed targets:", file=sys.stderr)
+            for target in missed:
+                print(f"  {target}", file=sys.stderr)
+            return 1
+        return 0
+
+    if arguments.command == "generate":
+        CaseGenerator(arguments.seed).write(arguments.output, arguments.rows)
+        print(f"Wrote {arguments.rows} cases to {arguments.output}", file=sys.stderr)
+        return 0
+
+    os.makedirs(arguments.data_dir, exist_ok=True)
+    results = {}
+    for rows in arguments.rows:
+        path = data_path(arguments.data_dir, rows, arguments.seed)
+        if not os.path.exists(path):
+            print(f"Generating {rows} cases in {path}", file=sys.stderr)
+            CaseGenerator(arguments.seed).write(path, rows)
+
+        print(f"\n=== {rows} cases ===", file=sys.stderr)
+        results[str(rows)] = Benchmark(
+            path, arguments.repeat, not arguments.no_memory, arguments.seed
+        ).run()
+
+    if arguments.output:
+        with open(arguments.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if arguments.save_baseline:
+        baseline.update(results)
+        with open(arguments.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nSaved baseline to {arguments.baseline}", file=sys.stderr)
+        return 0
+
+    regressions = []
+    for rows, size_results in results.items():
+        if rows not in baseline:
+            print(f"\nNo baseline for {rows} cases.", file=sys.stderr)
+            continue
+        for regression in Benchmark.compare(
+            size_results, baseline[rows], arguments.tolerance
+        ):
+            regressions.append(f"{rows} cases: {regression}")
+
+    if regressions:
+        print("\nRegressions:", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# Imports
+import argparse
+import asyncio
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+# ------------------------ Load Test Client ------------------------
+
+class LoadTest:
+    # Opens a number of keep-alive connections to the query server and sends
+    # requests over all of them at once, recording the latency of each one.
+    default_paths = (
+        "/search/suspect?name=Unknown",
+        "/search/victim?name=Jane Doe",
+        "/search/case_id?id=84435",
+        "/filter?crime_type=Arson&status=Unsolved",
+        "/range?start=01/01/1983&end=30/06/1983&min_severity=5",
+        "/sort?order=severity desc, date asc&page_size=20",
+        "/top?k=10&order=severity desc&status=Unsolved",
+    )
+
+    def __init__(self, host, port, paths, concurrency, total_requests):
+        self.host = host
+        self.port = port
+        self.paths = [quote(path, safe="/?&=:,") for path in paths]
+        self.concurrency = concurrency
+        self.total_requests = total_requests
+        self.latencies = []
+        self.errors = 0
+        self.next_request = 0
+
+    async def read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection.")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.readexactly(int(headers.get("content-length", 0)))
+
+        return status
+
+    async def worker(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while self.next_request < self.total_requests:
+                path = self.paths[self.next_request % len(self.paths)]
+                self.next_request += 1
+
+                start = time.perf_counter()
+                request = f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n"
+                writer.write(request.encode("latin-1"))
+                await writer.drain()
+                status = await LoadTest.read_response(reader)
+                self.latencies.append(time.perf_counter() - start)
+                if status != 200:
+                    self.errors += 1
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    async def run(self):
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker() for _ in range(self.concurrency)))
+        return time.perf_counter() - start
+
+    def percentile(sorted_values, fraction):
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+        return sorted_values[index]
+
+    def report(self, elapsed):
+        latencies = sorted(self.latencies)
+        print(f"Requests:      {len(latencies)} ({self.errors} errors)")
+        print(f"Concurrency:   {self.concurrency}")
+        print(f"Elapsed:       {elapsed:.3f} s")
+        print(f"Throughput:    {len(latencies) / elapsed:.1f} requests/s")
+        percentiles = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p99.9", 0.999))
+        for label, fraction in percentiles:
+            latency = LoadTest.percentile(latencies, fraction)
+            print(f"Latency {label + ':':7}{latency * 1000:.3f} ms")
+        if latencies:
+            print(f"Latency max:   {latencies[-1] * 1000:.3f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test the case archive server."
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument(
+        "--path",
+        action="append",
+        help="request path to send (repeatable; default: a mix of all endpoints)",
+    )
+    arguments = parser.parse_args(argv)
+
+    url = urlsplit(arguments.url)
+    load_test = LoadTest(
+        url.hostname or "127.0.0.1",
+        url.port or 80,
+        arguments.path or LoadTest.default_paths,
+        arguments.concurrency,
+        arguments.requests,
+    )
+    try:
+        elapsed = asyncio.run(load_test.run())
+    except OSError as e:
+        print(f"Load test failed: {str(e)}", file=sys.stderr)
+        return 1
+
+    load_test.report(elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,41 @@
 # Imports
+import argparse
+import copy
+import cProfile
 import csv
+import functools
+import heapq
+import io
+import json
+import mmap
+import os
+import pickle
+import shlex
+import struct
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import islice, repeat
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the optional columnar case store
+    np = None
 
 # ------------------------ Data Classes ------------------------
 
 class Person:
+    __slots__ = ("name",)
+
     def __init__(self, name):
         self.name = name
 
@@ -13,6 +44,8 @@ class Person:
 
 
 class Suspect(Person):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -21,6 +54,8 @@ class Suspect(Person):
 
 
 class Victim(Person):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -29,6 +64,16 @@ class Victim(Person):
 
 
 class Case:
+    __slots__ = (
+        "case_id",
+        "date",
+        "suspect",
+        "victim",
+        "crime_type",
+        "severity",
+        "status",
+    )
+
     def __init__(self, case_id, date, suspect, victim, crime_type, severity, status):
         self.case_id = case_id
         self.date = date
@@ -47,76 +92,539 @@ class Case:
             f"Status: {self.status}"
         )
 
+    def to_row(self):
+        # The case as a row in the column order of case_archive.csv.
+        return [
+            self.case_id,
+            self.date.strftime("%d/%m/%Y"),
+            self.crime_type,
+            self.suspect.name,
+            self.victim.name,
+            self.severity,
+            self.status,
+        ]
+
+    def to_record(self):
+        return dict(zip(CaseParser.columns, self.to_row()))
+
+
+class CaseInterner:
+    # Flyweight pools for the values that repeat across cases. Every suspect or
+    # victim name maps to one shared Person object, and every crime type,
+    # status and date to one shared value.
+    def __init__(self):
+        self.suspects = {}
+        self.victims = {}
+        self.dates = {}
+
+    def suspect(self, name):
+        suspect = self.suspects.get(name)
+        if suspect is None:
+            suspect = self.suspects[name] = Suspect(sys.intern(name))
+        return suspect
+
+    def victim(self, name):
+        victim = self.victims.get(name)
+        if victim is None:
+            victim = self.victims[name] = Victim(sys.intern(name))
+        return victim
+
+    def date(self, date):
+        return self.dates.setdefault(date, date)
+
+    def string(self, value):
+        return sys.intern(value)
+
+    def build_case(
+        self, case_id, date, suspect_name, victim_name, crime_type, severity, status
+    ):
+        return Case(
+            case_id,
+            self.date(date),
+            self.suspect(suspect_name),
+            self.victim(victim_name),
+            self.string(crime_type),
+            severity,
+            self.string(status),
+        )
+
+
+# ------------------------ Instrumentation ------------------------
+
+class LatencyHistogram:
+    # Latencies of one operation in buckets that double in width: bucket 0
+    # holds calls under 1 microsecond, bucket i calls of up to 2**i
+    # microseconds. Percentiles are read off the bucket bounds, so they are
+    # accurate to within a factor of two; count, total, min and max are exact.
+    __slots__ = ("buckets", "count", "total", "minimum", "maximum")
+    bucket_count = 40
+
+    def __init__(self):
+        self.buckets = [0] * LatencyHistogram.bucket_count
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        bucket = min(
+            int(seconds * 1000000).bit_length(), LatencyHistogram.bucket_count - 1
+        )
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return min((2 ** bucket) / 1000000, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "min_ms": (self.minimum or 0.0) * 1000,
+            "p50_ms": self.percentile(0.5) * 1000,
+            "p90_ms": self.percentile(0.9) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.maximum * 1000,
+        }
+
+
+class Instrumentation:
+    # Latency histograms per archive operation, counters (rows loaded and
+    # rejected, comparisons made by the sort and search algorithms, sorted
+    # index merges) and optional cProfile and tracemalloc hooks. Everything is
+    # off until enable() is called, and while off, an instrumented call costs
+    # one attribute check.
+    #
+    # cProfile only follows the thread it runs in, so while profiling is on,
+    # the outermost instrumented operations run one at a time under a shared
+    # profiler. That way the profile also covers queries run in the server's
+    # worker threads, at the price of serializing them.
+    load_counter = "rows loaded"
+    profile_limit = 20
+    memory_limit = 10
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.profile_lock = threading.Lock()
+        self.local = threading.local()
+        self.profiler = None
+        self.tracing_memory = False
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = Counter()
+            self.load_seconds = 0.0
+        with self.profile_lock:
+            if self.profiler is not None:
+                self.profiler = cProfile.Profile()
+        if self.tracing_memory:
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+
+    def enable(self, profile=None, trace_memory=None):
+        # None leaves the profiler or memory tracing as it is.
+        self.enabled = True
+        if profile is not None:
+            with self.profile_lock:
+                if not profile:
+                    self.profiler = None
+                elif self.profiler is None:
+                    self.profiler = cProfile.Profile()
+
+        if trace_memory is not None and trace_memory != self.tracing_memory:
+            if trace_memory:
+                tracemalloc.start()
+            else:
+                tracemalloc.stop()
+            self.tracing_memory = trace_memory
+
+    def disable(self):
+        self.enable(profile=False, trace_memory=False)
+        self.enabled = False
+
+    def timed(self, operation):
+        # Decorator recording the latency of every call under operation.
+        def decorate(function):
+            @functools.wraps(function)
+            def instrumented(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                return self.call(operation, function, args, kwargs)
+
+            return instrumented
+
+        return decorate
+
+    def call(self, operation, function, args, kwargs):
+        # Operations called from inside another one (e.g. load_cases from
+        # refresh_cases) are timed too, but run in their caller's profile.
+        depth = getattr(self.local, "depth", 0)
+        profiler = self.profiler
+        self.local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            if depth == 0 and profiler is not None:
+                with self.profile_lock:
+                    return profiler.runcall(function, *args, **kwargs)
+            return function(*args, **kwargs)
+        finally:
+            self.local.depth = depth
+            self.record(operation, time.perf_counter() - start)
+
+    def record(self, operation, seconds):
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def count(self, counter, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[counter] += amount
+
+    def count_rows(self, rows, seconds):
+        # Rows parsed and indexed by a load, and the time that took.
+        if self.enabled:
+            with self.lock:
+                self.counters[Instrumentation.load_counter] += rows
+                self.load_seconds += seconds
+
+    def profile_report(self):
+        with self.profile_lock:
+            if self.profiler is None:
+                return None
+            self.profiler.create_stats()
+            stats = self.profiler.stats
+
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "own_ms": own_time * 1000,
+                "cumulative_ms": cumulative_time * 1000,
+            }
+            for (filename, line, name), (_, calls, own_time, cumulative_time, _)
+            in functions[:Instrumentation.profile_limit]
+        ]
+
+    def memory_report(self):
+        if not self.tracing_memory:
+            return None
+
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")
+        return {
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in top[:Instrumentation.memory_limit]
+            ],
+        }
+
+    def report(self):
+        with self.lock:
+            operations = {
+                operation: histogram.summary()
+                for operation, histogram in sorted(self.histograms.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+            load_seconds = self.load_seconds
+
+        rows = counters.get(Instrumentation.load_counter, 0)
+        return {
+            "enabled": self.enabled,
+            "operations": operations,
+            "counters": counters,
+            "rows_per_second": rows / load_seconds if load_seconds else None,
+            "profile": self.profile_report(),
+            "memory": self.memory_report(),
+        }
+
+    def format_report(report):
+        lines = [f"Instrumentation: {'on' if report['enabled'] else 'off'}"]
+
+        if report["operations"]:
+            lines.append(
+                f"{'Operation':24} {'Calls':>8} {'Mean ms':>10} {'p50 ms':>10} "
+                f"{'p90 ms':>10} {'p99 ms':>10} {'Max ms':>10}"
+            )
+            for operation, summary in report["operations"].items():
+                lines.append(
+                    f"{operation:24} {summary['count']:8} {summary['mean_ms']:10.3f} "
+                    f"{summary['p50_ms']:10.3f} {summary['p90_ms']:10.3f} "
+                    f"{summary['p99_ms']:10.3f} {summary['max_ms']:10.3f}"
+                )
+
+        for counter, value in report["counters"].items():
+            lines.append(f"{counter + ':':24} {value}")
+        if report["rows_per_second"] is not None:
+            lines.append(f"{'rows per second:':24} {report['rows_per_second']:.0f}")
+
+        if report["profile"]:
+            lines.append("Profile (by cumulative time):")
+            for entry in report["profile"]:
+                lines.append(
+                    f"  {entry['cumulative_ms']:10.3f} ms {entry['calls']:10} calls  "
+                    f"{entry['function']}"
+                )
+
+        if report["memory"]:
+            memory = report["memory"]
+            lines.append(
+                f"Traced memory: {memory['current_bytes'] / 1048576:.2f} MiB "
+                f"(peak {memory['peak_bytes'] / 1048576:.2f} MiB)"
+            )
+            for entry in memory["top"]:
+                lines.append(
+                    f"  {entry['size_bytes'] / 1024:10.1f} KiB {entry['count']:10} blocks  "
+                    f"{entry['location']}"
+                )
+
+        return "\n".join(lines)
+
+
+# Shared by every archive in the process.
+instrumentation = Instrumentation()
+
 
 # ------------------------ Algorithm Classes ------------------------
 
+class DescendingKey:
+    # Wraps a sort key so that it orders in reverse, for mixing ascending and
+    # descending keys inside one tuple key.
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
 class SortingAlgorithm:
+    sort_keys = {
+        "case_id": lambda case: case.case_id,
+        "date": lambda case: case.date,
+        "severity": lambda case: case.severity,
+        "status": lambda case: case.status.lower(),
+    }
+
     def case_attribute(case, attribute):
-        if attribute == "case_id":
-            return case.case_id
+        key = SortingAlgorithm.sort_keys.get(
+            attribute, SortingAlgorithm.sort_keys["case_id"]  # default
+        )
+        return key(case)
 
-        elif attribute == "date":
-            return case.date
+    def sort_order(sort_attribute, reverse=False):
+        # A sort attribute is either a single attribute name or a list of keys,
+        # where each key is an attribute name or an (attribute, descending) pair.
+        # The reverse option flips the direction of every key.
+        if isinstance(sort_attribute, str):
+            return [(sort_attribute, reverse)]
+
+        sort_order = []
+        for key in sort_attribute:
+            if isinstance(key, str):
+                sort_order.append((key, reverse))
+            else:
+                attribute, descending = key
+                sort_order.append((attribute, descending != reverse))
+        return sort_order
 
-        elif attribute == "severity":
-            return case.severity
+    def parse_sort_keys(text):
+        # Parses input such as "severity desc, date asc" into a list of keys.
+        sort_keys = []
+        for part in text.split(","):
+            words = part.strip().lower().split()
+            if not words:
+                continue
 
-        elif attribute == "status":
-            return case.status.lower()
+            attribute = words[0]
+            if attribute == "id":
+                attribute = "case_id"
+            if attribute not in SortingAlgorithm.sort_keys:
+                raise ValueError(f"Cannot sort by '{words[0]}'.")
 
-        else:
-            return case.case_id  # default
+            direction = words[1] if len(words) > 1 else "asc"
+            if direction not in ("asc", "desc") or len(words) > 2:
+                raise ValueError("Sort direction must be 'asc' or 'desc'.")
 
-    def merge_sort(self, case_list, sort_attribute):
-        if len(case_list) <= 1:
-            return case_list
+            sort_keys.append((attribute, direction == "desc"))
 
-        middle = len(case_list) // 2
-        left_half = self.merge_sort(case_list[:middle], sort_attribute)
-        right_half = self.merge_sort(case_list[middle:], sort_attribute)
+        if not sort_keys:
+            raise ValueError("At least one sort attribute is required.")
+        return sort_keys
 
-        sorted_cases = []
-        left_index = 0
-        right_index = 0
+    def merge_sort(self, case_list, sort_attribute, reverse=False):
+        sorted_cases = list(case_list)
 
-        while left_index < len(left_half) and right_index < len(right_half):
-            left_value = SortingAlgorithm.case_attribute(
-                left_half[left_index], sort_attribute
+        # Merge sort is stable, so sorting by the least significant key first
+        # and the most significant key last gives the multi-key ordering.
+        sort_order = SortingAlgorithm.sort_order(sort_attribute, reverse)
+        for attribute, descending in reversed(sort_order):
+            sorted_cases = self.bottom_up_merge_sort(
+                sorted_cases, attribute, descending
             )
-            right_value = SortingAlgorithm.case_attribute(
-                right_half[right_index], sort_attribute
+
+        return sorted_cases
+
+    def top_k(self, case_list, k, sort_attribute, reverse=False):
+        # Returns the first k cases of the sorted order using a bounded heap,
+        # in O(n log k) instead of sorting the whole list. Like merge_sort,
+        # the result is stable: ties keep their original order.
+        sort_order = SortingAlgorithm.sort_order(sort_attribute, reverse)
+        getters = [
+            (
+                SortingAlgorithm.sort_keys.get(
+                    attribute, SortingAlgorithm.sort_keys["case_id"]
+                ),
+                descending,
             )
+            for attribute, descending in sort_order
+        ]
 
-            if left_value <= right_value:
-                sorted_cases.append(left_half[left_index])
-                left_index += 1
+        if all(descending for _, descending in getters):
+            return heapq.nlargest(
+                k, case_list, key=lambda case: tuple(get(case) for get, _ in getters)
+            )
 
-            else:
-                sorted_cases.append(right_half[right_index])
-                right_index += 1
+        if not any(descending for _, descending in getters):
+            return heapq.nsmallest(
+                k, case_list, key=lambda case: tuple(get(case) for get, _ in getters)
+            )
+
+        return heapq.nsmallest(k, case_list, key=SortingAlgorithm.sort_key(sort_order))
+
+    def sort_key(sort_order):
+        # One key for a whole sort order, with the descending attributes
+        # wrapped in DescendingKey, e.g. for merging lists sorted by it.
+        getters = [
+            (
+                SortingAlgorithm.sort_keys.get(
+                    attribute, SortingAlgorithm.sort_keys["case_id"]
+                ),
+                descending,
+            )
+            for attribute, descending in sort_order
+        ]
+        return lambda case: tuple(
+            DescendingKey(get(case)) if descending else get(case)
+            for get, descending in getters
+        )
 
-        while left_index < len(left_half):
-            sorted_cases.append(left_half[left_index])
-            left_index += 1
+    def bottom_up_merge_sort(self, case_list, attribute, descending=False):
+        length = len(case_list)
+        if length <= 1:
+            return list(case_list)
 
-        while right_index < len(right_half):
-            sorted_cases.append(right_half[right_index])
-            right_index += 1
+        # Each key is computed once per case and moved alongside it, so no
+        # comparison has to look the attribute up again.
+        get_key = SortingAlgorithm.sort_keys.get(
+            attribute, SortingAlgorithm.sort_keys["case_id"]
+        )
+        source_keys = [get_key(case) for case in case_list]
+        source_cases = list(case_list)
+        target_keys = [None] * length
+        target_cases = [None] * length
 
-        return sorted_cases
+        # Merge neighbouring runs of width 1, 2, 4, ... back and forth between
+        # two buffers instead of recursing on slices.
+        comparisons = 0
+        width = 1
+        while width < length:
+            for start in range(0, length, 2 * width):
+                middle = min(start + width, length)
+                end = min(start + 2 * width, length)
+                left_index = start
+                right_index = middle
+                target_index = start
+
+                while left_index < middle and right_index < end:
+                    left_value = source_keys[left_index]
+                    right_value = source_keys[right_index]
+
+                    if descending:
+                        take_left = left_value >= right_value
+                    else:
+                        take_left = left_value <= right_value
+
+                    if take_left:
+                        target_keys[target_index] = left_value
+                        target_cases[target_index] = source_cases[left_index]
+                        left_index += 1
+
+                    else:
+                        target_keys[target_index] = right_value
+                        target_cases[target_index] = source_cases[right_index]
+                        right_index += 1
+
+                    target_index += 1
+
+                # Every step of the loop above made one comparison.
+                comparisons += target_index - start
+
+                while left_index < middle:
+                    target_keys[target_index] = source_keys[left_index]
+                    target_cases[target_index] = source_cases[left_index]
+                    left_index += 1
+                    target_index += 1
+
+                while right_index < end:
+                    target_keys[target_index] = source_keys[right_index]
+                    target_cases[target_index] = source_cases[right_index]
+                    right_index += 1
+                    target_index += 1
+
+            source_keys, target_keys = target_keys, source_keys
+            source_cases, target_cases = target_cases, source_cases
+            width *= 2
+
+        instrumentation.count("sort comparisons", comparisons)
+        return source_cases
 
 
 class SearchAlgorithm:
     def binary_search(case_list, search_attribute="case_id", search_value=None):
         first = 0
         last = len(case_list) - 1
+        steps = 0
 
         while first <= last:
             middle = (first + last) // 2
             middle_value = case_list[middle]
+            steps += 1
 
             if search_attribute == "case_id":
                 if middle_value.case_id == search_value:
+                    instrumentation.count("search comparisons", steps)
                     return middle_value
                 elif middle_value.case_id < search_value:
                     first = middle + 1
@@ -126,6 +634,8 @@ class SearchAlgorithm:
             else:
                 return None
 
+        instrumentation.count("search comparisons", steps)
+
     def linear_search(case_list, search_attribute, search_value):
         results = []
 
@@ -138,229 +648,4462 @@ class SearchAlgorithm:
                 if case.victim.name.upper() == search_value.upper():
                     results.append(case)
 
+        instrumentation.count("search comparisons", len(case_list))
         return results
 
+    def edit_distance(first, second, max_distance=None):
+        # Levenshtein distance, computed one row of the table at a time. With
+        # max_distance set, the computation stops as soon as the distance is
+        # known to exceed it and returns max_distance + 1.
+        if len(first) < len(second):
+            first, second = second, first
 
-# ------------------------ Case Archive Classes ------------------------
+        previous_row = list(range(len(second) + 1))
+        for i, first_char in enumerate(first, 1):
+            current_row = [i]
+            for j, second_char in enumerate(second, 1):
+                substitution = previous_row[j - 1] + (first_char != second_char)
+                deletion = previous_row[j] + 1
+                insertion = current_row[j - 1] + 1
+                if deletion < substitution:
+                    substitution = deletion
+                if insertion < substitution:
+                    substitution = insertion
+                current_row.append(substitution)
 
-class CaseArchive:
-    def __init__(self):
-        self.case_list = []
+            if max_distance is not None and min(current_row) > max_distance:
+                return max_distance + 1
+            previous_row = current_row
 
-    def load_cases(self, filepath):
-        try:
-            with open(filepath, "r", encoding="utf-8-sig") as f:
-                file_data = csv.DictReader(f)
-                for case in file_data:
-                    case_id_string = case["CaseID"]
-                    date_string = case["Date"]
-                    suspect_name = case["MainSuspect"]
-                    victim_name = case["Victim"]
-                    crime_type = case["CrimeType"]
-                    severity = case["CaseSeverity"]
-                    status = case["Status"]
-
-                    if (
-                        not case_id_string
-                        or not date_string
-                        or not crime_type
-                        or not severity
-                        or not status
-                        or not suspect_name
-                        or not victim_name
-                        
-                    ):
-                        raise ValueError(
-                            "CSV is missing required fields. Please check that all fields are present."
-                        )
+        return previous_row[-1]
 
-                    try:
-                        date = datetime.strptime(date_string, "%d/%m/%Y")
-                    except ValueError:
-                        raise ValueError("Date must be in the format DD/MM/YYYY.")
+    def pattern_masks(pattern):
+        # One bitmask per character of pattern, with bit i set where
+        # pattern[i] is that character, for pattern_distance.
+        masks = {}
+        bit = 1
+        for char in pattern:
+            masks[char] = masks.get(char, 0) | bit
+            bit <<= 1
+        return masks
 
-                    try:
-                        case_id = int(case_id_string)
-                    except ValueError:
-                        raise ValueError("Case ID must be an integer.")
+    def pattern_distance(masks, length, text):
+        # Levenshtein distance between a pattern of the given length (given by
+        # its pattern_masks) and text, by Myers' bit-parallel algorithm: a
+        # column of the edit_distance table is kept as two bitmasks of +1 and
+        # -1 steps, and each character of text updates the whole column with a
+        # few int operations. The masks are built once and reused for every
+        # text the pattern is compared with.
+        if not length:
+            return len(text)
 
-                    try:
-                        severity = int(severity)
-                    except ValueError:
-                        raise ValueError("Severity must be an integer.")
+        all_bits = (1 << length) - 1
+        last_bit = 1 << (length - 1)
+        plus = all_bits
+        minus = 0
+        distance = length
+        for char in text:
+            matches = masks.get(char, 0)
+            vertical = matches | minus
+            horizontal = (((matches & plus) + plus) ^ plus) | matches
+            horizontal_plus = minus | ~(horizontal | plus)
+            horizontal_minus = plus & horizontal
+            if horizontal_plus & last_bit:
+                distance += 1
+            elif horizontal_minus & last_bit:
+                distance -= 1
+            horizontal_plus = (horizontal_plus << 1) | 1
+            horizontal_minus <<= 1
+            plus = (horizontal_minus | ~(vertical | horizontal_plus)) & all_bits
+            minus = horizontal_plus & vertical & all_bits
+
+        return distance
+
+
+class ExternalMergeSort:
+    # Sorts a CSV archive that does not have to fit in memory. The file is
+    # parsed in chunks of about memory_limit bytes; each chunk is sorted and
+    # written to a temporary run file, and the runs are merged with a heap
+    # (heapq.merge), reading each run back one block at a time. When there are
+    # more runs than max_open_runs, they are merged in several passes. Sort
+    # attributes are given as for SortingAlgorithm.merge_sort, and the order
+    # is the same: stable, with ties in file order.
+    field_keys = {
+        "case_id": lambda fields: fields[0],
+        "date": lambda fields: fields[1],
+        "severity": lambda fields: fields[5],
+        "status": lambda fields: fields[6].lower(),
+    }
+    # Approximate bytes a parsed row takes in memory on top of its text:
+    # the field objects, the tuples around them and its sort key.
+    row_overhead = 600
+    max_open_runs = 64
+
+    def __init__(self, memory_limit=64 * 1024 * 1024, temp_dir=None):
+        if memory_limit < 1024 * 1024:
+            raise ValueError("The memory limit must be at least 1 MB.")
+        self.memory_limit = memory_limit
+        self.temp_dir = temp_dir
+        # Half the limit is shared by the blocks of the runs being merged.
+        self.block_rows = max(
+            1,
+            memory_limit
+            // (2 * ExternalMergeSort.max_open_runs * (ExternalMergeSort.row_overhead + 100)),
+        )
+
+    def row_key(sort_order):
+        # Keys are computed from the parsed fields. The row's position in the
+        # file comes last, which keeps the sort stable across runs.
+        getters = [
+            (
+                ExternalMergeSort.field_keys.get(
+                    attribute, ExternalMergeSort.field_keys["case_id"]
+                ),
+                descending,
+            )
+            for attribute, descending in sort_order
+        ]
+
+        def row_key(item):
+            sequence, fields = item
+            return tuple(
+                DescendingKey(get(fields)) if descending else get(fields)
+                for get, descending in getters
+            ) + (sequence,)
 
-                    suspect = Suspect(suspect_name)
-                    victim = Victim(victim_name)
+        return row_key
+
+    def iter_sorted(self, filepath, sort_attribute, reverse=False, interner=None):
+        # Yields the cases of the file in sorted order. The temporary files
+        # are removed once the iteration is finished or abandoned.
+        row_key = ExternalMergeSort.row_key(
+            SortingAlgorithm.sort_order(sort_attribute, reverse)
+        )
+        with tempfile.TemporaryDirectory(
+            prefix="case_sort_", dir=self.temp_dir
+        ) as directory:
+            runs = self.write_runs(filepath, directory, row_key)
+            instrumentation.count("external sort runs", len(runs))
 
-                    new_case = Case(
-                        case_id, date, suspect, victim, crime_type, severity, status
+            while len(runs) > ExternalMergeSort.max_open_runs:
+                merged_runs = []
+                for start in range(0, len(runs), ExternalMergeSort.max_open_runs):
+                    group = runs[start:start + ExternalMergeSort.max_open_runs]
+                    merged_runs.append(
+                        self.write_run(
+                            ExternalMergeSort.merge_runs(group, row_key),
+                            os.path.join(directory, f"run_{len(runs)}_{start}"),
+                        )
                     )
-                    self.case_list.append(new_case)
+                    for path in group:
+                        os.remove(path)
+                runs = merged_runs
+
+            for _, fields in ExternalMergeSort.merge_runs(runs, row_key):
+                yield CaseParser.build_case(fields, interner)
+
+    @instrumentation.timed("external_sort")
+    def write_sorted(self, filepath, output, sort_attribute, reverse=False):
+        # Writes the sorted cases to the text file object output in the
+        # columns of case_archive.csv and returns how many there were.
+        return CaseExporter().write_csv(
+            self.iter_sorted(filepath, sort_attribute, reverse), output
+        )
 
-            return True
+    def write_runs(self, filepath, directory, row_key):
+        runs = []
+        chunk = []
+        chunk_bytes = 0
+        date_cache = {}
+
+        def write_chunk():
+            chunk.sort(key=row_key)
+            return self.write_run(chunk, os.path.join(directory, f"run_{len(runs)}"))
+
+        try:
+            with open(filepath, "r", encoding="utf-8-sig", newline="") as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    return runs
+                positions = CaseParser.column_positions(header)
+
+                for sequence, row in enumerate(reader):
+                    if not row:
+                        continue
+
+                    fields = CaseParser.parse_fields(row, positions, date_cache)
+                    chunk.append((sequence, fields))
+                    chunk_bytes += ExternalMergeSort.row_overhead + sum(map(len, row))
+                    if chunk_bytes >= self.memory_limit:
+                        runs.append(write_chunk())
+                        chunk = []
+                        chunk_bytes = 0
+                        # The cache would otherwise end up holding every date.
+                        date_cache = {}
 
         except FileNotFoundError:
             raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
 
-        except Exception as e:
+        except (ValueError, csv.Error, UnicodeDecodeError) as e:
             raise ValueError(f"Error loading cases: {str(e)}")
 
-    def load_demo_cases(self):
-        demo_data = [
-            {
-                "CaseID": "84435",
-                "Date": "01/01/1983",
-                "CrimeType": "Arson",
-                "MainSuspect": "Jeffery Castillo",
-                "Victim": "Jennifer Long",
-                "CaseSeverity": "7",
-                "Status": "Unsolved",
-            },
-            {
-                "CaseID": "86458",
-                "Date": "02/02/1983",
-                "CrimeType": "Theft",
-                "MainSuspect": "Angela Ross",
-                "Victim": "James Wilkerson",
-                "CaseSeverity": "3",
-                "Status": "Solved",
-            },
-            {
-                "CaseID": "62068",
-                "Date": "03/03/1983",
-                "CrimeType": "Murder",
-                "MainSuspect": "Unknown",
-                "Victim": "Unknown",
-                "CaseSeverity": "10",
-                "Status": "Unsolved",
-            },
-            {
-                "CaseID": "49692",
-                "Date": "04/04/1983",
-                "CrimeType": "Theft",
-                "MainSuspect": "Jeremy Green",
-                "Victim": "Heidi Mckinney",
-                "CaseSeverity": "2",
-                "Status": "Solved",
-            },
-            {
-                "CaseID": "24397",
-                "Date": "05/05/1983",
-                "CrimeType": "Arson",
-                "MainSuspect": "Travis Rollins",
-                "Victim": "Christina Bartlett",
-                "CaseSeverity": "8",
-                "Status": "Unsolved",
-            },
-        ]
+        if chunk:
+            runs.append(write_chunk())
+        return runs
+
+    def write_run(self, items, path):
+        # A run is a sequence of pickled blocks of block_rows items each.
+        items = iter(items)
+        with open(path, "wb") as f:
+            while True:
+                block = list(islice(items, self.block_rows))
+                if not block:
+                    break
+                pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def read_run(path):
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    block = pickle.load(f)
+                except EOFError:
+                    return
+                yield from block
+
+    def merge_runs(runs, row_key):
+        return heapq.merge(
+            *(ExternalMergeSort.read_run(path) for path in runs), key=row_key
+        )
+
+
+# ------------------------ Loading Classes ------------------------
+
+class CaseParser:
+    columns = (
+        "CaseID",
+        "Date",
+        "CrimeType",
+        "MainSuspect",
+        "Victim",
+        "CaseSeverity",
+        "Status",
+    )
+
+    def column_positions(header):
+        try:
+            return tuple(header.index(column) for column in CaseParser.columns)
+        except ValueError:
+            raise ValueError(
+                "CSV is missing required fields. Please check that all fields are present."
+            )
+
+    def parse_date(date_string, date_cache=None):
+        if date_cache is not None:
+            date = date_cache.get(date_string)
+            if date is not None:
+                return date
+
+        # Fast path for the fixed DD/MM/YYYY layout, which is much cheaper than
+        # strptime. Anything else (e.g. single-digit days) falls back to strptime.
+        try:
+            if (
+                len(date_string) == 10
+                and date_string[2] == "/"
+                and date_string[5] == "/"
+                and date_string[:2].isdigit()
+                and date_string[3:5].isdigit()
+                and date_string[6:].isdigit()
+            ):
+                date = datetime(
+                    int(date_string[6:]), int(date_string[3:5]), int(date_string[:2])
+                )
+            else:
+                date = datetime.strptime(date_string, "%d/%m/%Y")
+        except ValueError:
+            raise ValueError("Date must be in the format DD/MM/YYYY.")
+
+        if date_cache is not None:
+            date_cache[date_string] = date
+        return date
+
+    def required_fields(row, positions):
+        # Returns the fields of one CSV row as strings, in the order of
+        # parse_fields, after checking that none of them is missing.
+        try:
+            fields = [row[position] for position in positions]
+        except IndexError:
+            fields = ()
+
+        if not fields or not all(fields):
+            raise ValueError(
+                "CSV is missing required fields. Please check that all fields are present."
+            )
+        return fields
+
+    def parse_fields(row, positions, date_cache=None):
+        # Validates one CSV row and returns its typed fields as a tuple:
+        # (case_id, date, crime_type, suspect_name, victim_name, severity, status)
+        (
+            case_id_string,
+            date_string,
+            crime_type,
+            suspect_name,
+            victim_name,
+            severity,
+            status,
+        ) = CaseParser.required_fields(row, positions)
+
+        date = CaseParser.parse_date(date_string, date_cache)
+
+        try:
+            case_id = int(case_id_string)
+        except ValueError:
+            raise ValueError("Case ID must be an integer.")
+
+        try:
+            severity = int(severity)
+        except ValueError:
+            raise ValueError("Severity must be an integer.")
+
+        return (case_id, date, crime_type, suspect_name, victim_name, severity, status)
+
+    def case_fields(case):
+        # The fields of a case in the order of parse_fields.
+        return (
+            case.case_id,
+            case.date,
+            case.crime_type,
+            case.suspect.name,
+            case.victim.name,
+            case.severity,
+            case.status,
+        )
+
+    def build_case(fields, interner=None):
+        case_id, date, crime_type, suspect_name, victim_name, severity, status = fields
+        if interner is not None:
+            return interner.build_case(
+                case_id, date, suspect_name, victim_name, crime_type, severity, status
+            )
+
+        return Case(
+            case_id,
+            date,
+            Suspect(suspect_name),
+            Victim(victim_name),
+            crime_type,
+            severity,
+            status,
+        )
+
+    def read_header(f, source):
+        # Reads the header line and records the identity of the open file in
+        # source, so that a later refresh can tell whether it is still reading
+        # the same file. Returns the column positions, or None for an empty file.
+        stat = os.fstat(f.fileno())
+        header_line = f.readline()
+        source.update(
+            device=stat.st_dev,
+            inode=stat.st_ino,
+            size=stat.st_size,
+            header=header_line,
+            data_start=f.tell(),
+            positions=None,
+            offset=f.tell(),
+            fingerprint=b"",
+        )
+        if not header_line:
+            return None
+
+        header = next(csv.reader([header_line.decode("utf-8-sig")]), None)
+        source["positions"] = CaseParser.column_positions(header or [])
+        return source["positions"]
+
+    def read_fingerprint(f, source):
+        # The bytes just before the offset that has been read up to. If they
+        # change, the file was rewritten rather than appended to.
+        start = max(source["data_start"], source["offset"] - 64)
+        f.seek(start)
+        return f.read(source["offset"] - start)
+
+    def file_lines(f, source, end, complete_only=False, copy=None):
+        # Decoded lines of a binary file from its current position, stopping
+        # at byte offset end so that rows appended while the file is read are
+        # left for the next refresh. source["offset"] follows the lines read.
+        # With complete_only, a last line without a line break is taken to be
+        # still being written, and is left for the next refresh as well.
+        # Each line read is also written to copy, if given.
+        offset = source["offset"]
+        for line in f:
+            if offset >= end or (complete_only and not line.endswith(b"\n")):
+                break
+            offset += len(line)
+            source["offset"] = offset
+            if copy is not None:
+                copy.write(line)
+            yield line.decode("utf-8")
+
+    def split_byte_ranges(filepath, chunk_count, source=None):
+        # Splits the data rows of the CSV into roughly equal byte ranges that
+        # start and end on line boundaries. Returns the column positions from
+        # the header together with the list of (start, end) offsets.
+        # Rows are assumed to be one line each (no quoted line breaks).
+        if source is None:
+            source = {}
+
+        with open(filepath, "rb") as f:
+            positions = CaseParser.read_header(f, source)
+            if positions is None:
+                return None, []
+
+            data_start = source["data_start"]
+            file_size = source["size"]
+            source["offset"] = file_size
+            source["fingerprint"] = CaseParser.read_fingerprint(f, source)
+            chunk_size = max(1, (file_size - data_start) // max(1, chunk_count))
+
+            boundaries = [data_start]
+            target = data_start + chunk_size
+            while target < file_size:
+                # Step back one byte so a target that already sits at the start
+                # of a line is kept, then move forward to the next line start.
+                f.seek(target - 1)
+                f.readline()
+                boundary = f.tell()
+                if boundary >= file_size:
+                    break
+                if boundary > boundaries[-1]:
+                    boundaries.append(boundary)
+                target = max(boundary, target) + chunk_size
+            boundaries.append(file_size)
+
+        return positions, list(zip(boundaries[:-1], boundaries[1:]))
+
+    def parse_byte_range(filepath, start, end, positions):
+        # Runs in a worker process: parses the rows between two line-aligned
+        # offsets and returns their validated fields.
+        with open(filepath, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start)
+
+        date_cache = {}
+        rows = []
+        for row in csv.reader(io.StringIO(data.decode("utf-8"), newline="")):
+            if not row:
+                continue
+            rows.append(CaseParser.parse_fields(row, positions, date_cache))
+        return rows
+
+    def iter_case_batches(filepath, batch_size=10000, interner=None, source=None):
+        # Yields lists of at most batch_size cases while the file is being read,
+        # so the whole CSV never has to be held in memory at once. The file is
+        # read up to the size it had when it was opened. If a source dict is
+        # given, it ends up describing the file and how far it was read, for
+        # read_appended_cases.
+        date_cache = {}
+        if source is None:
+            source = {}
+
+        with open(filepath, "rb") as f:
+            positions = CaseParser.read_header(f, source)
+            if positions is None:
+                return
+
+            reader = csv.reader(CaseParser.file_lines(f, source, source["size"]))
+            batch = []
+            for row in reader:
+                if not row:
+                    continue
+
+                fields = CaseParser.parse_fields(row, positions, date_cache)
+                batch.append(CaseParser.build_case(fields, interner))
+
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            source["fingerprint"] = CaseParser.read_fingerprint(f, source)
+
+        if batch:
+            yield batch
+
+    def iter_row_batches(filepath, batch_size=10000, source=None, copy=None):
+        # As iter_case_batches, but yields (offset, row) pairs instead of
+        # cases, where offset is the byte offset the row starts at and row is
+        # the CSV row as read. Rows are validated with parse_fields, so that a
+        # malformed row fails the load rather than later queries, but their
+        # typed fields are not kept. The bytes read are written to the binary
+        # file copy, if given, at the same offsets.
+        if source is None:
+            source = {}
+
+        with open(filepath, "rb") as f:
+            positions = CaseParser.read_header(f, source)
+            if positions is None:
+                return
+
+            if copy is not None:
+                copy.seek(0)
+                copy.write(source["header"])
+            reader = csv.reader(
+                CaseParser.file_lines(f, source, source["size"], copy=copy)
+            )
+            batch = []
+            offset = source["offset"]
+            date_cache = {}
+            for row in reader:
+                if row:
+                    CaseParser.parse_fields(row, positions, date_cache)
+                    batch.append((offset, row))
+                offset = source["offset"]
+
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            source["fingerprint"] = CaseParser.read_fingerprint(f, source)
+
+        if batch:
+            yield batch
+
+    def is_source_file(f, source):
+        # Whether the open file is still the file source describes, read up to
+        # source["offset"] and possibly appended to since. It is not if it is
+        # a different file under the same name (e.g. after log rotation), or
+        # the same file truncated or rewritten up to that offset.
+        stat = os.fstat(f.fileno())
+        return (
+            bool(source.get("positions"))
+            and stat.st_dev == source["device"]
+            and stat.st_ino == source["inode"]
+            and stat.st_size >= source["offset"]
+            and f.readline() == source["header"]
+            and CaseParser.read_fingerprint(f, source) == source["fingerprint"]
+        )
+
+    def read_appended_cases(filepath, source, interner=None):
+        # Parses the rows appended to the file since it was read into source.
+        # Returns the new cases and an updated source, or None if the file is
+        # not the one source describes any more (see is_source_file).
+        with open(filepath, "rb") as f:
+            if not CaseParser.is_source_file(f, source):
+                return None
+
+            source = dict(source, size=os.fstat(f.fileno()).st_size)
+            f.seek(source["offset"])
+            date_cache = {}
+            cases = []
+            lines = CaseParser.file_lines(f, source, source["size"], complete_only=True)
+            for row in csv.reader(lines):
+                if not row:
+                    continue
+
+                fields = CaseParser.parse_fields(row, source["positions"], date_cache)
+                cases.append(CaseParser.build_case(fields, interner))
+
+            source["fingerprint"] = CaseParser.read_fingerprint(f, source)
+
+        return cases, source
+
+    def read_appended_rows(filepath, source, copy=None):
+        # As read_appended_cases, but returns (offset, row) pairs as
+        # iter_row_batches yields them, and writes the bytes read to copy.
+        with open(filepath, "rb") as f:
+            if not CaseParser.is_source_file(f, source):
+                return None
+
+            source = dict(source, size=os.fstat(f.fileno()).st_size)
+            f.seek(source["offset"])
+            if copy is not None:
+                copy.seek(source["offset"])
+            rows = []
+            offset = source["offset"]
+            date_cache = {}
+            lines = CaseParser.file_lines(
+                f, source, source["size"], complete_only=True, copy=copy
+            )
+            for row in csv.reader(lines):
+                if row:
+                    CaseParser.parse_fields(row, source["positions"], date_cache)
+                    rows.append((offset, row))
+                offset = source["offset"]
+
+            source["fingerprint"] = CaseParser.read_fingerprint(f, source)
+
+        return rows, source
+
+    def iter_parallel_case_batches(filepath, workers, interner=None, source=None):
+        # Parses line-aligned byte ranges of the file in a process pool and
+        # yields the cases of each range as one batch, in file order.
+        positions, byte_ranges = CaseParser.split_byte_ranges(
+            filepath, workers * 4, source
+        )
+        if not byte_ranges:
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for rows in executor.map(
+                CaseParser.parse_byte_range,
+                repeat(filepath),
+                [start for start, _ in byte_ranges],
+                [end for _, end in byte_ranges],
+                repeat(positions),
+            ):
+                yield [CaseParser.build_case(fields, interner) for fields in rows]
+
+    def encode_source(source):
+        # A source dict as JSON text, for storing it next to the cases.
+        if not source:
+            return None
+        encoded = dict(source)
+        encoded["header"] = source["header"].hex()
+        encoded["fingerprint"] = source["fingerprint"].hex()
+        return json.dumps(encoded)
+
+    def decode_source(text):
+        if not text:
+            return None
+        source = json.loads(text)
+        source["header"] = bytes.fromhex(source["header"])
+        source["fingerprint"] = bytes.fromhex(source["fingerprint"])
+        if source["positions"] is not None:
+            source["positions"] = tuple(source["positions"])
+        return source
+
+
+class CaseSnapshot:
+    # Binary snapshot of an archive: a fixed header, seven fixed-width columns
+    # (one value per case) and a string table shared by names, crime types and
+    # statuses. All numbers are little-endian. Each column is padded to a
+    # multiple of 8 bytes, so every column starts aligned for its format.
+    # Version 2 widened severities to 64 bits.
+    magic = b"MDAS"
+    version = 2
+    header_format = "<4sHHQqqII4x"  # padded to 48 bytes to keep columns aligned
+    header_size = struct.calcsize(header_format)
+    column_formats = ("q", "i", "q", "I", "I", "I", "I")
+
+    def source_signature(source_path):
+        if source_path is None:
+            return 0, 0
+        stat = os.stat(source_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def column_size(row_count, column_format):
+        size = row_count * array(column_format).itemsize
+        return size + -size % 8
+
+    def save(case_list, path, source_path=None):
+        writer = CaseSnapshotWriter()
+        for case in case_list:
+            writer.append(case)
+        return writer.save(path, source_path)
+
+    def read_header(mapped):
+        if len(mapped) < CaseSnapshot.header_size:
+            raise ValueError("Snapshot file is truncated.")
+
+        (
+            magic,
+            version,
+            _,
+            row_count,
+            source_size,
+            source_mtime_ns,
+            string_count,
+            checksum,
+        ) = struct.unpack_from(CaseSnapshot.header_format, mapped)
+        if magic != CaseSnapshot.magic:
+            raise ValueError("File is not a case archive snapshot.")
+        if version != CaseSnapshot.version:
+            raise ValueError(f"Unsupported snapshot version: {version}.")
+
+        return row_count, source_size, source_mtime_ns, string_count, checksum
+
+    def is_current(path, source_path):
+        # A snapshot is current if it was written from the source file as it is
+        # now, i.e. the CSV has not been modified since.
+        try:
+            with open(path, "rb") as f:
+                header = f.read(CaseSnapshot.header_size)
+            _, source_size, source_mtime_ns, _, _ = CaseSnapshot.read_header(header)
+            return (source_size, source_mtime_ns) == CaseSnapshot.source_signature(
+                source_path
+            )
+        except (OSError, ValueError):
+            return False
+
+    def load(path, source_path=None, verify_checksum=True, interner=None):
+        # Maps the snapshot and returns its rows as a SnapshotCaseList. The
+        # columns stay in the mapped file and cases are built as they are read.
+        if source_path is not None and not CaseSnapshot.is_current(path, source_path):
+            raise ValueError(f"Snapshot {path} is older than its source {source_path}.")
+
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return SnapshotCaseList(mapped, verify_checksum, interner or CaseInterner())
+
+    def read_columns(view):
+        # Returns the checksum, the columns as views of the file and the string
+        # table.
+        row_count, _, _, string_count, checksum = CaseSnapshot.read_header(view)
+        offset = CaseSnapshot.header_size
+
+        columns_size = sum(
+            CaseSnapshot.column_size(row_count, column_format)
+            for column_format in CaseSnapshot.column_formats
+        )
+        if len(view) < offset + columns_size + (string_count + 1) * 8:
+            raise ValueError("Snapshot file is truncated.")
+
+        columns = []
+        for column_format in CaseSnapshot.column_formats:
+            column_size = row_count * array(column_format).itemsize
+            columns.append(view[offset:offset + column_size].cast(column_format))
+            offset += CaseSnapshot.column_size(row_count, column_format)
+
+        offsets_size = (string_count + 1) * 8
+        with view[offset:offset + offsets_size] as raw:
+            with raw.cast("Q") as offsets_column:
+                string_offsets = offsets_column.tolist()
+        offset += offsets_size
+
+        with view[offset:] as blob:
+            if len(blob) != string_offsets[-1]:
+                raise ValueError("Snapshot file is truncated.")
+            strings = [
+                str(blob[string_offsets[index]:string_offsets[index + 1]], "utf-8")
+                for index in range(string_count)
+            ]
+
+        return checksum, columns, strings
+
+
+class CaseSnapshotWriter:
+    # Collects the columns of a CaseSnapshot one case at a time, so a
+    # snapshot can be written from a stream of cases without keeping the
+    # cases: each row only takes its fixed-width column values, and each
+    # distinct string is stored once.
+    def __init__(self):
+        self.strings = {}
+        self.columns = [
+            array(column_format) for column_format in CaseSnapshot.column_formats
+        ]
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def string_index(self, value):
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        return index
+
+    def append(self, case):
+        case_ids, dates, severities, suspects, victims, crime_types, statuses = (
+            self.columns
+        )
+        if not (-2**63 <= case.case_id < 2**63 and -2**63 <= case.severity < 2**63):
+            raise ValueError(
+                f"Case {case.case_id} does not fit in a snapshot: case IDs and "
+                "severities must be 64-bit integers."
+            )
+        case_ids.append(case.case_id)
+        dates.append(case.date.toordinal())
+        severities.append(case.severity)
+        suspects.append(self.string_index(case.suspect.name))
+        victims.append(self.string_index(case.victim.name))
+        crime_types.append(self.string_index(case.crime_type))
+        statuses.append(self.string_index(case.status))
+
+    def save(self, path, source_path=None):
+        if sys.byteorder != "little":
+            raise ValueError("Snapshots can only be written on little-endian machines.")
+
+        encoded_strings = [value.encode("utf-8") for value in self.strings]
+        string_offsets = array("Q", [0])
+        for encoded in encoded_strings:
+            string_offsets.append(string_offsets[-1] + len(encoded))
+
+        body = []
+        for column in self.columns:
+            body.append(column.tobytes())
+            body.append(bytes(-len(body[-1]) % 8))
+        body.append(string_offsets.tobytes())
+        body.append(b"".join(encoded_strings))
+
+        checksum = 0
+        for part in body:
+            checksum = zlib.crc32(part, checksum)
+
+        source_size, source_mtime_ns = CaseSnapshot.source_signature(source_path)
+        header = struct.pack(
+            CaseSnapshot.header_format,
+            CaseSnapshot.magic,
+            CaseSnapshot.version,
+            0,
+            len(self),
+            source_size,
+            source_mtime_ns,
+            len(self.strings),
+            checksum,
+        )
+
+        # Write to a temporary file first so a crash never leaves a truncated
+        # snapshot behind.
+        temporary_path = f"{path}.tmp"
+        try:
+            with open(temporary_path, "wb") as f:
+                f.write(header)
+                for part in body:
+                    f.write(part)
+            os.replace(temporary_path, path)
+        finally:
+            # Only left behind if writing or replacing failed.
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return len(self)
+
+
+class SnapshotCaseList:
+    # The rows of a loaded snapshot, read from its memory-mapped columns. As
+    # in a LazyCaseList, a row's Case is built each time the row is read, so
+    # loading a snapshot neither copies the columns nor builds the cases; the
+    # archive indexes the rows straight from the columns (rows). Cases added
+    # after the load are kept as objects.
+    def __init__(self, mapped, verify_checksum, interner):
+        self.mapped = mapped
+        view = memoryview(mapped)
+        checksum, self.columns, strings = CaseSnapshot.read_columns(view)
+        if verify_checksum:
+            with view[CaseSnapshot.header_size:] as body:
+                if zlib.crc32(body) != checksum:
+                    raise ValueError("Snapshot checksum does not match its contents.")
+
+        self.strings = [interner.string(value) for value in strings]
+        self.row_count = len(self.columns[0])
+        self.objects = []
+        self.interner = interner
+        self.dates = {}
+
+    def __len__(self):
+        return self.row_count + len(self.objects)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyCases(self, range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        return self.case(index)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.case(row)
+
+    def append(self, case):
+        self.objects.append(case)
+
+    def date(self, ordinal):
+        date = self.dates.get(ordinal)
+        if date is None:
+            date = self.dates[ordinal] = self.interner.date(datetime.fromordinal(ordinal))
+        return date
+
+    def case(self, row):
+        if row >= self.row_count:
+            return self.objects[row - self.row_count]
+
+        case_ids, dates, severities, suspects, victims, crime_types, statuses = (
+            self.columns
+        )
+        strings = self.strings
+        return self.interner.build_case(
+            case_ids[row],
+            self.date(dates[row]),
+            strings[suspects[row]],
+            strings[victims[row]],
+            strings[crime_types[row]],
+            severities[row],
+            strings[statuses[row]],
+        )
+
+    def fields(self):
+        # The fields of each row in the order of CaseParser.parse_fields. Mapped
+        # rows are read from the columns without building their cases.
+        strings = self.strings
+        date = self.date
+        for (
+            case_id,
+            ordinal,
+            severity,
+            suspect_index,
+            victim_index,
+            crime_type_index,
+            status_index,
+        ) in zip(*self.columns):
+            yield (
+                case_id,
+                date(ordinal),
+                strings[crime_type_index],
+                strings[suspect_index],
+                strings[victim_index],
+                severity,
+                strings[status_index],
+            )
+        for case in self.objects:
+            yield CaseParser.case_fields(case)
+
+
+# ------------------------ Case Archive Classes ------------------------
+
+class ColumnarCaseStore:
+    # Holds the filterable fields of the archive as NumPy columns. Row numbers
+    # match positions in CaseArchive.case_list. Crime types and statuses are
+    # dictionary-encoded: each distinct value gets a small integer code.
+    #
+    # The column arrays have room for more rows than they hold; only the
+    # first length entries are rows. When they fill up they are replaced by
+    # arrays of twice the size, so adding rows costs O(1) per row on average.
+    columns = (
+        ("case_ids", "int64"),
+        ("severities", "int64"),
+        ("dates", "datetime64[D]"),
+        ("crime_type_codes", "int32"),
+        ("status_codes", "int32"),
+    )
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("NumPy is required for the columnar case store.")
+
+        for name, dtype in ColumnarCaseStore.columns:
+            setattr(self, name, np.empty(0, dtype=dtype))
+        self.length = 0
+
+        self.crime_type_dictionary = {}
+        self.status_dictionary = {}
+
+        # New rows are collected in lists and moved into the arrays in one go
+        # before the next query, so appending a case never copies a column.
+        self.pending_rows = []
+
+    def encode(dictionary, value):
+        code = dictionary.get(value)
+        if code is None:
+            code = len(dictionary)
+            dictionary[value] = code
+        return code
+
+    def append(self, case):
+        self.pending_rows.append(
+            (
+                case.case_id,
+                case.severity,
+                case.date,
+                ColumnarCaseStore.encode(self.crime_type_dictionary, case.crime_type),
+                ColumnarCaseStore.encode(self.status_dictionary, case.status),
+            )
+        )
+
+    def append_fields(self, fields):
+        # As append, for fields in the order of CaseParser.parse_fields.
+        case_id, date, crime_type, _, _, severity, status = fields
+        self.pending_rows.append(
+            (
+                case_id,
+                severity,
+                date,
+                ColumnarCaseStore.encode(self.crime_type_dictionary, crime_type),
+                ColumnarCaseStore.encode(self.status_dictionary, status),
+            )
+        )
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+
+        length = self.length + len(self.pending_rows)
+        capacity = len(self.case_ids)
+        if length > capacity:
+            capacity = max(length, 2 * capacity)
+        for (name, dtype), values in zip(
+            ColumnarCaseStore.columns, zip(*self.pending_rows)
+        ):
+            column = getattr(self, name)
+            if len(column) < capacity:
+                # Frozen copies keep the old array. Rows are only ever written
+                # past the length of the copies sharing an array.
+                grown = np.empty(capacity, dtype=dtype)
+                grown[:self.length] = column[:self.length]
+                column = grown
+                setattr(self, name, column)
+            column[self.length:length] = np.array(values, dtype=dtype)
+        self.length = length
+        self.pending_rows = []
+
+    def filter_rows(self, crime_type, severity, status):
+        self.flush()
+        length = self.length
+        mask = np.ones(length, dtype=bool)
+
+        if crime_type is not None:
+            code = self.crime_type_dictionary.get(crime_type)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.crime_type_codes[:length] == code
+
+        if severity is not None:
+            mask &= self.severities[:length] == severity
+
+        if status is not None:
+            code = self.status_dictionary.get(status)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.status_codes[:length] == code
+
+        return np.flatnonzero(mask)
+
+    def freeze(self):
+        # A shallow copy keeps its own length, and the arrays are only written
+        # past it, so it is a stable view. The dictionaries only ever gain
+        # codes, which a view simply never finds in its columns.
+        self.flush()
+        frozen = copy.copy(self)
+        frozen.pending_rows = []
+        return frozen
+
+
+class BitmapIndex:
+    # One bitmap per distinct value of a column, in which bit n is set when
+    # row n has that value. Each bitmap is kept as a list of Python ints of
+    # segment_rows bits each, so adding rows only rebuilds the last segments
+    # instead of the whole bitmap. Rows added since the last freeze are
+    # collected in lists and merged into the segments in one pass.
+    segment_rows = 1 << 16
+
+    def __init__(self):
+        self.bitmaps = {}
+        self.pending_rows = {}
+
+    def add(self, value, row):
+        rows = self.pending_rows.get(value)
+        if rows is None:
+            rows = self.pending_rows[value] = []
+        rows.append(row)
+
+    def add_rows(self, value, rows):
+        # As add for each of rows, which are in ascending order and follow the
+        # rows already added.
+        pending = self.pending_rows.get(value)
+        if pending is None:
+            self.pending_rows[value] = list(rows)
+        else:
+            pending.extend(rows)
+
+    def flush(self):
+        if not self.pending_rows:
+            return
+
+        # The merged segments go into new lists in a new dict, so frozen
+        # copies keep the bitmaps they were made with. Copying a list only
+        # copies one reference per segment.
+        segment_rows = BitmapIndex.segment_rows
+        bitmaps = dict(self.bitmaps)
+        for value, rows in self.pending_rows.items():
+            segments = list(bitmaps.get(value, ()))
+            last_segment = rows[-1] // segment_rows
+            segments.extend([0] * (last_segment + 1 - len(segments)))
+
+            start = 0
+            while start < len(rows):
+                segment = rows[start] // segment_rows
+                first_row = segment * segment_rows
+                end = bisect_left(rows, first_row + segment_rows, start)
+                bits = bytearray((rows[end - 1] - first_row) // 8 + 1)
+                for row in rows[start:end]:
+                    row -= first_row
+                    bits[row >> 3] |= 1 << (row & 7)
+                segments[segment] |= int.from_bytes(bits, "little")
+                start = end
+            bitmaps[value] = segments
+        self.bitmaps = bitmaps
+        self.pending_rows = {}
+
+    def freeze(self):
+        self.flush()
+        frozen = BitmapIndex()
+        frozen.bitmaps = self.bitmaps
+        return frozen
+
+    def get(self, value):
+        # The segments joined into one int, so queries can combine bitmaps
+        # with & and read them with rows().
+        segments = self.bitmaps.get(value)
+        if not segments:
+            return 0
+        segment_bytes = BitmapIndex.segment_rows // 8
+        return int.from_bytes(
+            b"".join(segment.to_bytes(segment_bytes, "little") for segment in segments),
+            "little",
+        )
+
+    def values(self):
+        return list(self.bitmaps)
+
+    def footprint(self, size_of):
+        # Bytes held by the segments and the pending row lists, for
+        # CaseArchive.count_footprint (size_of counts shared objects once).
+        size = size_of(self.bitmaps) + size_of(self.pending_rows)
+        for segments in self.bitmaps.values():
+            size += size_of(segments) + sum(size_of(segment) for segment in segments)
+        for rows in self.pending_rows.values():
+            size += size_of(rows) + sum(size_of(row) for row in rows)
+        return size
+
+    def rows(bitmap):
+        # Yields the set bits in ascending order. The binary string is reversed
+        # so that string positions equal row numbers, and str.find skips over
+        # runs of unset bits without a Python-level loop.
+        bits = bin(bitmap)[:1:-1]
+        row = bits.find("1")
+        while row != -1:
+            yield row
+            row = bits.find("1", row + 1)
+
+
+class SortedIndex:
+    # Keys of one column in ascending order, next to the row each key belongs
+    # to. Keys that arrive in order are appended to the main run directly.
+    # Out-of-order keys wait in a pending list, and each freeze sorts only
+    # them into a new run. A run is merged into the run before it (or into
+    # the main run) once it has grown to a quarter of that run's size, so
+    # every run is at most a quarter of the one before it, there are
+    # O(log n) runs, and each key takes part in O(log n) merges in all.
+    #
+    # Range queries run on frozen copies, which only look at the first size
+    # entries of the main run, so the main lists can keep growing underneath
+    # them. The other runs are never changed once they are built.
+    merge_fraction = 4
+
+    def __init__(self):
+        self.keys = []
+        self.rows = []
+        self.size = 0
+        self.runs = []
+        self.pending = []
+
+    def add(self, key, row):
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.rows.append(row)
+        else:
+            self.pending.append((key, row))
+
+    def add_entries(self, entries):
+        # Adds (key, row) pairs in any order. They are sorted in one go at the
+        # next freeze, as out-of-order keys are.
+        self.pending.extend(entries)
+
+    def merge_runs(first_keys, first_rows, entries):
+        # Both inputs are sorted, so sorted() only has to merge two runs.
+        entries = sorted(list(zip(first_keys, first_rows)) + entries)
+        instrumentation.count("sorted index merges")
+        return entries
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        entries = sorted(self.pending)
+        instrumentation.count("sorted index sorts")
+        self.pending = []
+
+        # The run list is replaced rather than changed, so frozen copies keep
+        # the runs they were made with.
+        runs = list(self.runs)
+        while runs and len(entries) * SortedIndex.merge_fraction >= len(runs[-1][0]):
+            keys, rows = runs.pop()
+            entries = SortedIndex.merge_runs(keys, rows, entries)
+
+        if len(entries) * SortedIndex.merge_fraction >= len(self.keys):
+            entries = SortedIndex.merge_runs(self.keys, self.rows, entries)
+            self.keys = [key for key, _ in entries]
+            self.rows = [row for _, row in entries]
+        else:
+            runs.append(([key for key, _ in entries], [row for _, row in entries]))
+        self.runs = runs
+
+    def freeze(self):
+        self.flush()
+        frozen = SortedIndex()
+        frozen.keys = self.keys
+        frozen.rows = self.rows
+        frozen.size = len(self.keys)
+        frozen.runs = self.runs
+        return frozen
+
+    def footprint(self, size_of):
+        # Bytes held by the runs' key and row lists and the keys and rows in
+        # them, for CaseArchive.count_footprint.
+        size = size_of(self.runs) + size_of(self.pending)
+        for keys, rows in [(self.keys, self.rows)] + self.runs:
+            size += size_of(keys) + sum(size_of(key) for key in keys)
+            size += size_of(rows) + sum(size_of(row) for row in rows)
+        for entry in self.pending:
+            size += size_of(entry) + size_of(entry[0]) + size_of(entry[1])
+        return size
+
+    def range_bounds(keys, size, low, high):
+        # Both bounds are inclusive; None leaves that side open. A bisection
+        # over size keys makes at most size.bit_length() comparisons, which is
+        # what the search comparisons counter is given.
+        start = 0
+        end = size
+        if low is not None:
+            start = bisect_left(keys, low, 0, size)
+            instrumentation.count("search comparisons", size.bit_length())
+        if high is not None:
+            end = bisect_right(keys, high, 0, size)
+            instrumentation.count("search comparisons", size.bit_length())
+        return start, max(start, end)
+
+    def all_runs(self):
+        # The main run, cut off at size, followed by the smaller runs.
+        runs = [(self.keys, self.rows, self.size)]
+        runs.extend((keys, rows, len(keys)) for keys, rows in self.runs)
+        return runs
+
+    def range_count(self, low=None, high=None):
+        count = 0
+        for keys, _, size in self.all_runs():
+            start, end = SortedIndex.range_bounds(keys, size, low, high)
+            count += end - start
+        return count
+
+    def range_rows(self, low=None, high=None):
+        # The rows of all runs, each run in key order.
+        rows = []
+        for keys, run_rows, size in self.all_runs():
+            start, end = SortedIndex.range_bounds(keys, size, low, high)
+            rows.extend(run_rows[start:end])
+        return rows
+
+
+class NameIndex:
+    # Index over distinct (normalized) names: a sorted array of word suffixes
+    # for prefix lookups and an index of word deletions for fuzzy lookups.
+    # Each name is added once, when it is first seen, and is referred to by
+    # its position in names.
+    #
+    # The suffix array has one entry for each word of a name, standing for
+    # the name from that word on, so "CASTIL" finds "JEFFERY CASTILLO" as
+    # well. An entry packs the name's position and the word's offset into one
+    # int, so the suffixes are never stored as strings.
+    #
+    # Fuzzy lookups match names word by word. Every distinct word is stored
+    # once, under each string that up to word_edits deleted characters leave
+    # of its first word_prefix characters: the prefixes of two words within
+    # word_edits edits of each other always leave a string in common (a
+    # substitution is a deletion from both), so the words similar to a query
+    # word are found among those stored under its own prefix's deletions.
+    # Only deleting from the prefix keeps the number of entries per word
+    # bounded. An entry packs the CRC-32 of the deletion, the number of
+    # characters deleted and the word's id into one int. The words within d
+    # edits of a query word need at most d deletions as well, so a lookup
+    # skips the entries with more.
+    #
+    # New entries of both kinds wait in pending lists and are sorted into
+    # runs on freeze, merged the way SortedIndex merges its runs, and a
+    # lookup bisects every run. Frozen copies share names, positions and
+    # words with the live index. These only grow, so a frozen copy ignores
+    # positions from name_count on. The runs are never changed once they
+    # are built.
+    offset_bits = 16
+    offset_mask = (1 << offset_bits) - 1
+    key_bits = 32
+    word_bits = 30
+    word_mask = (1 << word_bits) - 1
+    word_edits = 2
+    word_prefix = 12
+
+    def __init__(self):
+        self.names = []
+        self.name_count = 0
+        self.positions = {}
+        self.runs = []
+        self.pending = []
+        self.words = []
+        self.word_ids = {}
+        self.deletion_runs = []
+        self.deletion_directories = []
+        self.pending_deletions = []
+
+    def suffix(self, entry):
+        return self.names[entry >> NameIndex.offset_bits][entry & NameIndex.offset_mask:]
+
+    def ranked_suffix(self, entry):
+        # The order of the suffix array: by suffix, then by name, so that
+        # entries with the same suffix do not depend on the order names were
+        # added in.
+        name = self.names[entry >> NameIndex.offset_bits]
+        return name[entry & NameIndex.offset_mask:], name
+
+    def deletions(word, count):
+        # Every string left of word by deleting at most count characters,
+        # with the fewest deletions that leave it.
+        strings = {word: 0}
+        previous = {word}
+        for deleted in range(1, count + 1):
+            previous = {s[:i] + s[i + 1:] for s in previous for i in range(len(s))}
+            for string in previous:
+                strings.setdefault(string, deleted)
+        return strings
+
+    def deletion_key(deletion):
+        return zlib.crc32(deletion.encode("utf-8")) << NameIndex.key_bits
+
+    def add(self, name):
+        position = len(self.names)
+        self.names.append(name)
+        self.positions[name] = position
+
+        offset = 0
+        for word in name.split(" "):
+            if offset <= NameIndex.offset_mask:
+                self.pending.append(position << NameIndex.offset_bits | offset)
+            offset += len(word) + 1
+
+            if word not in self.word_ids:
+                word_id = self.word_ids[word] = len(self.words)
+                self.words.append(word)
+                prefix = word[:NameIndex.word_prefix]
+                for deletion, deleted in NameIndex.deletions(prefix, NameIndex.word_edits).items():
+                    self.pending_deletions.append(
+                        NameIndex.deletion_key(deletion) | deleted << NameIndex.word_bits | word_id
+                    )
+
+        self.name_count = len(self.names)
+
+    def merged_runs(runs, entries, key=None):
+        # The run list is replaced rather than changed, so frozen copies keep
+        # the runs they were made with.
+        entries = sorted(entries, key=key)
+        runs = list(runs)
+        while runs and len(entries) * SortedIndex.merge_fraction >= len(runs[-1]):
+            entries = sorted(runs.pop().tolist() + entries, key=key)
+        runs.append(array("Q", entries))
+        return runs
+
+    def run_directory(run):
+        # (shift, directory): where the entries starting with each value of
+        # the top bits of a run start, about one slot for every 16 entries,
+        # so a lookup only bisects the entries between two slots.
+        bits = max(0, len(run).bit_length() - 4)
+        shift = 64 - bits
+        return shift, array("I", (bisect_left(run, slot << shift) for slot in range((1 << bits) + 1)))
+
+    def flush(self):
+        if self.pending:
+            self.runs = NameIndex.merged_runs(self.runs, self.pending, self.ranked_suffix)
+            self.pending = []
+        if self.pending_deletions:
+            runs = NameIndex.merged_runs(self.deletion_runs, self.pending_deletions)
+            self.deletion_directories = self.deletion_directories[:len(runs) - 1] + [
+                NameIndex.run_directory(runs[-1])
+            ]
+            self.deletion_runs = runs
+            self.pending_deletions = []
+
+    def freeze(self):
+        self.flush()
+        frozen = copy.copy(self)
+        frozen.pending = []
+        frozen.pending_deletions = []
+        return frozen
+
+    def footprint(self, size_of):
+        # Bytes held by the names, words and runs, for
+        # CaseArchive.count_footprint.
+        size = size_of(self.names) + sum(size_of(name) for name in self.names)
+        size += size_of(self.positions) + sum(size_of(position) for position in self.positions.values())
+        size += size_of(self.words) + sum(size_of(word) for word in self.words)
+        size += size_of(self.word_ids) + sum(size_of(word_id) for word_id in self.word_ids.values())
+        size += size_of(self.runs) + sum(size_of(run) for run in self.runs)
+        size += size_of(self.deletion_runs) + sum(size_of(run) for run in self.deletion_runs)
+        size += size_of(self.deletion_directories)
+        size += sum(size_of(directory) for _, directory in self.deletion_directories)
+        for pending in (self.pending, self.pending_deletions):
+            size += size_of(pending) + sum(size_of(entry) for entry in pending)
+        return size
+
+    def first_suffix_at_least(self, run, prefix):
+        low = 0
+        high = len(run)
+        while low < high:
+            middle = (low + high) // 2
+            if self.suffix(run[middle]) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def prefix_block(self, run, prefix):
+        # The entries of one run whose suffix starts with prefix, in order.
+        for i in range(self.first_suffix_at_least(run, prefix), len(run)):
+            entry = run[i]
+            if not self.suffix(entry).startswith(prefix):
+                return
+            yield entry
+
+    def prefix_matches(self, prefix, limit=10):
+        # The first limit names ranked by their first matching suffix, then
+        # by name, merged across the runs and returned in alphabetical order.
+        # A name's rank depends only on the name and the prefix, so any index
+        # holding it ranks it the same (see SQLiteCaseArchive.search_names).
+        matches = set()
+        blocks = [self.prefix_block(run, prefix) for run in self.runs]
+        for entry in heapq.merge(*blocks, key=self.ranked_suffix):
+            if len(matches) >= limit:
+                break
+            matches.add(self.names[entry >> NameIndex.offset_bits])
+
+        return sorted(matches)
+
+    def word_candidates(self, word, max_distance):
+        # The indexed words stored under a deletion of word and of a length
+        # at most max_distance away from its own. Sharing a deletion only
+        # means being within twice max_distance edits (or sharing a CRC-32
+        # by chance), so candidates still have to be checked.
+        word_ids = set()
+        for deletion in NameIndex.deletions(word[:NameIndex.word_prefix], max_distance):
+            key = NameIndex.deletion_key(deletion)
+            end = key | (max_distance + 1) << NameIndex.word_bits
+            for run, (shift, directory) in zip(self.deletion_runs, self.deletion_directories):
+                slot = key >> shift
+                i = bisect_left(run, key, directory[slot], directory[slot + 1])
+                while i < len(run) and run[i] < end:
+                    word_ids.add(run[i] & NameIndex.word_mask)
+                    i += 1
+
+        candidates = []
+        for word_id in word_ids:
+            candidate = self.words[word_id]
+            if abs(len(candidate) - len(word)) <= max_distance:
+                candidates.append(candidate)
+        return candidates
+
+    def similar_words(word, candidates, max_distance):
+        # (distance, candidate) for the candidates within max_distance edits
+        # of word, closest first.
+        masks = SearchAlgorithm.pattern_masks(word)
+        similar = []
+        for candidate in candidates:
+            distance = SearchAlgorithm.pattern_distance(masks, len(word), candidate)
+            if distance <= max_distance:
+                similar.append((distance, candidate))
+
+        similar.sort()
+        return similar
+
+    def allowed_edits(word):
+        # Edits allowed within one word: none in words of one or two letters,
+        # which are mostly initials, one in words of up to five letters and
+        # word_edits in longer ones.
+        if len(word) <= 2:
+            return 0
+        if len(word) <= 5:
+            return 1
+        return NameIndex.word_edits
+
+    def word_combinations(similar, budget):
+        # (edits, words): one similar word for each query word, with at most
+        # budget edits between them.
+        if not similar:
+            yield 0, []
+            return
+        for distance, word in similar[0]:
+            if distance > budget:
+                break
+            for edits, rest in NameIndex.word_combinations(similar[1:], budget - distance):
+                yield distance + edits, [word] + rest
+
+    def fuzzy_matches(self, name, limit=10, max_distance=None):
+        if max_distance is None:
+            max_distance = max(1, len(name) // 5)
+
+        # A match has as many words as the query, each within allowed_edits
+        # edits of the query's word and max_distance edits in total. Names
+        # are put together from the similar words and looked up, and the
+        # ones that exist are ranked by their total edits.
+        words = name.split(" ")
+        word_edits = [min(max_distance, NameIndex.allowed_edits(word)) for word in words]
+        candidates = [
+            self.word_candidates(word, edits) for word, edits in zip(words, word_edits)
+        ]
+
+        # The word with the most candidates is left out of the combinations.
+        # Its candidates within the edits a combination leaves (looked up
+        # again when that is fewer than it was allowed) are put into the
+        # combination in turn, and checked only when that makes a name that
+        # exists.
+        last = max(range(len(words)), key=lambda i: len(candidates[i]))
+        similar = [
+            NameIndex.similar_words(words[i], candidates[i], word_edits[i])
+            for i in range(len(words))
+            if i != last
+        ]
+        last_candidates = {word_edits[last]: candidates[last]}
+        last_masks = SearchAlgorithm.pattern_masks(words[last])
+
+        ranked = []
+        for edits, chosen in NameIndex.word_combinations(similar, max_distance):
+            budget = min(word_edits[last], max_distance - edits)
+            if budget not in last_candidates:
+                last_candidates[budget] = self.word_candidates(words[last], budget)
+            head = "".join(word + " " for word in chosen[:last])
+            tail = "".join(" " + word for word in chosen[last:])
+            for word in last_candidates[budget]:
+                candidate = head + word + tail
+                position = self.positions.get(candidate)
+                if position is None or position >= self.name_count:
+                    continue
+                distance = SearchAlgorithm.pattern_distance(last_masks, len(words[last]), word)
+                if distance <= budget:
+                    ranked.append((edits + distance, candidate))
+
+        ranked.sort()
+        return [candidate for _, candidate in ranked[:limit]]
+
+
+class CaseAggregates:
+    # Case counts per (crime type, status, severity, year) cell, kept up to
+    # date as cases are added. Group-by summaries over any of these columns
+    # are rolled up from the cells, so they cost O(distinct cells) instead of
+    # a pass over the archive. Severity is one of the columns, so the
+    # severity minimum, mean and maximum of a group follow from its cells.
+    #
+    # Cases added since the last freeze are counted in a pending Counter and
+    # merged into a new dict of cells, so frozen copies keep the cells they
+    # were made with. Cells are kept in the order they first appeared.
+    dimensions = ("crime_type", "status", "severity", "year")
+
+    def __init__(self):
+        self.cells = {}
+        self.pending = Counter()
+
+    def add(self, case):
+        self.pending[(case.crime_type, case.status, case.severity, case.date.year)] += 1
+
+    def add_values(self, crime_type, status, severity, year):
+        self.pending[(crime_type, status, severity, year)] += 1
+
+    def add_columns(self, crime_types, statuses, severities, ordinals, strings):
+        # As add for every row of snapshot columns (see CaseSnapshot), where
+        # crime types and statuses are indexes into strings. The rows are
+        # counted per cell with one Counter, so each cell is looked up once.
+        years = {ordinal: datetime.fromordinal(ordinal).year for ordinal in set(ordinals)}
+        cells = Counter(
+            zip(crime_types, statuses, severities, map(years.__getitem__, ordinals))
+        )
+        for (crime_type, status, severity, year), count in cells.items():
+            self.pending[(strings[crime_type], strings[status], severity, year)] += count
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        cells = dict(self.cells)
+        for cell, count in self.pending.items():
+            cells[cell] = cells.get(cell, 0) + count
+        self.cells = cells
+        self.pending = Counter()
+
+    def footprint(self, size_of):
+        # Bytes held by the cells and the pending counts, for
+        # CaseArchive.count_footprint.
+        size = 0
+        for cells in (self.cells, self.pending):
+            size += size_of(cells)
+            for cell, count in cells.items():
+                size += size_of(cell) + sum(size_of(value) for value in cell) + size_of(count)
+        return size
+
+    def freeze(self):
+        self.flush()
+        frozen = CaseAggregates()
+        frozen.cells = self.cells
+        return frozen
+
+    def parse_dimensions(text):
+        # Parses input such as "crime type, year" into a tuple of dimensions.
+        # Empty input means no grouping (one total over all cases).
+        dimensions = []
+        for part in text.split(","):
+            dimension = "_".join(part.strip().lower().split())
+            if not dimension:
+                continue
+            if dimension not in CaseAggregates.dimensions:
+                raise ValueError(f"Cannot group by '{part.strip()}'.")
+            dimensions.append(dimension)
+        return tuple(dimensions)
+
+    def values(self, dimension):
+        # The distinct values of one dimension, in the order they first appeared.
+        position = CaseAggregates.dimensions.index(dimension)
+        return list(dict.fromkeys(cell[position] for cell in self.cells))
+
+    def summary(
+        self, group_by=(), crime_type=None, status=None, severity=None, year=None
+    ):
+        # Returns {group: {"count", "min_severity", "mean_severity",
+        # "max_severity"}} for the cases matching every given value, where
+        # group is the tuple of the group_by values, in first-seen order.
+        if isinstance(group_by, str):
+            group_by = (group_by,)
+        for dimension in group_by:
+            if dimension not in CaseAggregates.dimensions:
+                raise ValueError(f"Cannot group by '{dimension}'.")
+
+        positions = [CaseAggregates.dimensions.index(dimension) for dimension in group_by]
+        conditions = [
+            (position, value)
+            for position, value in enumerate((crime_type, status, severity, year))
+            if value is not None
+        ]
+
+        groups = {}
+        for cell, count in self.cells.items():
+            if any(cell[position] != value for position, value in conditions):
+                continue
+
+            cell_severity = cell[2]
+            group = tuple(cell[position] for position in positions)
+            totals = groups.get(group)
+            if totals is None:
+                groups[group] = [count, count * cell_severity, cell_severity, cell_severity]
+            else:
+                totals[0] += count
+                totals[1] += count * cell_severity
+                if cell_severity < totals[2]:
+                    totals[2] = cell_severity
+                if cell_severity > totals[3]:
+                    totals[3] = cell_severity
+
+        return {
+            group: {
+                "count": count,
+                "min_severity": minimum,
+                "mean_severity": severity_sum / count,
+                "max_severity": maximum,
+            }
+            for group, (count, severity_sum, minimum, maximum) in groups.items()
+        }
+
+
+class QueryCache:
+    # Bounded cache of query results with least-recently-used eviction. The
+    # bound is the total number of cached rows rather than the number of
+    # entries, since one unfiltered sort can hold as many rows as the archive.
+    def __init__(self, max_rows=100000):
+        self.max_rows = max_rows
+        self.entries = OrderedDict()
+        self.rows = 0
+        self.hits = 0
+        self.misses = 0
+        # Queries on several threads share the cache, so every operation on the
+        # entries holds this lock. It is only held for a dict operation or two.
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        # Results larger than the whole cache are not kept at all.
+        if len(value) > self.max_rows:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.rows -= len(self.entries.pop(key))
+            self.entries[key] = value
+            self.rows += len(value)
+            while self.rows > self.max_rows:
+                _, evicted = self.entries.popitem(last=False)
+                self.rows -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.rows = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "rows": self.rows,
+                "max_rows": self.max_rows,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class LazyCaseList:
+    # The rows of a lazy archive (CaseArchive(lazy=True)). A row read from the
+    # CSV file is only kept as the byte offset its line starts at in the
+    # memory-mapped file, and its Case is parsed from the line again each time
+    # the row is read. Loading validates every row but keeps none of its
+    # fields, and the archive builds each index from fields() when a query first needs it, so
+    # rows are parsed for the indexes that are used and built as cases only
+    # once results are accessed. Cases added as objects (add_cases, the demo
+    # cases) are kept as they are.
+    #
+    # The mapped file is a private temporary copy of the bytes read from the
+    # CSV, written as they are read, at the same offsets. The CSV itself may
+    # be truncated, rewritten or replaced at any time: rows already loaded,
+    # including those of older archive versions, keep reading the copy.
+    # Rows are only ever appended, as with the list of an eager archive.
+    object_offset = 2**64 - 1  # in offsets, marks a row kept in objects
+
+    def __init__(self, interner):
+        self.offsets = array("Q")
+        self.objects = {}
+        self.interner = interner
+        self.mapped = None
+        self.copy = None
+        self.positions = None
+        self.date_cache = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyCases(self, range(*index.indices(len(self.offsets))))
+        if index < 0:
+            index += len(self.offsets)
+        return self.case(index)
+
+    def __iter__(self):
+        for row in range(len(self.offsets)):
+            yield self.case(row)
+
+    def private_copy(self):
+        # The file the CSV bytes are copied to, for CaseParser.iter_row_batches
+        # and read_appended_rows. It is deleted once nothing uses it.
+        if self.copy is None:
+            self.copy = tempfile.TemporaryFile()
+        return self.copy
+
+    def map_copy(self, positions, size):
+        # Maps the copy once it holds rows past the end of the current map.
+        # Older maps stay valid for the readers still holding them.
+        if self.mapped is None or len(self.mapped) < size:
+            self.copy.flush()
+            self.mapped = mmap.mmap(self.copy.fileno(), size, access=mmap.ACCESS_READ)
+        self.positions = positions
+
+    def append(self, case):
+        self.objects[len(self.offsets)] = case
+        self.offsets.append(LazyCaseList.object_offset)
+
+    def append_offset(self, offset):
+        self.offsets.append(offset)
+
+    def mapped_lines(mapped, offset):
+        while offset < len(mapped):
+            end = mapped.find(b"\n", offset) + 1 or len(mapped)
+            yield mapped[offset:end].decode("utf-8")
+            offset = end
+
+    def fields(self):
+        # The fields of every row in the order of CaseParser.parse_fields, for
+        # building an index. Consecutive rows of the file are parsed with one
+        # csv reader.
+        reader = None
+        for row, offset in enumerate(self.offsets):
+            if offset == LazyCaseList.object_offset:
+                reader = None
+                yield CaseParser.case_fields(self.objects[row])
+                continue
+
+            if reader is None:
+                reader = csv.reader(LazyCaseList.mapped_lines(self.mapped, offset))
+            values = next(reader)
+            while not values:
+                values = next(reader)
+            yield CaseParser.parse_fields(values, self.positions, self.date_cache)
+
+    def case(self, row):
+        offset = self.offsets[row]
+        if offset == LazyCaseList.object_offset:
+            return self.objects[row]
+
+        # A csv reader over the following lines, so a quoted field with a line
+        # break is read in full.
+        fields = next(csv.reader(LazyCaseList.mapped_lines(self.mapped, offset)))
+        return CaseParser.build_case(
+            CaseParser.parse_fields(fields, self.positions, self.date_cache),
+            self.interner,
+        )
+
+
+class LazyCases:
+    # A read-only sequence of rows of a LazyCaseList, e.g. query results. Each
+    # case is built when it is accessed, so printing one page of a large
+    # result only builds that page. Slices are LazyCases too.
+    __slots__ = ("case_list", "rows")
+
+    def __init__(self, case_list, rows):
+        self.case_list = case_list
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyCases(self.case_list, self.rows[index])
+        return self.case_list.case(self.rows[index])
+
+    def __iter__(self):
+        case = self.case_list.case
+        for row in self.rows:
+            yield case(row)
+
+
+class ArchiveVersion:
+    # One published, read-only version of the archive. Its lists and indexes
+    # are shared with later versions, which only ever add to them, so every
+    # lookup is bounded by this version's row count.
+    __slots__ = (
+        "number",
+        "cases",
+        "row_count",
+        "suspect_index",
+        "victim_index",
+        "suspect_names",
+        "victim_names",
+        "case_id_index",
+        "crime_type_bitmaps",
+        "severity_bitmaps",
+        "status_bitmaps",
+        "date_index",
+        "severity_index",
+        "columnar_store",
+        "aggregates",
+    )
+
+    def __init__(self, case_archive, number):
+        self.number = number
+        self.cases = case_archive.cases
+        self.row_count = len(case_archive.cases)
+        self.suspect_index = case_archive.suspect_index
+        self.victim_index = case_archive.victim_index
+        # Indexes a lazy archive has not built yet stay None.
+        frozen = ArchiveVersion.frozen
+        self.suspect_names = frozen(case_archive.suspect_names)
+        self.victim_names = frozen(case_archive.victim_names)
+        self.case_id_index = frozen(case_archive.case_id_index)
+        self.crime_type_bitmaps = frozen(case_archive.crime_type_bitmaps)
+        self.severity_bitmaps = frozen(case_archive.severity_bitmaps)
+        self.status_bitmaps = frozen(case_archive.status_bitmaps)
+        self.date_index = frozen(case_archive.date_index)
+        self.severity_index = frozen(case_archive.severity_index)
+        self.columnar_store = frozen(case_archive.columnar_store)
+        self.aggregates = frozen(case_archive.aggregates)
+
+    def frozen(index):
+        return None if index is None else index.freeze()
+
+    def case_list(self):
+        return self.cases[:self.row_count]
+
+    def cases_at(self, rows):
+        cases = self.cases
+        if isinstance(cases, (LazyCaseList, SnapshotCaseList)):
+            return LazyCases(cases, list(rows))
+        return [cases[row] for row in rows]
+
+    def name_cases(self, name_index, name):
+        # Row lists grow in ascending order, so the rows of later versions
+        # are cut off with one bisection.
+        rows = name_index.get(name)
+        if not rows:
+            return []
+        return self.cases_at(rows[:bisect_left(rows, self.row_count)])
+
+
+class CaseArchive:
+    # Queries never lock and never wait for a load: each one reads the current
+    # ArchiveVersion once and works on that. Loads and appends hold write_lock,
+    # add to the indexes, and then publish a new version with one assignment.
+    index_types = {
+        "suspect_index": dict,
+        "victim_index": dict,
+        "suspect_names": NameIndex,
+        "victim_names": NameIndex,
+        "case_id_index": SortedIndex,
+        "crime_type_bitmaps": BitmapIndex,
+        "severity_bitmaps": BitmapIndex,
+        "status_bitmaps": BitmapIndex,
+        "date_index": SortedIndex,
+        "severity_index": SortedIndex,
+        "aggregates": CaseAggregates,
+    }
+    # The indexes a lazy archive builds together, in one pass over the rows.
+    # A name index is built from the keys of its row index.
+    index_groups = {
+        "suspect_index": ("suspect_index",),
+        "victim_index": ("victim_index",),
+        "suspect_names": ("suspect_index", "suspect_names"),
+        "victim_names": ("victim_index", "victim_names"),
+        "case_id_index": ("case_id_index",),
+        "crime_type_bitmaps": ("crime_type_bitmaps", "severity_bitmaps", "status_bitmaps"),
+        "severity_bitmaps": ("crime_type_bitmaps", "severity_bitmaps", "status_bitmaps"),
+        "status_bitmaps": ("crime_type_bitmaps", "severity_bitmaps", "status_bitmaps"),
+        "date_index": ("date_index", "severity_index"),
+        "severity_index": ("date_index", "severity_index"),
+        "aggregates": ("aggregates",),
+    }
+    index_fields = (
+        "cases",
+        "suspect_index",
+        "victim_index",
+        "suspect_names",
+        "victim_names",
+        "case_id_index",
+        "crime_type_bitmaps",
+        "severity_bitmaps",
+        "status_bitmaps",
+        "date_index",
+        "severity_index",
+        "columnar_store",
+        "aggregates",
+        "source",
+    )
+
+    def __init__(self, columnar=False, cache_size=100000, lazy=False):
+        if columnar and lazy:
+            raise ValueError("A lazy archive cannot use the columnar store.")
+
+        self.columnar = columnar
+        # Lazy archives keep the rows of CSV files as offsets into the file,
+        # build each index when a query first needs it, and only build cases
+        # when they are read (see LazyCaseList).
+        self.lazy = lazy
+        self.interner = CaseInterner()
+        self.query_cache = QueryCache(cache_size)
+        self.write_lock = threading.RLock()
+        self.reset_indexes()
+        self.current = ArchiveVersion(self, 0)
+
+    def reset_indexes(self):
+        self.cases = LazyCaseList(self.interner) if self.lazy else []
+        # A lazy archive starts without indexes and builds each one when a
+        # query first needs it (see indexed_version).
+        for name, index_type in CaseArchive.index_types.items():
+            setattr(self, name, None if self.lazy else index_type())
+        self.columnar_store = ColumnarCaseStore() if self.columnar else None
+        # The CSV file the cases were loaded from and how far it was read, so
+        # refresh_cases can pick up where the last load left off.
+        self.source = None
+
+    @property
+    def case_list(self):
+        return self.current.case_list()
+
+    @property
+    def version(self):
+        return self.current.number
+
+    def __len__(self):
+        return self.current.row_count
+
+    def normalize_name(name):
+        return name.upper()
+
+    def index_case(
+        self, row, case_id, date, crime_type, suspect_name, victim_name, severity, status
+    ):
+        # The arguments are the fields of the case, in the order of
+        # CaseParser.parse_fields. Indexes a lazy archive has not built yet
+        # are None and skipped.
+        for name_index, names, name in (
+            (self.suspect_index, self.suspect_names, suspect_name),
+            (self.victim_index, self.victim_names, victim_name),
+        ):
+            if name_index is None:
+                continue
+            key = CaseArchive.normalize_name(name)
+            rows = name_index.get(key)
+            if rows is None:
+                rows = name_index[key] = []
+                if names is not None:
+                    names.add(key)
+            rows.append(row)
+
+        if self.case_id_index is not None:
+            self.case_id_index.add(case_id, row)
+        if self.crime_type_bitmaps is not None:
+            self.crime_type_bitmaps.add(crime_type, row)
+            self.severity_bitmaps.add(severity, row)
+            self.status_bitmaps.add(status, row)
+        if self.date_index is not None:
+            self.date_index.add(date, row)
+            self.severity_index.add(severity, row)
+        if self.aggregates is not None:
+            self.aggregates.add_values(crime_type, status, severity, date.year)
+
+    def append_case(self, case):
+        # Callers hold write_lock and call publish once they are done.
+        row = len(self.cases)
+        self.cases.append(case)
+        self.index_case(row, *CaseParser.case_fields(case))
+        if self.columnar_store is not None:
+            self.columnar_store.append(case)
+
+    def append_rows(self, rows, source):
+        # Lazy archives: adds (offset, row) pairs read from the file that
+        # source describes into the private copy of self.cases. Rows are
+        # only parsed if an index has been built already. Callers hold
+        # write_lock and call publish.
+        positions = source["positions"]
+        self.cases.map_copy(positions, source["offset"])
+        indexed = any(getattr(self, name) is not None for name in CaseArchive.index_types)
+        for offset, values in rows:
+            row = len(self.cases)
+            self.cases.append_offset(offset)
+            if indexed:
+                fields = CaseParser.parse_fields(values, positions, self.cases.date_cache)
+                self.index_case(row, *fields)
+
+    def indexed_version(self, current, *names):
+        # Returns a version of the archive with the named indexes, which is
+        # current unless a lazy archive has yet to build one of them. Building
+        # parses every row once and publishes the archive again under the
+        # same version number, as its rows have not changed; a query that
+        # started on an older version goes on with the latest one.
+        if all(getattr(current, name) is not None for name in names):
+            return current
+
+        with self.write_lock:
+            missing = {
+                index_name
+                for name in names
+                for index_name in CaseArchive.index_groups[name]
+                if getattr(self, index_name) is None
+            }
+            if missing:
+                self.build_indexes(missing)
+                self.current = ArchiveVersion(self, self.current.number)
+            return self.current
+
+    def build_indexes(self, names):
+        # Builds the named indexes over every row. The indexes built already
+        # are set aside meanwhile, so index_case only adds to the new ones.
+        # Callers hold write_lock.
+        built = {
+            name: getattr(self, name)
+            for name in CaseArchive.index_types
+            if name not in names
+        }
+        for name, index_type in CaseArchive.index_types.items():
+            setattr(self, name, index_type() if name in names else None)
+        try:
+            # A name index whose row index is built already only needs its
+            # keys, which are in the order they first appeared.
+            for row_index, names_index in (
+                (built.get("suspect_index"), self.suspect_names),
+                (built.get("victim_index"), self.victim_names),
+            ):
+                if row_index is not None and names_index is not None:
+                    for key in row_index:
+                        names_index.add(key)
+            if names - {"suspect_names", "victim_names"}:
+                for row, fields in enumerate(self.cases.fields()):
+                    self.index_case(row, *fields)
+        except BaseException:
+            # The rows were validated when they were loaded, so this is not a
+            # data error; the partly built indexes are dropped all the same.
+            for name in names:
+                setattr(self, name, None)
+            raise
+        finally:
+            for name, index in built.items():
+                setattr(self, name, index)
+        instrumentation.count("lazy index builds", len(names))
+
+    def group_rows(column):
+        # Maps each value in column to the rows holding it, in ascending order.
+        # Values are kept in the order they first appear.
+        groups = {}
+        for row, value in enumerate(column):
+            rows = groups.get(value)
+            if rows is None:
+                rows = groups[value] = []
+            rows.append(row)
+        return groups
+
+    def index_snapshot(self, case_list):
+        # Indexes the mapped rows of a SnapshotCaseList, which callers have
+        # made self.cases, as index_case would, but column by column: rows are
+        # grouped by the string index or number they hold, so each distinct
+        # name, crime type, status and date is handled once rather than once
+        # per row. Callers hold write_lock and call publish.
+        case_ids, ordinals, severities, suspects, victims, crime_types, statuses = (
+            case_list.columns
+        )
+        strings = case_list.strings
+        dates = {ordinal: case_list.date(ordinal) for ordinal in set(ordinals)}
+        rows = range(case_list.row_count)
+
+        for column, name_index, names in (
+            (suspects, self.suspect_index, self.suspect_names),
+            (victims, self.victim_index, self.victim_names),
+        ):
+            for string_index, name_rows in CaseArchive.group_rows(column).items():
+                key = CaseArchive.normalize_name(strings[string_index])
+                existing = name_index.get(key)
+                if existing is None:
+                    name_index[key] = name_rows
+                    names.add(key)
+                else:
+                    # Names that only differ in case share one key.
+                    existing[:] = sorted(existing + name_rows)
+
+        for column, bitmaps in (
+            (crime_types, self.crime_type_bitmaps),
+            (statuses, self.status_bitmaps),
+        ):
+            for string_index, value_rows in CaseArchive.group_rows(column).items():
+                bitmaps.add_rows(strings[string_index], value_rows)
+        for severity, severity_rows in CaseArchive.group_rows(severities).items():
+            self.severity_bitmaps.add_rows(severity, severity_rows)
+
+        self.case_id_index.add_entries(zip(case_ids, rows))
+        self.date_index.add_entries(zip(map(dates.__getitem__, ordinals), rows))
+        self.severity_index.add_entries(zip(severities, rows))
+
+        self.aggregates.add_columns(crime_types, statuses, severities, ordinals, strings)
+
+        if self.columnar_store is not None:
+            for fields in case_list.fields():
+                self.columnar_store.append_fields(fields)
+
+    def publish(self):
+        with self.write_lock:
+            self.current = ArchiveVersion(self, self.current.number + 1)
+            self.query_cache.clear()
+
+    def add_case(self, case):
+        self.add_cases([case])
+
+    def add_cases(self, cases):
+        with self.write_lock:
+            for case in cases:
+                self.append_case(case)
+            self.publish()
+
+    def replace_cases(self, append_cases):
+        # Builds a fresh set of indexes with append_cases and publishes them in
+        # one step. Readers keep seeing the previous version until then, and
+        # if loading fails the archive is left as it was.
+        with self.write_lock:
+            previous = {name: getattr(self, name) for name in CaseArchive.index_fields}
+            self.reset_indexes()
+            try:
+                append_cases()
+            except Exception:
+                for name, value in previous.items():
+                    setattr(self, name, value)
+                raise
+            self.publish()
+
+        return True
+
+    @instrumentation.timed("load_cases")
+    def load_cases(self, filepath):
+        # Replaces the cases in the archive with the cases in the file.
+        def append_cases():
+            for _ in self.append_case_batches(filepath):
+                pass
+
+        return self.replace_cases(append_cases)
+
+    def load_cases_streaming(self, filepath, batch_size=10000):
+        # Replaces the cases in the archive batch by batch, so callers can
+        # start querying after the first batch. Each batch is added and
+        # published under write_lock, which is released before the batch is
+        # yielded, so queries and lazy index builds go on while the caller
+        # handles it. If loading fails or the caller stops early, the archive
+        # goes back to the cases it had before. A write made in the meantime
+        # (add_cases, another load or a refresh) ends the load where it is.
+        with self.write_lock:
+            previous = {name: getattr(self, name) for name in CaseArchive.index_fields}
+            first_version = version = self.current.number
+            self.reset_indexes()
+            batches = self.append_case_batches(filepath, batch_size)
+
+        finished = False
+        try:
+            while True:
+                with self.write_lock:
+                    if self.current.number != version:
+                        finished = True
+                        return
+                    batch = next(batches, None)
+                    if batch is None:
+                        finished = True
+                        return
+                    self.publish()
+                    version = self.current.number
+                yield batch
+        finally:
+            batches.close()
+            if not finished:
+                with self.write_lock:
+                    if self.current.number == version:
+                        for name, value in previous.items():
+                            setattr(self, name, value)
+                        if version != first_version:
+                            self.publish()
+
+    def append_case_batches(self, filepath, batch_size=10000):
+        # The source is only recorded once the whole file has been read, so a
+        # refresh during a streaming load reads the file again.
+        source = {}
+        try:
+            # The time callers spend on a batch is not counted as load time.
+            start = time.perf_counter()
+            if self.lazy:
+                # Each batch is yielded as LazyCases, so it is not built
+                # unless the caller reads it.
+                for rows in CaseParser.iter_row_batches(
+                    filepath, batch_size, source, self.cases.private_copy()
+                ):
+                    first_row = len(self.cases)
+                    self.append_rows(rows, source)
+                    instrumentation.count_rows(len(rows), time.perf_counter() - start)
+                    yield LazyCases(self.cases, range(first_row, len(self.cases)))
+                    start = time.perf_counter()
+            else:
+                for batch in CaseParser.iter_case_batches(
+                    filepath, batch_size, self.interner, source
+                ):
+                    for case in batch:
+                        self.append_case(case)
+                    instrumentation.count_rows(len(batch), time.perf_counter() - start)
+                    yield batch
+                    start = time.perf_counter()
+            self.source = source
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+    @instrumentation.timed("refresh_cases")
+    def refresh_cases(self, filepath):
+        # Adds the rows appended to the file since the last load or refresh.
+        # Only new rows are parsed and indexed. If the file was replaced,
+        # truncated or rewritten in the meantime, the archive is loaded from it
+        # again instead. Returns {"reloaded": whether it was, "cases": the
+        # number of cases added}, where a reload adds every case in the file.
+        with self.write_lock:
+            start = time.perf_counter()
+            appended = None
+            if self.source:
+                try:
+                    if self.lazy:
+                        appended = CaseParser.read_appended_rows(
+                            filepath, self.source, self.cases.private_copy()
+                        )
+                    else:
+                        appended = CaseParser.read_appended_cases(
+                            filepath, self.source, self.interner
+                        )
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        f"No CSV file found at filepath: {filepath}"
+                    )
+                except Exception as e:
+                    instrumentation.count("rows rejected")
+                    raise ValueError(f"Error loading cases: {str(e)}")
+
+            if appended is None:
+                self.load_cases(filepath)
+                return {"reloaded": True, "cases": len(self.cases)}
+
+            cases, self.source = appended
+            if cases:
+                if self.lazy:
+                    self.append_rows(cases, self.source)
+                else:
+                    for case in cases:
+                        self.append_case(case)
+                self.publish()
+            instrumentation.count_rows(len(cases), time.perf_counter() - start)
+            return {"reloaded": False, "cases": len(cases)}
+
+    @instrumentation.timed("load_cases_parallel")
+    def load_cases_parallel(self, filepath, workers=None):
+        # Parses line-aligned byte ranges of the CSV in a process pool. The
+        # ranges are merged back in file order, so the archive ends up exactly
+        # as load_cases would build it.
+        if self.lazy:
+            # The workers would have to send back where each row starts as
+            # well. A lazy load only splits the rows into fields, so it
+            # reads the file in this process instead.
+            return self.load_cases(filepath)
+
+        workers = workers or os.cpu_count() or 1
+
+        def append_cases():
+            self.source = {}
+            for batch in CaseParser.iter_parallel_case_batches(
+                filepath, workers, self.interner, self.source
+            ):
+                for case in batch:
+                    self.append_case(case)
+
+        start = time.perf_counter()
+        try:
+            self.replace_cases(append_cases)
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+        instrumentation.count_rows(len(self.cases), time.perf_counter() - start)
+        return True
+
+    def save_snapshot(self, path, source_path=None):
+        CaseSnapshot.save(self.case_list, path, source_path)
+
+    @instrumentation.timed("load_snapshot")
+    def load_snapshot(self, path, source_path=None):
+        # Replaces the cases in the archive. The snapshot was validated when it
+        # was written, so its rows are added as they are, without going through
+        # the CSV parser again. A later refresh_cases reloads the CSV in full.
+        start = time.perf_counter()
+        try:
+            case_list = CaseSnapshot.load(
+                path, source_path, interner=self.interner
+            )
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No snapshot file found at filepath: {path}")
+
+        def append_cases():
+            # The mapped rows become the archive's rows and are indexed from
+            # their columns, so no case is built while loading. A lazy archive
+            # indexes them when queries first need it, as with a CSV.
+            self.cases = case_list
+            if not self.lazy:
+                self.index_snapshot(case_list)
+
+        self.replace_cases(append_cases)
+        instrumentation.count_rows(len(case_list), time.perf_counter() - start)
+        return True
+
+    def load_demo_cases(self):
+        demo_data = [
+            {
+                "CaseID": "84435",
+                "Date": "01/01/1983",
+                "CrimeType": "Arson",
+                "MainSuspect": "Jeffery Castillo",
+                "Victim": "Jennifer Long",
+                "CaseSeverity": "7",
+                "Status": "Unsolved",
+            },
+            {
+                "CaseID": "86458",
+                "Date": "02/02/1983",
+                "CrimeType": "Theft",
+                "MainSuspect": "Angela Ross",
+                "Victim": "James Wilkerson",
+                "CaseSeverity": "3",
+                "Status": "Solved",
+            },
+            {
+                "CaseID": "62068",
+                "Date": "03/03/1983",
+                "CrimeType": "Murder",
+                "MainSuspect": "Unknown",
+                "Victim": "Unknown",
+                "CaseSeverity": "10",
+                "Status": "Unsolved",
+            },
+            {
+                "CaseID": "49692",
+                "Date": "04/04/1983",
+                "CrimeType": "Theft",
+                "MainSuspect": "Jeremy Green",
+                "Victim": "Heidi Mckinney",
+                "CaseSeverity": "2",
+                "Status": "Solved",
+            },
+            {
+                "CaseID": "24397",
+                "Date": "05/05/1983",
+                "CrimeType": "Arson",
+                "MainSuspect": "Travis Rollins",
+                "Victim": "Christina Bartlett",
+                "CaseSeverity": "8",
+                "Status": "Unsolved",
+            },
+        ]
+
+        demo_cases = []
+        for case in demo_data:
+            case_id = int(case["CaseID"])
+            date = datetime.strptime(case["Date"], "%m/%d/%Y")
+            suspect_name = case["MainSuspect"]
+            victim_name = case["Victim"]
+            crime_type = case["CrimeType"]
+            severity = int(case["CaseSeverity"])
+            status = case["Status"]
+            demo_cases.append(
+                self.interner.build_case(
+                    case_id, date, suspect_name, victim_name, crime_type, severity, status
+                )
+            )
+        self.add_cases(demo_cases)
+
+    def memory_footprint(self):
+        # Approximate bytes held by the archive, per kind of object. Shared
+        # (interned) objects are only counted once. The indexes are walked
+        # while they are live, so loads wait until the count is done.
+        with self.write_lock:
+            return self.count_footprint()
+
+    def count_footprint(self):
+        seen = set()
+
+        def size_of(value):
+            if id(value) in seen:
+                return 0
+            seen.add(id(value))
+            return sys.getsizeof(value)
+
+        footprint = {"cases": 0, "persons": 0, "strings": 0, "dates": 0, "indexes": 0}
+        footprint["cases"] += size_of(self.cases)
+        cases = self.cases
+        if isinstance(cases, SnapshotCaseList):
+            # Snapshot rows stay in the mapped file; only the string table and
+            # the cases added since are in memory.
+            footprint["cases"] += size_of(cases.objects)
+            footprint["strings"] += size_of(cases.strings)
+            footprint["strings"] += sum(size_of(value) for value in cases.strings)
+            cases = cases.objects
+        elif self.lazy:
+            # Rows read from the CSV only hold their offset.
+            footprint["cases"] += size_of(self.cases.offsets)
+            footprint["cases"] += size_of(self.cases.objects)
+            cases = self.cases.objects.values()
+        for case in cases:
+            footprint["cases"] += size_of(case) + size_of(case.case_id)
+            footprint["cases"] += size_of(case.severity)
+            footprint["persons"] += size_of(case.suspect) + size_of(case.victim)
+            footprint["strings"] += size_of(case.suspect.name)
+            footprint["strings"] += size_of(case.victim.name)
+            footprint["strings"] += size_of(case.crime_type) + size_of(case.status)
+            footprint["dates"] += size_of(case.date)
+
+        def index_footprint(*indexes):
+            # Indexes a lazy archive has not built yet are None and take no
+            # memory.
+            return sum(index.footprint(size_of) for index in indexes if index is not None)
+
+        for index in (self.suspect_index, self.victim_index):
+            if index is None:
+                continue
+            footprint["indexes"] += size_of(index)
+            for name, rows in index.items():
+                footprint["indexes"] += size_of(name) + size_of(rows)
+                footprint["indexes"] += sum(size_of(row) for row in rows)
+
+        footprint["name_indexes"] = index_footprint(self.suspect_names, self.victim_names)
+        footprint["bitmap_indexes"] = index_footprint(
+            self.crime_type_bitmaps, self.severity_bitmaps, self.status_bitmaps
+        )
+        footprint["sorted_indexes"] = index_footprint(
+            self.case_id_index, self.date_index, self.severity_index
+        )
+        footprint["aggregates"] = index_footprint(self.aggregates)
+
+        if self.columnar_store is not None:
+            self.columnar_store.flush()
+            footprint["indexes"] += sum(
+                column.nbytes
+                for column in (
+                    self.columnar_store.case_ids,
+                    self.columnar_store.severities,
+                    self.columnar_store.dates,
+                    self.columnar_store.crime_type_codes,
+                    self.columnar_store.status_codes,
+                )
+            )
+
+        footprint["total"] = sum(footprint.values())
+        return footprint
+
+    def instrumentation_report(self):
+        # The process-wide instrumentation report plus this archive's cache.
+        report = instrumentation.report()
+        report["cache"] = self.query_cache.stats()
+        return report
+
+    def load_crime_types(self):
+        current = self.indexed_version(self.current, "crime_type_bitmaps")
+        return current.crime_type_bitmaps.values()
+
+    def summarize(
+        self, group_by=(), crime_type=None, status=None, severity=None, year=None
+    ):
+        # Case counts and severity statistics per group, e.g.
+        # summarize(("crime_type", "status"), year=1983). See CaseAggregates.
+        current = self.indexed_version(self.current, "aggregates")
+        return current.aggregates.summary(group_by, crime_type, status, severity, year)
+
+    def no_cases(self):
+        # Queries on an empty archive return no results. Telling the user to
+        # load cases is left to the Application, so that nothing is printed
+        # into batch output or the server's stdout.
+        return len(self) == 0
+
+    @instrumentation.timed("search_suspect")
+    def search_suspect(self, suspect_name):
+        if self.no_cases():
+            return []
+
+        current = self.indexed_version(self.current, "suspect_index")
+        suspect_key = CaseArchive.normalize_name(suspect_name)
+        return self.cached_query(
+            current,
+            ("suspect", suspect_key),
+            lambda: current.name_cases(current.suspect_index, suspect_key),
+        )
+
+    @instrumentation.timed("search_victim")
+    def search_victim(self, victim_name):
+        if self.no_cases():
+            return []
+
+        current = self.indexed_version(self.current, "victim_index")
+        victim_key = CaseArchive.normalize_name(victim_name)
+        return self.cached_query(
+            current,
+            ("victim", victim_key),
+            lambda: current.name_cases(current.victim_index, victim_key),
+        )
+
+    def search_suspect_prefix(self, prefix, limit=10):
+        return self.search_names("suspect prefix", prefix, limit)
+
+    def search_victim_prefix(self, prefix, limit=10):
+        return self.search_names("victim prefix", prefix, limit)
+
+    def search_suspect_fuzzy(self, suspect_name, limit=10):
+        return self.search_names("suspect fuzzy", suspect_name, limit)
+
+    def search_victim_fuzzy(self, victim_name, limit=10):
+        return self.search_names("victim fuzzy", victim_name, limit)
+
+    @instrumentation.timed("search_names")
+    def search_names(self, search_type, name, limit):
+        # Returns the cases of up to limit matching names, grouped by name in
+        # the order the name index ranks them.
+        if self.no_cases():
+            return []
+
+        role, match_type = search_type.split()
+        current = self.indexed_version(self.current, f"{role}_index", f"{role}_names")
+        if role == "suspect":
+            name_index, case_index = current.suspect_names, current.suspect_index
+        else:
+            name_index, case_index = current.victim_names, current.victim_index
+
+        name_key = CaseArchive.normalize_name(name)
+
+        def run_search():
+            if match_type == "prefix":
+                names = name_index.prefix_matches(name_key, limit)
+            else:
+                names = name_index.fuzzy_matches(name_key, limit)
+
+            results = []
+            for matching_name in names:
+                results.extend(current.name_cases(case_index, matching_name))
+            return results
+
+        return self.cached_query(current, (search_type, name_key, limit), run_search)
+
+    @instrumentation.timed("search_case_id")
+    def search_case_id(self, case_id):
+        if self.no_cases():
+            return []
+
+        current = self.indexed_version(self.current, "case_id_index")
+        rows = current.case_id_index.range_rows(case_id, case_id)
+        if not rows:
+            return []
+        else:
+            return [current.cases[min(rows)]]
+
+    @instrumentation.timed("filter_cases")
+    def filter_cases(self, crime_type, severity, status):
+        if self.no_cases():
+            return []
+
+        current = self.indexed_version(self.current, "crime_type_bitmaps")
+        return self.cached_query(
+            current,
+            ("filter", crime_type, severity, status),
+            lambda: self.run_filter(current, crime_type, severity, status),
+        )
+
+    def run_filter(self, current, crime_type, severity, status):
+        if current.columnar_store is not None:
+            rows = current.columnar_store.filter_rows(crime_type, severity, status)
+            return current.cases_at(rows.tolist())
+
+        # Each predicate selects one bitmap; AND-ing them leaves exactly the
+        # rows that match every predicate.
+        matching_rows = None
+        for bitmaps, value in (
+            (current.crime_type_bitmaps, crime_type),
+            (current.severity_bitmaps, severity),
+            (current.status_bitmaps, status),
+        ):
+            if value is None:
+                continue
+
+            bitmap = bitmaps.get(value)
+            if matching_rows is None:
+                matching_rows = bitmap
+            else:
+                matching_rows &= bitmap
+
+            if not matching_rows:
+                return []
+
+        if matching_rows is None:
+            return current.case_list()
+
+        return current.cases_at(BitmapIndex.rows(matching_rows))
+
+    def search_date_range(self, start_date=None, end_date=None):
+        return self.range_query(start_date, end_date, None, None)
+
+    def search_severity_range(self, min_severity=None, max_severity=None):
+        return self.range_query(None, None, min_severity, max_severity)
+
+    @instrumentation.timed("range_query")
+    def range_query(
+        self, start_date=None, end_date=None, min_severity=None, max_severity=None
+    ):
+        # All bounds are inclusive and optional. Results keep archive order.
+        if self.no_cases():
+            return []
+
+        current = self.indexed_version(self.current, "date_index")
+        start_date = CaseArchive.as_datetime(start_date)
+        end_date = CaseArchive.as_datetime(end_date)
+        return self.cached_query(
+            current,
+            ("range", start_date, end_date, min_severity, max_severity),
+            lambda: self.run_range_query(
+                current, start_date, end_date, min_severity, max_severity
+            ),
+        )
+
+    def as_datetime(value):
+        if value is None or isinstance(value, datetime):
+            return value
+        return datetime(value.year, value.month, value.day)
+
+    def in_range(value, low, high):
+        return (low is None or value >= low) and (high is None or value <= high)
+
+    def run_range_query(
+        self, current, start_date, end_date, min_severity, max_severity
+    ):
+        cases = current.cases
+
+        # Only the narrower of the two ranges is walked; the other bound is
+        # checked on each of its cases.
+        date_count = current.date_index.range_count(start_date, end_date)
+        severity_count = current.severity_index.range_count(
+            min_severity, max_severity
+        )
+        if date_count <= severity_count:
+            rows = current.date_index.range_rows(start_date, end_date)
+            if min_severity is not None or max_severity is not None:
+                rows = [
+                    row
+                    for row in rows
+                    if CaseArchive.in_range(
+                        cases[row].severity, min_severity, max_severity
+                    )
+                ]
+        else:
+            rows = current.severity_index.range_rows(min_severity, max_severity)
+            if start_date is not None or end_date is not None:
+                rows = [
+                    row
+                    for row in rows
+                    if CaseArchive.in_range(cases[row].date, start_date, end_date)
+                ]
+
+        rows.sort()
+        return current.cases_at(rows)
+
+    @instrumentation.timed("sort_cases")
+    def sort_cases(self, sort_attribute, reverse=False):
+        if self.no_cases():
+            return []
+
+        current = self.current
+        sort_order = tuple(SortingAlgorithm.sort_order(sort_attribute, reverse))
+        return self.cached_query(
+            current,
+            ("sort", sort_order),
+            lambda: SortingAlgorithm().merge_sort(current.case_list(), sort_order),
+        )
+
+    @instrumentation.timed("top_cases")
+    def top_cases(
+        self,
+        k,
+        sort_attribute,
+        reverse=False,
+        crime_type=None,
+        severity=None,
+        status=None,
+    ):
+        # The first k cases of sort_cases(sort_attribute, reverse), optionally
+        # restricted to the cases matching filter_cases(crime_type, severity,
+        # status), e.g. the 50 most severe unsolved cases.
+        if self.no_cases():
+            return []
+
+        current = self.current
+        if crime_type is not None or severity is not None or status is not None:
+            current = self.indexed_version(current, "crime_type_bitmaps")
+        sort_order = tuple(SortingAlgorithm.sort_order(sort_attribute, reverse))
+
+        def run_top_cases():
+            if crime_type is None and severity is None and status is None:
+                candidates = current.case_list()
+            else:
+                candidates = self.run_filter(current, crime_type, severity, status)
+            return SortingAlgorithm().top_k(candidates, k, sort_order)
+
+        return self.cached_query(
+            current,
+            ("top", k, sort_order, crime_type, severity, status),
+            run_top_cases,
+        )
+
+    def versioned_query(self, run_query):
+        # Runs a query and returns its results with the archive version they
+        # came from, for paginate. A query that overlapped a publish may have
+        # read either version, so it is run again.
+        while True:
+            version = self.version
+            results = run_query()
+            if self.version == version:
+                return results, version
+
+    def paginate(self, results, cursor=None, page_size=20, version=None):
+        # Returns one page of results and the cursor for the next page (None
+        # after the last page). A cursor records the archive version the
+        # results came from (version, from versioned_query; the current
+        # version if not given), so paging through results of an archive that
+        # has since changed is rejected instead of silently skipping or
+        # repeating rows.
+        if isinstance(page_size, bool) or not isinstance(page_size, int) or page_size < 1:
+            raise ValueError("Page size must be a positive integer.")
+
+        if version is None:
+            version = self.version
+        offset = 0
+        if cursor:
+            parts = cursor.split(":")
+            if len(parts) != 2 or not all(part.isdigit() for part in parts):
+                raise ValueError(
+                    f"Invalid cursor: {cursor}. Use the cursor returned with the previous page."
+                )
+            cursor_version, offset = (int(part) for part in parts)
+
+            if cursor_version != version:
+                raise ValueError("Cursor is no longer valid because the archive has changed.")
+
+        page = results[offset:offset + page_size]
+        next_offset = offset + page_size
+        if next_offset < len(results):
+            return page, f"{version}:{next_offset}"
+        return page, None
+
+    def cached_query(self, current, key, run_query):
+        # Results are cached per normalized query and archive version. The
+        # cache is cleared whenever a version is published, and the version in
+        # the key keeps a slow query on an older version from filling in a
+        # result for the newer one. Results are returned as tuples (or as
+        # LazyCases, which are read-only too), so a hit can hand out the cached
+        # result itself instead of a copy.
+        key = (current.number,) + key
+        found, results = self.query_cache.get(key)
+        if not found:
+            results = run_query()
+            if not isinstance(results, LazyCases):
+                results = tuple(results)
+            self.query_cache.put(key, results)
+        return results
+
+
+class SQLiteCaseArchive(CaseArchive):
+    # The CaseArchive API on top of a SQLite database file, for archives that
+    # do not fit in memory and should not be parsed from the CSV on every
+    # start. Searches, filters, range queries and sorts run as SQL over
+    # indexed columns, and rows are read back in batches and turned into Case
+    # objects as they are read. The position column keeps the archive order.
+    #
+    # Each thread gets its own connection. The database is in WAL mode, so
+    # queries see the last committed state and do not wait for a load, which
+    # builds new tables and swaps them in with a single transaction. Only one
+    # process should write to the database at a time.
+    case_columns = "case_id, date, suspect, victim, crime_type, severity, status"
+    sort_columns = {
+        "case_id": "case_id",
+        "date": "date",
+        "severity": "severity",
+        "status": "lower(status)",
+    }
+    stream_batch_size = 1000
+
+    def __init__(self, database="case_archive.db", cache_size=0):
+        # The in-memory indexes CaseArchive sets up stay empty; the cases are
+        # only in the database.
+        super().__init__(cache_size=cache_size)
+        self.database = database
+        self.connections = threading.local()
+
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        SQLiteCaseArchive.create_tables(connection)
+        SQLiteCaseArchive.create_indexes(connection)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.row_count = connection.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM cases"
+        ).fetchone()[0]
+        if self.row_count and not connection.execute(
+            "SELECT 1 FROM aggregates LIMIT 1"
+        ).fetchone():
+            # Databases written before the aggregates table existed.
+            SQLiteCaseArchive.in_transaction(
+                connection, lambda: SQLiteCaseArchive.rebuild_aggregates(connection)
+            )
+        self.version_number = int(self.read_meta("version") or 0)
+        self.name_indexes = {}
+
+    def connection(self):
+        connection = getattr(self.connections, "connection", None)
+        if connection is None:
+            # Transactions are started explicitly (see in_transaction).
+            connection = sqlite3.connect(self.database, isolation_level=None)
+            self.connections.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.connections, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.connections.connection = None
+
+    def create_tables(connection, prefix=""):
+        # Dates are stored as proleptic Gregorian ordinals, so that they sort
+        # and compare as integers. suspect_key and victim_key hold the
+        # normalized names. names has one entry per name and word the name can
+        # be found from with a prefix search (see NameIndex.add). aggregates
+        # holds the cells of CaseAggregates, with the position of the first
+        # case of each cell to keep them in first-seen order. Loads fill
+        # tables with the prefix "new_" and rename them when they are done.
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {prefix}cases ("
+            "position INTEGER PRIMARY KEY, "
+            "case_id INTEGER NOT NULL, "
+            "date INTEGER NOT NULL, "
+            "crime_type TEXT NOT NULL, "
+            "suspect TEXT NOT NULL, "
+            "victim TEXT NOT NULL, "
+            "suspect_key TEXT NOT NULL, "
+            "victim_key TEXT NOT NULL, "
+            "severity INTEGER NOT NULL, "
+            "status TEXT NOT NULL)"
+        )
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {prefix}names ("
+            "role TEXT NOT NULL, "
+            "word TEXT NOT NULL, "
+            "name TEXT NOT NULL, "
+            "PRIMARY KEY (role, word, name)) WITHOUT ROWID"
+        )
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {prefix}aggregates ("
+            "crime_type TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "severity INTEGER NOT NULL, "
+            "year INTEGER NOT NULL, "
+            "count INTEGER NOT NULL, "
+            "first_position INTEGER NOT NULL, "
+            "PRIMARY KEY (crime_type, status, severity, year)) WITHOUT ROWID"
+        )
+
+    def create_indexes(connection):
+        for column in (
+            "case_id",
+            "suspect_key",
+            "victim_key",
+            "crime_type",
+            "severity",
+            "status",
+            "date",
+        ):
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS cases_{column} ON cases ({column})"
+            )
+
+    def in_transaction(connection, work):
+        connection.execute("BEGIN")
+        try:
+            result = work()
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def read_meta(self, name):
+        row = self.connection().execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def write_meta(connection, name, value):
+        connection.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def insert_cases(connection, prefix, first_position, cases):
+        rows = []
+        names = set()
+        aggregates = CaseAggregates()
+        for position, case in enumerate(cases, first_position):
+            suspect_key = CaseArchive.normalize_name(case.suspect.name)
+            victim_key = CaseArchive.normalize_name(case.victim.name)
+            rows.append(
+                (
+                    position,
+                    case.case_id,
+                    case.date.toordinal(),
+                    case.crime_type,
+                    case.suspect.name,
+                    case.victim.name,
+                    suspect_key,
+                    victim_key,
+                    case.severity,
+                    case.status,
+                )
+            )
+            names.add(("suspect", suspect_key))
+            names.add(("victim", victim_key))
+            aggregates.add(case)
+
+        connection.executemany(
+            f"INSERT INTO {prefix}cases VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        name_rows = []
+        for role, name in names:
+            words = name.split(" ")
+            for i in range(len(words)):
+                name_rows.append((role, " ".join(words[i:]), name))
+        connection.executemany(
+            f"INSERT OR IGNORE INTO {prefix}names VALUES (?, ?, ?)", name_rows
+        )
+        SQLiteCaseArchive.add_aggregates(connection, prefix, aggregates, first_position)
+        return first_position + len(rows)
+
+    def add_aggregates(connection, prefix, aggregates, first_position):
+        # The pending cells are in first-seen order, so numbering them from
+        # first_position keeps that order across batches.
+        connection.executemany(
+            f"INSERT INTO {prefix}aggregates VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (crime_type, status, severity, year) "
+            "DO UPDATE SET count = count + excluded.count",
+            [
+                cell + (count, first_position + order)
+                for order, (cell, count) in enumerate(aggregates.pending.items())
+            ],
+        )
+
+    def rebuild_aggregates(connection):
+        connection.execute("DELETE FROM aggregates")
+        aggregates = CaseAggregates()
+        for crime_type, status, severity, date in connection.execute(
+            "SELECT crime_type, status, severity, date FROM cases ORDER BY position"
+        ):
+            aggregates.pending[
+                (crime_type, status, severity, datetime.fromordinal(date).year)
+            ] += 1
+        SQLiteCaseArchive.add_aggregates(connection, "", aggregates, 0)
+
+    def record_version(self, connection, row_count, source=False):
+        # Records a new version in the same transaction as the change. source
+        # is only written when it is given (None clears it).
+        self.pending_version = self.version_number + 1
+        SQLiteCaseArchive.write_meta(connection, "version", str(self.pending_version))
+        if source is not False:
+            SQLiteCaseArchive.write_meta(
+                connection, "source", CaseParser.encode_source(source)
+            )
+        self.pending_row_count = row_count
+
+    def publish(self):
+        self.version_number = self.pending_version
+        self.row_count = self.pending_row_count
+        self.name_indexes = {}
+
+    @property
+    def case_list(self):
+        return list(self.iter_cases())
+
+    @property
+    def version(self):
+        return self.version_number
+
+    def __len__(self):
+        return self.row_count
+
+    def add_cases(self, cases):
+        with self.write_lock:
+            start = time.perf_counter()
+            connection = self.connection()
+
+            def insert():
+                row_count = SQLiteCaseArchive.insert_cases(
+                    connection, "", self.row_count, cases
+                )
+                self.record_version(connection, row_count)
+
+            SQLiteCaseArchive.in_transaction(connection, insert)
+            self.publish()
+            instrumentation.count_rows(len(cases), time.perf_counter() - start)
+
+    def replace_with_batches(self, case_batches, source=None):
+        # Imports the batches into new tables, one transaction per batch, then
+        # swaps the new tables in. Queries keep reading the old tables until
+        # the swap is committed.
+        with self.write_lock:
+            start = time.perf_counter()
+            connection = self.connection()
+            connection.execute("DROP TABLE IF EXISTS new_cases")
+            connection.execute("DROP TABLE IF EXISTS new_names")
+            connection.execute("DROP TABLE IF EXISTS new_aggregates")
+            SQLiteCaseArchive.create_tables(connection, "new_")
+
+            row_count = 0
+            for batch in case_batches:
+                row_count = SQLiteCaseArchive.in_transaction(
+                    connection,
+                    lambda: SQLiteCaseArchive.insert_cases(
+                        connection, "new_", row_count, batch
+                    ),
+                )
+
+            def swap():
+                for table in ("cases", "names", "aggregates"):
+                    connection.execute(f"DROP TABLE {table}")
+                    connection.execute(f"ALTER TABLE new_{table} RENAME TO {table}")
+                SQLiteCaseArchive.create_indexes(connection)
+                self.record_version(connection, row_count, source)
+
+            SQLiteCaseArchive.in_transaction(connection, swap)
+            self.publish()
+            instrumentation.count_rows(row_count, time.perf_counter() - start)
+
+        return True
+
+    @instrumentation.timed("load_cases")
+    def load_cases(self, filepath):
+        source = {}
+        try:
+            return self.replace_with_batches(
+                CaseParser.iter_case_batches(filepath, 10000, self.interner, source),
+                source,
+            )
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+    def load_cases_streaming(self, filepath, batch_size=10000):
+        # Replaces the cases batch by batch, committing each batch, so queries
+        # see the new cases as they arrive. write_lock is released while the
+        # caller handles a batch, as in CaseArchive.load_cases_streaming.
+        # Committed batches are not rolled back: if loading fails or the
+        # caller stops early, the cases read so far stay, and as the source is
+        # only recorded at the end, the next refresh_cases reads the whole
+        # file again. A write made in the meantime ends the load where it is.
+        with self.write_lock:
+            connection = self.connection()
+
+            def clear():
+                connection.execute("DELETE FROM cases")
+                connection.execute("DELETE FROM names")
+                connection.execute("DELETE FROM aggregates")
+                self.record_version(connection, 0, None)
+
+            SQLiteCaseArchive.in_transaction(connection, clear)
+            self.publish()
+            version = self.version
+
+        source = {}
+        batches = CaseParser.iter_case_batches(
+            filepath, batch_size, self.interner, source
+        )
+        try:
+            while True:
+                with self.write_lock:
+                    if self.version != version:
+                        return
+                    batch = next(batches, None)
+                    if batch is None:
+                        SQLiteCaseArchive.in_transaction(
+                            connection,
+                            lambda: self.record_version(
+                                connection, self.row_count, source
+                            ),
+                        )
+                        self.publish()
+                        return
+                    self.add_cases(batch)
+                    version = self.version
+                yield batch
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+        finally:
+            batches.close()
+
+    @instrumentation.timed("load_cases_parallel")
+    def load_cases_parallel(self, filepath, workers=None):
+        # Parses the CSV in a process pool as CaseArchive.load_cases_parallel
+        # does, and imports each parsed range as one batch.
+        workers = workers or os.cpu_count() or 1
+        source = {}
+        try:
+            return self.replace_with_batches(
+                CaseParser.iter_parallel_case_batches(
+                    filepath, workers, self.interner, source
+                ),
+                source,
+            )
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+    @instrumentation.timed("refresh_cases")
+    def refresh_cases(self, filepath):
+        # As CaseArchive.refresh_cases. The file's identity and offset are kept
+        # in the database, so a refresh after a restart only reads new rows.
+        with self.write_lock:
+            start = time.perf_counter()
+            appended = None
+            source = CaseParser.decode_source(self.read_meta("source"))
+            if source:
+                try:
+                    appended = CaseParser.read_appended_cases(
+                        filepath, source, self.interner
+                    )
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        f"No CSV file found at filepath: {filepath}"
+                    )
+                except Exception as e:
+                    instrumentation.count("rows rejected")
+                    raise ValueError(f"Error loading cases: {str(e)}")
+
+            if appended is None:
+                self.load_cases(filepath)
+                return {"reloaded": True, "cases": len(self)}
+
+            cases, source = appended
+            if not cases:
+                return {"reloaded": False, "cases": 0}
+
+            connection = self.connection()
+
+            def insert():
+                row_count = SQLiteCaseArchive.insert_cases(
+                    connection, "", self.row_count, cases
+                )
+                self.record_version(connection, row_count, source)
+
+            SQLiteCaseArchive.in_transaction(connection, insert)
+            self.publish()
+            instrumentation.count_rows(len(cases), time.perf_counter() - start)
+            return {"reloaded": False, "cases": len(cases)}
+
+    @instrumentation.timed("load_snapshot")
+    def load_snapshot(self, path, source_path=None):
+        try:
+            case_list = CaseSnapshot.load(path, source_path, interner=self.interner)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No snapshot file found at filepath: {path}")
+
+        return self.replace_with_batches([case_list])
+
+    def memory_footprint(self):
+        # Cases live in the database file rather than in memory.
+        size = os.path.getsize(self.database)
+        return {"database": size, "total": size}
+
+    def stream_cases(self, query, parameters=()):
+        # Runs a SELECT of case_columns and yields Case objects, fetching
+        # stream_batch_size rows at a time.
+        cursor = self.connection().execute(query, parameters)
+        build_case = self.interner.build_case
+        while True:
+            rows = cursor.fetchmany(SQLiteCaseArchive.stream_batch_size)
+            if not rows:
+                break
+            for case_id, date, suspect, victim, crime_type, severity, status in rows:
+                yield build_case(
+                    case_id,
+                    datetime.fromordinal(date),
+                    suspect,
+                    victim,
+                    crime_type,
+                    severity,
+                    status,
+                )
+
+    def iter_cases(
+        self,
+        crime_type=None,
+        severity=None,
+        status=None,
+        start_date=None,
+        end_date=None,
+        min_severity=None,
+        max_severity=None,
+        sort_attribute=None,
+        reverse=False,
+        limit=None,
+    ):
+        # Streams the cases matching every given condition (range bounds are
+        # inclusive), in archive order or sorted as sort_cases would sort them.
+        conditions = []
+        parameters = []
+        for condition, value in (
+            ("crime_type = ?", crime_type),
+            ("severity = ?", severity),
+            ("status = ?", status),
+            ("date >= ?", start_date and start_date.toordinal()),
+            ("date <= ?", end_date and end_date.toordinal()),
+            ("severity >= ?", min_severity),
+            ("severity <= ?", max_severity),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        query = f"SELECT {SQLiteCaseArchive.case_columns} FROM cases"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        # Ties keep archive order, as they do with the (stable) merge sort.
+        order = []
+        if sort_attribute is not None:
+            for attribute, descending in SortingAlgorithm.sort_order(
+                sort_attribute, reverse
+            ):
+                column = SQLiteCaseArchive.sort_columns.get(attribute, "case_id")
+                order.append(f"{column} DESC" if descending else column)
+        order.append("position")
+        query += " ORDER BY " + ", ".join(order)
+
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(max(0, limit))
+
+        return self.stream_cases(query, parameters)
+
+    def load_crime_types(self):
+        return self.read_aggregates().values("crime_type")
+
+    def read_aggregates(self):
+        aggregates = CaseAggregates()
+        aggregates.cells = {
+            (crime_type, status, severity, year): count
+            for crime_type, status, severity, year, count in self.connection().execute(
+                "SELECT crime_type, status, severity, year, count FROM aggregates "
+                "ORDER BY first_position"
+            )
+        }
+        return aggregates
+
+    def summarize(
+        self, group_by=(), crime_type=None, status=None, severity=None, year=None
+    ):
+        return self.read_aggregates().summary(group_by, crime_type, status, severity, year)
+
+    @instrumentation.timed("search_suspect")
+    def search_suspect(self, suspect_name):
+        return self.search_name("suspect", suspect_name)
+
+    @instrumentation.timed("search_victim")
+    def search_victim(self, victim_name):
+        return self.search_name("victim", victim_name)
+
+    def search_name(self, role, name):
+        if self.no_cases():
+            return []
+
+        return list(
+            self.stream_cases(
+                f"SELECT {SQLiteCaseArchive.case_columns} FROM cases "
+                f"WHERE {role}_key = ? ORDER BY position",
+                (CaseArchive.normalize_name(name),),
+            )
+        )
+
+    @instrumentation.timed("search_names")
+    def search_names(self, search_type, name, limit):
+        if self.no_cases():
+            return []
+
+        role, match_type = search_type.split()
+        name_key = CaseArchive.normalize_name(name)
+        if match_type == "prefix":
+            # All words starting with the prefix lie between the prefix and the
+            # prefix with its last character incremented.
+            # Names are ranked as NameIndex.prefix_matches ranks them: by their
+            # first matching suffix (word), then by name.
+            query = "SELECT name FROM names WHERE role = ?"
+            parameters = [role]
+            if name_key:
+                query += " AND word >= ? AND word < ?"
+                parameters += [name_key, name_key[:-1] + chr(ord(name_key[-1]) + 1)]
+            query += " GROUP BY name ORDER BY MIN(word), name LIMIT ?"
+            parameters.append(limit)
+            names = sorted(
+                matching_name
+                for matching_name, in self.connection().execute(query, parameters)
+            )
+        else:
+            names = self.name_index(role).fuzzy_matches(name_key, limit)
+
+        results = []
+        for matching_name in names:
+            results.extend(self.search_name(role, matching_name))
+        return results
+
+    def name_index(self, role):
+        # Fuzzy search uses an in-memory NameIndex over the distinct
+        # names, which is built on first use and rebuilt after a change.
+        name_index = self.name_indexes.get(role)
+        if name_index is None:
+            name_index = NameIndex()
+            for name, in self.connection().execute(
+                "SELECT name FROM names WHERE role = ? AND word = name", (role,)
+            ):
+                name_index.add(name)
+            name_index.flush()
+            self.name_indexes[role] = name_index
+        return name_index
+
+    @instrumentation.timed("search_case_id")
+    def search_case_id(self, case_id):
+        if self.no_cases():
+            return []
+
+        return list(
+            self.stream_cases(
+                f"SELECT {SQLiteCaseArchive.case_columns} FROM cases "
+                "WHERE case_id = ? ORDER BY position LIMIT 1",
+                (case_id,),
+            )
+        )
+
+    @instrumentation.timed("filter_cases")
+    def filter_cases(self, crime_type, severity, status):
+        if self.no_cases():
+            return []
+
+        return list(self.iter_cases(crime_type, severity, status))
+
+    @instrumentation.timed("range_query")
+    def range_query(
+        self, start_date=None, end_date=None, min_severity=None, max_severity=None
+    ):
+        if self.no_cases():
+            return []
+
+        return list(
+            self.iter_cases(
+                start_date=start_date,
+                end_date=end_date,
+                min_severity=min_severity,
+                max_severity=max_severity,
+            )
+        )
+
+    @instrumentation.timed("sort_cases")
+    def sort_cases(self, sort_attribute, reverse=False):
+        if self.no_cases():
+            return []
+
+        return list(self.iter_cases(sort_attribute=sort_attribute, reverse=reverse))
+
+    @instrumentation.timed("top_cases")
+    def top_cases(
+        self,
+        k,
+        sort_attribute,
+        reverse=False,
+        crime_type=None,
+        severity=None,
+        status=None,
+    ):
+        if self.no_cases():
+            return []
+
+        return list(
+            self.iter_cases(
+                crime_type,
+                severity,
+                status,
+                sort_attribute=sort_attribute,
+                reverse=reverse,
+                limit=k,
+            )
+        )
+
+
+class PartitionedCaseArchive(CaseArchive):
+    # The CaseArchive API over cases split into partitions by date, one per
+    # period_years years. Each partition is a CaseArchive with its own
+    # indexes, stored in directory as a CaseSnapshot file. manifest.json lists
+    # the partitions with their date and case ID ranges, row counts and
+    # aggregate cells (see CaseAggregates), so summaries never load a
+    # partition, and queries skip the partitions that cannot hold a match
+    # (outside a date range, or without a case of the filtered crime type,
+    # severity or status) without loading them. Partitions are loaded when a
+    # query first needs them, and with max_resident set, only that many stay
+    # in memory, the least recently used going first.
+    #
+    # Results come partition by partition, oldest first, in file order within
+    # each partition. No global row order is kept, so unlike in CaseArchive a
+    # case in an older partition comes before one that was read earlier into
+    # a newer partition. Sorts and top-k queries are merged across
+    # partitions, and cases with equal sort keys come partition by partition
+    # in the same way.
+    #
+    # Loads stream the cases into one CaseSnapshotWriter per partition, which
+    # only keeps their column values, and the partitions kept in memory are
+    # loaded from the files written.
+    #
+    # Every change writes new partition files and a new manifest, which is
+    # published with a single assignment as in CaseArchive. The files of the
+    # previous manifest are kept until the next change, so queries that
+    # started before it can still load them.
+    manifest_name = "manifest.json"
+    manifest_format = 2  # partitions are version 2 snapshots
+
+    def __init__(self, directory="case_archive_partitions", period_years=1, max_resident=None):
+        if period_years < 1:
+            raise ValueError("The partition period must be at least one year.")
+        if max_resident is not None and max_resident < 1:
+            raise ValueError("At least one partition must be allowed in memory.")
+
+        # The in-memory indexes CaseArchive sets up stay empty; the cases are
+        # only in the partitions. Its interner is shared by all partitions, so
+        # a name or date that appears in many of them is only stored once.
+        super().__init__(cache_size=0)
+        self.directory = directory
+        self.period_years = period_years
+        self.max_resident = max_resident
+        self.partition_lock = threading.Lock()
+        self.resident = OrderedDict()
+
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self.read_manifest()
+        self.previous_manifest = None
+
+    def read_manifest(self):
+        path = os.path.join(self.directory, PartitionedCaseArchive.manifest_name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {
+                "format": PartitionedCaseArchive.manifest_format,
+                "version": 0,
+                "period_years": self.period_years,
+                "next_file": 0,
+                "source": None,
+                "partitions": [],
+            }
+
+        if manifest.get("format") != PartitionedCaseArchive.manifest_format:
+            raise ValueError(f"Unsupported partition manifest: {path}")
+        return manifest
+
+    def write_manifest(self, manifest):
+        path = os.path.join(self.directory, PartitionedCaseArchive.manifest_name)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(temporary_path, path)
+
+    @property
+    def case_list(self):
+        cases = []
+        for entry in self.manifest["partitions"]:
+            cases.extend(self.partition(entry).case_list)
+        return cases
+
+    @property
+    def version(self):
+        return self.manifest["version"]
+
+    def __len__(self):
+        return sum(entry["count"] for entry in self.manifest["partitions"])
+
+    def partition_start(date, period_years):
+        return date.year - date.year % period_years
+
+    def partition(self, entry):
+        # The CaseArchive of a manifest entry, loaded from its file on first use.
+        path = os.path.join(self.directory, entry["file"])
+        with self.partition_lock:
+            partition = self.resident.get(path)
+            if partition is not None:
+                self.resident.move_to_end(path)
+                return partition
+
+            partition = CaseArchive(cache_size=0)
+            partition.interner = self.interner
+            partition.load_snapshot(path)
+            instrumentation.count("partition loads")
+            self.keep_resident(path, partition)
+            return partition
+
+    def keep_resident(self, path, partition):
+        # Callers hold partition_lock.
+        self.resident[path] = partition
+        self.resident.move_to_end(path)
+        if self.max_resident is not None:
+            while len(self.resident) > self.max_resident:
+                self.resident.popitem(last=False)
+
+    def save_partition(self, manifest, start_year, writer):
+        # Writes the writer's cases to a new partition file and returns its
+        # entry, which is worked out from the writer's columns.
+        file = f"partition_{start_year}_{manifest['next_file']}.snapshot"
+        manifest["next_file"] += 1
+        writer.save(os.path.join(self.directory, file))
+
+        case_ids, dates, severities, _, _, crime_types, statuses = writer.columns
+        aggregates = CaseAggregates()
+        aggregates.add_columns(
+            crime_types, statuses, severities, dates, list(writer.strings)
+        )
+        aggregates.flush()
+        return {
+            "start_year": start_year,
+            "file": file,
+            "count": len(writer),
+            "first_date": min(dates),
+            "last_date": max(dates),
+            "first_case_id": min(case_ids),
+            "last_case_id": max(case_ids),
+            "cells": [list(cell) + [count] for cell, count in aggregates.cells.items()],
+        }
+
+    def write_partitions(self, manifest, writers):
+        # Saves each partition writer (by partition start year) as a
+        # partition and returns the new entries and the partitions to keep in
+        # memory. Only the most recent partitions that fit are loaded from
+        # their new files; the others are just written.
+        start_years = sorted(writers)
+        if self.max_resident is not None:
+            kept = set(start_years[max(0, len(start_years) - self.max_resident):])
+        else:
+            kept = set(start_years)
+
+        entries = {}
+        partitions = {}
+        for start_year in start_years:
+            writer = writers.pop(start_year)
+            entry = entries[start_year] = self.save_partition(manifest, start_year, writer)
+            if start_year in kept:
+                path = os.path.join(self.directory, entry["file"])
+                partition = CaseArchive(cache_size=0)
+                partition.interner = self.interner
+                partition.load_snapshot(path)
+                partitions[path] = partition
+        return entries, partitions
+
+    def publish_manifest(self, manifest, partitions):
+        # Callers hold write_lock.
+        self.write_manifest(manifest)
+        self.previous_manifest = self.manifest
+        self.manifest = manifest
+
+        files = {entry["file"] for entry in manifest["partitions"]}
+        with self.partition_lock:
+            for path in list(self.resident):
+                if os.path.basename(path) not in files:
+                    del self.resident[path]
+            for path, partition in partitions.items():
+                self.keep_resident(path, partition)
+
+        files.update(entry["file"] for entry in self.previous_manifest["partitions"])
+        for name in os.listdir(self.directory):
+            if (
+                name.startswith("partition_")
+                and name.endswith(".snapshot")
+                and name not in files
+            ):
+                os.remove(os.path.join(self.directory, name))
+
+    def next_manifest(self, source=False, period_years=None):
+        manifest = dict(self.manifest, version=self.manifest["version"] + 1)
+        if source is not False:
+            manifest["source"] = CaseParser.encode_source(source)
+        if period_years is not None:
+            manifest["period_years"] = period_years
+        return manifest
+
+    def group_batches(self, case_batches, writers, period_years, entries=None):
+        # Streams the cases of each batch into one CaseSnapshotWriter per
+        # partition start year and yields the batch, so only the writers'
+        # columns are kept, not the cases. A writer for a partition in entries
+        # (by start year) is given that partition's cases first.
+        for batch in case_batches:
+            for case in batch:
+                start_year = PartitionedCaseArchive.partition_start(
+                    case.date, period_years
+                )
+                writer = writers.get(start_year)
+                if writer is None:
+                    writer = writers[start_year] = CaseSnapshotWriter()
+                    if entries and start_year in entries:
+                        for previous in self.partition(entries[start_year]).case_list:
+                            writer.append(previous)
+                writer.append(case)
+            yield batch
+
+    def replace_partitions(self, writers, source=None):
+        # Replaces every partition with the writers' cases. Loads re-partition
+        # with this archive's period_years.
+        with self.write_lock:
+            manifest = self.next_manifest(source, self.period_years)
+            entries, partitions = self.write_partitions(manifest, writers)
+            manifest["partitions"] = [entries[start_year] for start_year in sorted(entries)]
+            self.publish_manifest(manifest, partitions)
+        return True
+
+    def add_cases(self, cases, source=False):
+        # Adds the cases to the partitions they fall in. Each partition that
+        # gets new cases is written again as a new file.
+        with self.write_lock:
+            manifest = self.next_manifest(source)
+            entries = {entry["start_year"]: entry for entry in manifest["partitions"]}
+            writers = {}
+            for _ in self.group_batches(
+                [cases], writers, manifest["period_years"], entries
+            ):
+                pass
+
+            new_entries, partitions = self.write_partitions(manifest, writers)
+            entries.update(new_entries)
+            manifest["partitions"] = [entries[start_year] for start_year in sorted(entries)]
+            self.publish_manifest(manifest, partitions)
+
+    @instrumentation.timed("load_cases")
+    def load_cases(self, filepath):
+        with self.write_lock:
+            start = time.perf_counter()
+            source = {}
+            writers = {}
+            try:
+                for _ in self.group_batches(
+                    CaseParser.iter_case_batches(filepath, 10000, self.interner, source),
+                    writers,
+                    self.period_years,
+                ):
+                    pass
+
+            except FileNotFoundError:
+                raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+            except Exception as e:
+                instrumentation.count("rows rejected")
+                raise ValueError(f"Error loading cases: {str(e)}")
+
+            row_count = sum(len(writer) for writer in writers.values())
+            self.replace_partitions(writers, source)
+            instrumentation.count_rows(row_count, time.perf_counter() - start)
+        return True
+
+    def load_cases_streaming(self, filepath, batch_size=10000):
+        # Yields each batch once it has been read. Partitions are only written
+        # once they are complete, so the new cases become visible together,
+        # when the whole file has been read, and a load that fails or is not
+        # read to the end leaves the archive as it was. The batches are read
+        # into this load's own writers, so write_lock is only taken to
+        # replace the partitions.
+        source = {}
+        writers = {}
+        try:
+            for batch in self.group_batches(
+                CaseParser.iter_case_batches(
+                    filepath, batch_size, self.interner, source
+                ),
+                writers,
+                self.period_years,
+            ):
+                yield batch
+
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+        except Exception as e:
+            instrumentation.count("rows rejected")
+            raise ValueError(f"Error loading cases: {str(e)}")
+
+        self.replace_partitions(writers, source)
+
+    @instrumentation.timed("load_cases_parallel")
+    def load_cases_parallel(self, filepath, workers=None):
+        workers = workers or os.cpu_count() or 1
+        with self.write_lock:
+            source = {}
+            writers = {}
+            try:
+                for _ in self.group_batches(
+                    CaseParser.iter_parallel_case_batches(
+                        filepath, workers, self.interner, source
+                    ),
+                    writers,
+                    self.period_years,
+                ):
+                    pass
+
+            except FileNotFoundError:
+                raise FileNotFoundError(f"No CSV file found at filepath: {filepath}")
+
+            except Exception as e:
+                instrumentation.count("rows rejected")
+                raise ValueError(f"Error loading cases: {str(e)}")
+
+            return self.replace_partitions(writers, source)
+
+    @instrumentation.timed("refresh_cases")
+    def refresh_cases(self, filepath):
+        # As CaseArchive.refresh_cases. The file's identity and offset are kept
+        # in the manifest, so a refresh after a restart only reads new rows.
+        with self.write_lock:
+            appended = None
+            source = CaseParser.decode_source(self.manifest["source"])
+            if source:
+                try:
+                    appended = CaseParser.read_appended_cases(
+                        filepath, source, self.interner
+                    )
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        f"No CSV file found at filepath: {filepath}"
+                    )
+                except Exception as e:
+                    instrumentation.count("rows rejected")
+                    raise ValueError(f"Error loading cases: {str(e)}")
 
-        for case in demo_data:
-            case_id = int(case["CaseID"])
-            date = datetime.strptime(case["Date"], "%m/%d/%Y")
-            suspect = Suspect(case["MainSuspect"])
-            victim = Victim(case["Victim"])
-            crime_type = case["CrimeType"]
-            severity = int(case["CaseSeverity"])
-            status = case["Status"]
-            new_case = Case(
-                case_id, date, suspect, victim, crime_type, severity, status
-            )
-            self.case_list.append(new_case)
+            if appended is None:
+                self.load_cases(filepath)
+                return {"reloaded": True, "cases": len(self)}
+
+            cases, source = appended
+            if cases:
+                self.add_cases(cases, source)
+            return {"reloaded": False, "cases": len(cases)}
+
+    @instrumentation.timed("load_snapshot")
+    def load_snapshot(self, path, source_path=None):
+        try:
+            case_list = CaseSnapshot.load(path, source_path, interner=self.interner)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"No snapshot file found at filepath: {path}")
+
+        writers = {}
+        for _ in self.group_batches([case_list], writers, self.period_years):
+            pass
+        return self.replace_partitions(writers)
+
+    def memory_footprint(self):
+        # Only the partitions in memory count.
+        with self.partition_lock:
+            partitions = list(self.resident.values())
+
+        footprint = {}
+        for partition in partitions:
+            for kind, size in partition.memory_footprint().items():
+                footprint[kind] = footprint.get(kind, 0) + size
+        footprint["resident_partitions"] = len(partitions)
+        return footprint
+
+    def manifest_aggregates(manifest):
+        aggregates = CaseAggregates()
+        for entry in manifest["partitions"]:
+            for crime_type, status, severity, year, count in entry["cells"]:
+                aggregates.pending[(crime_type, status, severity, year)] += count
+        aggregates.flush()
+        return aggregates
 
     def load_crime_types(self):
-        if not self.case_list:
-            return []
-        crime_types = []
-        for case in self.case_list:
-            crime_types.append(case.crime_type)
-        return list(set(crime_types))
+        return PartitionedCaseArchive.manifest_aggregates(self.manifest).values(
+            "crime_type"
+        )
 
-    def no_cases(self):
-        if len(self.case_list) == 0:
-            print("No cases found. Please load cases first.")
-            return True
+    def summarize(
+        self, group_by=(), crime_type=None, status=None, severity=None, year=None
+    ):
+        return PartitionedCaseArchive.manifest_aggregates(self.manifest).summary(
+            group_by, crime_type, status, severity, year
+        )
+
+    def matching_partitions(
+        self,
+        manifest,
+        start_date=None,
+        end_date=None,
+        crime_type=None,
+        severity=None,
+        status=None,
+        min_severity=None,
+        max_severity=None,
+    ):
+        # The manifest entries that can hold matching cases, decided from
+        # their date ranges and aggregate cells without loading them.
+        first = None if start_date is None else start_date.toordinal()
+        last = None if end_date is None else end_date.toordinal()
+
+        entries = []
+        for entry in manifest["partitions"]:
+            if first is not None and entry["last_date"] < first:
+                continue
+            if last is not None and entry["first_date"] > last:
+                continue
+            if any(
+                (crime_type is None or cell_crime_type == crime_type)
+                and (status is None or cell_status == status)
+                and (severity is None or cell_severity == severity)
+                and CaseArchive.in_range(cell_severity, min_severity, max_severity)
+                for cell_crime_type, cell_status, cell_severity, _, _ in entry["cells"]
+            ):
+                entries.append(entry)
 
+        instrumentation.count(
+            "partitions pruned", len(manifest["partitions"]) - len(entries)
+        )
+        return entries
+
+    def query_partitions(self, entries, run_query):
+        results = []
+        for entry in entries:
+            results.extend(run_query(self.partition(entry)))
+        return results
+
+    @instrumentation.timed("search_suspect")
     def search_suspect(self, suspect_name):
         if self.no_cases():
             return []
 
-        results = SearchAlgorithm.linear_search(self.case_list, "suspect", suspect_name)
-        if not results:
-            return []
-        else:
-            return results
+        return self.query_partitions(
+            self.manifest["partitions"],
+            lambda partition: partition.search_suspect(suspect_name),
+        )
 
+    @instrumentation.timed("search_victim")
     def search_victim(self, victim_name):
         if self.no_cases():
             return []
 
-        results = SearchAlgorithm.linear_search(self.case_list, "victim", victim_name)
-        if not results:
+        return self.query_partitions(
+            self.manifest["partitions"],
+            lambda partition: partition.search_victim(victim_name),
+        )
+
+    @instrumentation.timed("search_names")
+    def search_names(self, search_type, name, limit):
+        # Each partition's best matches are ranked again together. A name's
+        # rank depends only on the name (see NameIndex.prefix_matches and
+        # fuzzy_matches), so the best names overall are among the best of the
+        # partitions they occur in, and this gives the same names as one index
+        # over all partitions would.
+        if self.no_cases():
             return []
+
+        role, match_type = search_type.split()
+        name_key = CaseArchive.normalize_name(name)
+        candidates = NameIndex()
+        candidate_names = set()
+        partition_cases = []
+        for entry in self.manifest["partitions"]:
+            current = self.partition(entry).current
+            if role == "suspect":
+                name_index, case_index = current.suspect_names, current.suspect_index
+            else:
+                name_index, case_index = current.victim_names, current.victim_index
+
+            if match_type == "prefix":
+                names = name_index.prefix_matches(name_key, limit)
+            else:
+                names = name_index.fuzzy_matches(name_key, limit)
+
+            cases = {}
+            for matching_name in names:
+                if matching_name not in candidate_names:
+                    candidate_names.add(matching_name)
+                    candidates.add(matching_name)
+                cases[matching_name] = current.name_cases(case_index, matching_name)
+            partition_cases.append(cases)
+
+        candidates = candidates.freeze()
+        if match_type == "prefix":
+            names = candidates.prefix_matches(name_key, limit)
         else:
-            return results
+            names = candidates.fuzzy_matches(name_key, limit)
+
+        results = []
+        for matching_name in names:
+            for cases in partition_cases:
+                results.extend(cases.get(matching_name, ()))
+        return results
 
+    @instrumentation.timed("search_case_id")
     def search_case_id(self, case_id):
         if self.no_cases():
             return []
-        
-        self.case_list = SortingAlgorithm().merge_sort(self.case_list, "case_id")
-        results = SearchAlgorithm.binary_search(self.case_list, "case_id", case_id)
-        if not results:
-            return []
-        else:
-            return [results]
 
+        for entry in self.manifest["partitions"]:
+            if entry["first_case_id"] <= case_id <= entry["last_case_id"]:
+                results = self.partition(entry).search_case_id(case_id)
+                if results:
+                    return results
+        return []
+
+    @instrumentation.timed("filter_cases")
     def filter_cases(self, crime_type, severity, status):
         if self.no_cases():
             return []
 
-        results = []
-        for case in self.case_list:
-            if crime_type is not None and case.crime_type != crime_type:
-                continue
-
-            if severity is not None and case.severity != severity:
-                continue
+        return self.query_partitions(
+            self.matching_partitions(
+                self.manifest, crime_type=crime_type, severity=severity, status=status
+            ),
+            lambda partition: partition.filter_cases(crime_type, severity, status),
+        )
 
-            if status is not None and case.status != status:
-                continue
+    @instrumentation.timed("range_query")
+    def range_query(
+        self, start_date=None, end_date=None, min_severity=None, max_severity=None
+    ):
+        if self.no_cases():
+            return []
 
-            results.append(case)
+        start_date = CaseArchive.as_datetime(start_date)
+        end_date = CaseArchive.as_datetime(end_date)
+        return self.query_partitions(
+            self.matching_partitions(
+                self.manifest,
+                start_date,
+                end_date,
+                min_severity=min_severity,
+                max_severity=max_severity,
+            ),
+            lambda partition: partition.range_query(
+                start_date, end_date, min_severity, max_severity
+            ),
+        )
 
-        if not results:
+    @instrumentation.timed("sort_cases")
+    def sort_cases(self, sort_attribute, reverse=False):
+        if self.no_cases():
             return []
-        else:
-            return results
 
-    def sort_cases(self, sort_attribute):
+        sort_order = SortingAlgorithm.sort_order(sort_attribute, reverse)
+        entries = self.manifest["partitions"]
+        attribute, descending = sort_order[0]
+        if attribute == "date":
+            # Partitions cover consecutive date ranges, so sorting by date
+            # only needs the partitions' own sorts put one after the other.
+            if descending:
+                entries = entries[::-1]
+            return self.query_partitions(
+                entries, lambda partition: partition.sort_cases(sort_order)
+            )
+
+        return list(
+            heapq.merge(
+                *(self.partition(entry).sort_cases(sort_order) for entry in entries),
+                key=SortingAlgorithm.sort_key(sort_order),
+            )
+        )
+
+    @instrumentation.timed("top_cases")
+    def top_cases(
+        self,
+        k,
+        sort_attribute,
+        reverse=False,
+        crime_type=None,
+        severity=None,
+        status=None,
+    ):
         if self.no_cases():
             return []
 
-        results = SortingAlgorithm().merge_sort(self.case_list, sort_attribute)
+        sort_order = SortingAlgorithm.sort_order(sort_attribute, reverse)
+        entries = self.matching_partitions(
+            self.manifest, crime_type=crime_type, severity=severity, status=status
+        )
+        return list(
+            islice(
+                heapq.merge(
+                    *(
+                        self.partition(entry).top_cases(
+                            k, sort_order, False, crime_type, severity, status
+                        )
+                        for entry in entries
+                    ),
+                    key=SortingAlgorithm.sort_key(sort_order),
+                ),
+                k,
+            )
+        )
+
 
-        if not results:
-            return []
+# ------------------------ Export Classes ------------------------
+
+class CaseExporter:
+    # Writes cases, e.g. the results of a query, as CSV in the columns of
+    # case_archive.csv, as JSON Lines, or as a columnar binary snapshot that
+    # load_snapshot can read back (see CaseSnapshot).
+    #
+    # Cases are read batch_size at a time, so a generator such as
+    # SQLiteCaseArchive.iter_cases is exported without building a list. Each
+    # batch is formatted in one go and handed to a large file buffer. Dates,
+    # crime types, statuses and names repeat across cases, so their formatted
+    # text is cached instead of being made again for every row.
+    formats = {".csv": "csv", ".jsonl": "jsonl", ".snapshot": "snapshot"}
+    batch_size = 10000
+    buffer_size = 1024 * 1024
+    max_cached_strings = 100000
+
+    def __init__(self):
+        self.date_strings = {}
+        self.json_strings = {}
+
+    def path_format(path):
+        output_format = CaseExporter.formats.get(os.path.splitext(path)[1].lower())
+        if output_format is None:
+            raise ValueError(
+                f"Cannot tell the export format of {path}. "
+                "Use a .csv, .jsonl or .snapshot file."
+            )
+        return output_format
+
+    def batches(cases):
+        cases = iter(cases)
+        while True:
+            batch = list(islice(cases, CaseExporter.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def format_date(self, date):
+        text = self.date_strings.get(date)
+        if text is None:
+            text = self.date_strings[date] = date.strftime("%d/%m/%Y")
+        return text
+
+    def json_string(self, value):
+        text = self.json_strings.get(value)
+        if text is None:
+            if len(self.json_strings) >= CaseExporter.max_cached_strings:
+                self.json_strings.clear()
+            text = self.json_strings[value] = json.dumps(value)
+        return text
+
+    def csv_rows(self, cases, leading=()):
+        # The cases as rows in the columns of case_archive.csv, each after the
+        # leading values.
+        format_date = self.format_date
+        return [
+            leading
+            + (
+                case.case_id,
+                format_date(case.date),
+                case.crime_type,
+                case.suspect.name,
+                case.victim.name,
+                case.severity,
+                case.status,
+            )
+            for case in cases
+        ]
+
+    def jsonl_text(self, cases, leading=""):
+        # The cases as JSON Lines text, the records laid out as json.dumps lays
+        # out Case.to_record(). leading is inserted at the start of every
+        # record, e.g. '"Query": 1, '.
+        format_date = self.format_date
+        json_string = self.json_string
+        return "".join(
+            [
+                f'{{{leading}"CaseID": {case.case_id}, '
+                f'"Date": "{format_date(case.date)}", '
+                f'"CrimeType": {json_string(case.crime_type)}, '
+                f'"MainSuspect": {json_string(case.suspect.name)}, '
+                f'"Victim": {json_string(case.victim.name)}, '
+                f'"CaseSeverity": {case.severity}, '
+                f'"Status": {json_string(case.status)}}}\n'
+                for case in cases
+            ]
+        )
+
+    def write_csv(self, cases, output, header=True):
+        # Writes the cases to the text file object output and returns how many
+        # there were.
+        writer = csv.writer(output, lineterminator="\n")
+        if header:
+            writer.writerow(CaseParser.columns)
+        count = 0
+        for batch in CaseExporter.batches(cases):
+            writer.writerows(self.csv_rows(batch))
+            count += len(batch)
+        return count
+
+    def write_jsonl(self, cases, output):
+        count = 0
+        for batch in CaseExporter.batches(cases):
+            output.write(self.jsonl_text(batch))
+            count += len(batch)
+        return count
+
+    @instrumentation.timed("export_cases")
+    def export(self, cases, path, output_format=None):
+        # Writes the cases to path and returns how many there were. Without an
+        # output_format ("csv", "jsonl" or "snapshot") it follows from the file
+        # extension. The file is written under a temporary name and renamed
+        # when it is complete, so a failed export never leaves half a file.
+        output_format = output_format or CaseExporter.path_format(path)
+        if output_format == "snapshot":
+            count = CaseSnapshot.save(cases, path)
+        elif output_format in ("csv", "jsonl"):
+            temporary_path = f"{path}.tmp"
+            try:
+                with open(
+                    temporary_path,
+                    "w",
+                    encoding="utf-8",
+                    newline="",
+                    buffering=CaseExporter.buffer_size,
+                ) as output:
+                    if output_format == "csv":
+                        count = self.write_csv(cases, output)
+                    else:
+                        count = self.write_jsonl(cases, output)
+            except Exception:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+            os.replace(temporary_path, path)
         else:
-            return results
+            raise ValueError("Export format must be 'csv', 'jsonl' or 'snapshot'.")
+
+        instrumentation.count("rows exported", count)
+        return count
 
 
 # ------------------------ Application ------------------------
 
 class Application():
+    sort_choices = {
+        "1": ("case_id", "case ID"),
+        "2": ("date", "date"),
+        "3": ("severity", "severity"),
+        "4": ("status", "status"),
+    }
+
     def __init__(self):
         self.case_archive = CaseArchive()
-        
-    def print_case_results(self, cases):
-        if not cases:
+        # The results shown last, for the export option.
+        self.last_results = []
+
+    def ask_descending(self):
+        while True:
+            order_choice = input("Sort in descending order? (y/n): ").strip().lower()
+            if order_choice in ("y", "yes"):
+                return True
+            elif order_choice in ("n", "no", ""):
+                return False
+            print("Invalid choice. Please enter y or n.")
+
+    def choose_crime_type(self, allow_any=False):
+        while True:
+            print("Select a crime type:")
+
+            crime_types = self.case_archive.load_crime_types()
+            for i, crime_type in enumerate(crime_types):
+                print(f"{i + 1}. {crime_type}")
+
+            crime_type = input("Enter crime type: ").strip()
+            if allow_any and not crime_type:
+                return None
+
+            try:
+                crime_type = int(crime_type)
+
+            except ValueError:
+                print("Invalid choice. Please try again.")
+                continue
+
+            if crime_type < 1 or crime_type > len(crime_types):
+                print("Invalid choice. Please try again.")
+                continue
+
+            return crime_types[crime_type - 1]
+
+    def choose_status(self, allow_any=False):
+        while True:
+            print("Status options: Unsolved, Solved")
+            print("1. Unsolved")
+            print("2. Solved")
+            status_choice = input(
+                "Select Status to filter (1 Unsolved, 2 Solved): "
+            ).strip()
+
+            if allow_any and not status_choice:
+                return None
+            elif status_choice == "1":
+                return "Unsolved"
+            elif status_choice == "2":
+                return "Solved"
+            else:
+                print("Invalid choice. Please try again.")
+                continue
+
+    def ask_optional_severity(self, prompt):
+        while True:
+            severity = input(prompt).strip()
+            if not severity:
+                return None
+            try:
+                return int(severity)
+            except ValueError:
+                print("Severity must be an integer.")
+
+    def ask_optional_date(self, prompt):
+        while True:
+            date_string = input(prompt).strip()
+            if not date_string:
+                return None
+            try:
+                return CaseParser.parse_date(date_string)
+            except ValueError as e:
+                print(str(e))
+
+    def similar_name_results(self, role, name):
+        # Without an exact match, show the cases for names that start with the
+        # input (at the start of any word), or else for names a few edits away.
+        if role == "suspect":
+            results = self.case_archive.search_suspect_prefix(name)
+            if not results:
+                results = self.case_archive.search_suspect_fuzzy(name)
+        else:
+            results = self.case_archive.search_victim_prefix(name)
+            if not results:
+                results = self.case_archive.search_victim_fuzzy(name)
+
+        if results:
+            print(f"\nNo exact match for {name}. Showing cases for similar {role} names.")
+        return results
+
+    def print_no_results(self):
+        if len(self.case_archive) == 0:
+            print("\nNo cases found. Please load cases first.\n")
+        else:
             print("\nNo results found.\n")
 
+    def print_case_results(self, cases, page_size=20):
+        self.last_results = cases
+        if not cases:
+            self.print_no_results()
+
         else:
+            # Only the rows of the pages actually shown are formatted.
             print("\n--- Cases Found ---")
-            for case in cases:
-                print(case.__str__())
+            cursor = None
+            shown = 0
+            while True:
+                page, cursor = self.case_archive.paginate(cases, cursor, page_size)
+                for case in page:
+                    print(case.__str__())
+                shown += len(page)
+
+                if cursor is None:
+                    break
+
+                more = input(
+                    f"Showing {shown} of {len(cases)} cases. "
+                    "Press Enter for more, or q to stop: "
+                ).strip().lower()
+                if more == "q":
+                    break
             print("----------\n")
 
+    def print_summary(self, summary, group_by):
+        if not summary:
+            self.print_no_results()
+            return
+
+        print("\n--- Summary ---")
+        headers = [dimension.replace("_", " ").title() for dimension in group_by]
+        print(
+            "".join(f"{header:14}" for header in headers)
+            + f"{'Cases':>8} {'Min':>5} {'Mean':>6} {'Max':>5}"
+        )
+        for group, statistics in summary.items():
+            print(
+                "".join(f"{str(value):14}" for value in group)
+                + f"{statistics['count']:8} {statistics['min_severity']:5} "
+                f"{statistics['mean_severity']:6.2f} {statistics['max_severity']:5}"
+            )
+        print("----------\n")
+
+    def export_results(self):
+        print("\n=== Export Results ===")
+        if not self.last_results:
+            print("No results to export. Run a search, filter or sort first.")
+            return
+
+        print(f"Exports the {len(self.last_results)} cases found last.")
+        print("1. CSV (columns of case_archive.csv)")
+        print("2. JSON Lines")
+        print("3. Columnar binary snapshot")
+        print("4. Back to Main Menu")
+        formats = {"1": "csv", "2": "jsonl", "3": "snapshot"}
+        while True:
+            choice = input("Enter your choice: ").strip()
+            if choice == "4":
+                return
+            if choice in formats:
+                break
+            print("Invalid choice. Please try again.")
+
+        output_format = formats[choice]
+        default_path = f"results.{output_format}"
+        path = input(f"Enter file name (default {default_path}): ").strip() or default_path
+        start = time.perf_counter()
+        try:
+            count = CaseExporter().export(self.last_results, path, output_format)
+        except (OSError, ValueError) as e:
+            print(f"Export failed: {str(e)}")
+            return
+        print(
+            f"Exported {count} cases to {path} in "
+            f"{(time.perf_counter() - start) * 1000:.3f} ms."
+        )
+
+    def instrumentation_menu(self):
+        while True:
+            print("\n=== Instrumentation ===")
+            print(f"Instrumentation is {'on' if instrumentation.enabled else 'off'}.")
+            print("1. Show Report")
+            print("2. Turn On")
+            print("3. Turn On with Profiling and Memory Tracing")
+            print("4. Turn Off")
+            print("5. Reset")
+            print("6. Back to Main Menu")
+
+            choice = input("Enter your choice: ").strip()
+
+            if choice == "1":
+                report = self.case_archive.instrumentation_report()
+                print()
+                print(Instrumentation.format_report(report))
+                print(
+                    f"Query cache: {report['cache']['hits']} hits, "
+                    f"{report['cache']['misses']} misses"
+                )
+
+            elif choice == "2":
+                instrumentation.enable()
+                print("Instrumentation turned on.")
+
+            elif choice == "3":
+                instrumentation.enable(profile=True, trace_memory=True)
+                print("Instrumentation, profiling and memory tracing turned on.")
+
+            elif choice == "4":
+                instrumentation.disable()
+                print("Instrumentation turned off.")
+
+            elif choice == "5":
+                instrumentation.reset()
+                print("Instrumentation reset.")
+
+            elif choice == "6":
+                break
+
+            else:
+                print("Invalid choice. Please try again.")
+
     def menu(self):
         run = True
         while True:
@@ -371,7 +5114,10 @@ class Application():
                 print("3. Search for Case ID")
                 print("4. Filter Cases")
                 print("5. Sort Cases")
-                print("6. Exit")
+                print("6. Summary Statistics")
+                print("7. Instrumentation")
+                print("8. Export Results")
+                print("9. Exit")
 
                 choice = input("Enter your choice: ").strip()
 
@@ -388,6 +5134,8 @@ class Application():
                     print("Enter suspect name: ")
                     suspect_name = input("Enter suspect name: ").strip().upper()
                     results = self.case_archive.search_suspect(suspect_name)
+                    if not results:
+                        results = self.similar_name_results("suspect", suspect_name)
                     print(f"\n=== Results for suspect: {suspect_name} ===")
                     self.print_case_results(results)
                     continue
@@ -405,6 +5153,8 @@ class Application():
                     print("Enter victim name: ")
                     victim_name = input("Enter victim name: ").strip().upper()
                     results = self.case_archive.search_victim(victim_name)
+                    if not results:
+                        results = self.similar_name_results("victim", victim_name)
                     print(f"\n=== Results for victim: {victim_name} ===")
                     self.print_case_results(results)
                     continue
@@ -435,35 +5185,15 @@ class Application():
                         print("1. Filter by Crime Type")
                         print("2. Filter by Severity")
                         print("3. Filter by Status")
-                        print("4. Back")
+                        print("4. Combined Filter")
+                        print("5. Filter by Date and Severity Range")
+                        print("6. Back")
 
                         filter_choice = input("Enter your choice: ").strip()
 
                         if filter_choice == "1":
-                            while True:
-                                print("\n=== Filter by Crime Type ===")
-                                print("Select a crime type:")
-
-                                crime_types = self.case_archive.load_crime_types()
-                                for i, crime_type in enumerate(crime_types):
-                                    print(f"{i + 1}. {crime_type}")
-
-                                crime_type = input("Enter crime type: ").strip()
-
-                                try:
-                                    crime_type = int(crime_type)
-
-                                except ValueError:
-                                    print("Invalid choice. Please try again.")
-                                    continue
-
-                                if crime_type < 1 or crime_type > len(crime_types):
-                                    print("Invalid choice. Please try again.")
-                                    continue
-
-                                crime_type = crime_types[crime_type - 1]
-                                break
-
+                            print("\n=== Filter by Crime Type ===")
+                            crime_type = self.choose_crime_type()
                             results = self.case_archive.filter_cases(crime_type, None, None)
                             print(f"\n=== Results for crime type: {crime_type} ===")
                             self.print_case_results(results)
@@ -483,29 +5213,62 @@ class Application():
                             break
 
                         elif filter_choice == "3":
-                            while True:
-                                print("\n=== Filter by Status ===")
-                                print("Status options: Unsolved, Solved")
-                                print("1. Unsolved")
-                                print("2. Solved")
-                                status_choice = input(
-                                    "Select Status to filter (1 Unsolved, 2 Solved): "
-                                ).strip()
-
-                                if status_choice == "1":
-                                    status = "Unsolved"
-                                elif status_choice == "2":
-                                    status = "Solved"
-                                else:
-                                    print("Invalid choice. Please try again.")
-                                    continue
-
-                                results = self.case_archive.filter_cases(None, None, status)
-                                print(f"\n=== Results for status: {status} ===")
-                                self.print_case_results(results)
-                                break
+                            print("\n=== Filter by Status ===")
+                            status = self.choose_status()
+                            results = self.case_archive.filter_cases(None, None, status)
+                            print(f"\n=== Results for status: {status} ===")
+                            self.print_case_results(results)
+                            break
 
                         elif filter_choice == "4":
+                            print("\n=== Combined Filter ===")
+                            print("Leave a field empty to match any value.")
+                            crime_type = self.choose_crime_type(allow_any=True)
+                            severity = self.ask_optional_severity(
+                                "Enter severity (1-10): "
+                            )
+                            status = self.choose_status(allow_any=True)
+
+                            results = self.case_archive.filter_cases(
+                                crime_type, severity, status
+                            )
+                            description = ", ".join(
+                                f"{label}: {value}"
+                                for label, value in (
+                                    ("crime type", crime_type),
+                                    ("severity", severity),
+                                    ("status", status),
+                                )
+                                if value is not None
+                            )
+                            print(f"\n=== Results for {description or 'all cases'} ===")
+                            self.print_case_results(results)
+                            break
+
+                        elif filter_choice == "5":
+                            print("\n=== Filter by Date and Severity Range ===")
+                            print("Bounds are inclusive. Leave a field empty for no bound.")
+                            start_date = self.ask_optional_date(
+                                "Enter start date (DD/MM/YYYY): "
+                            )
+                            end_date = self.ask_optional_date(
+                                "Enter end date (DD/MM/YYYY): "
+                            )
+                            min_severity = self.ask_optional_severity(
+                                "Enter minimum severity: "
+                            )
+                            max_severity = self.ask_optional_severity(
+                                "Enter maximum severity: "
+                            )
+
+                            results = self.case_archive.range_query(
+                                start_date, end_date, min_severity, max_severity
+                            )
+                            print("\n=== Results for the selected date and severity range ===")
+                            self.print_case_results(results)
+                            break
+
+                        elif filter_choice == "6":
                             break
 
                         else:
@@ -519,35 +5282,71 @@ class Application():
                         print("2. Sort by Date")
                         print("3. Sort by Severity")
                         print("4. Sort by Status")
-                        print("5. Back")
+                        print("5. Sort by Multiple Attributes")
+                        print("6. Top Cases")
+                        print("7. Back")
 
                         sort_choice = input("Enter your choice: ").strip()
 
-                        if sort_choice == "1":
-                            results = self.case_archive.sort_cases("case_id")
-                            print(f"\n=== Results sorted by case ID ===")
+                        if sort_choice in self.sort_choices:
+                            sort_attribute, label = self.sort_choices[sort_choice]
+                            reverse = self.ask_descending()
+                            results = self.case_archive.sort_cases(
+                                sort_attribute, reverse
+                            )
+                            order = "descending" if reverse else "ascending"
+                            print(f"\n=== Results sorted by {label} ({order}) ===")
                             self.print_case_results(results)
                             break
 
-                        elif sort_choice == "2":
-                            results = self.case_archive.sort_cases("date")
-                            print(f"\n=== Results sorted by date ===")
+                        elif sort_choice == "5":
+                            print("\n=== Sort by Multiple Attributes ===")
+                            print("Attributes: case_id, date, severity, status")
+                            print("Example: severity desc, date asc")
+                            try:
+                                sort_keys = SortingAlgorithm.parse_sort_keys(
+                                    input("Enter sort order: ")
+                                )
+                            except ValueError as e:
+                                print(str(e))
+                                continue
+                            results = self.case_archive.sort_cases(sort_keys)
+                            description = ", ".join(
+                                f"{attribute} {'desc' if descending else 'asc'}"
+                                for attribute, descending in sort_keys
+                            )
+                            print(f"\n=== Results sorted by {description} ===")
                             self.print_case_results(results)
                             break
 
-                        elif sort_choice == "3":
-                            results = self.case_archive.sort_cases("severity")
-                            print(f"\n=== Results sorted by severity ===")
-                            self.print_case_results(results)
-                            break
+                        elif sort_choice == "6":
+                            print("\n=== Top Cases ===")
+                            try:
+                                k = int(input("How many cases? ").strip())
+                            except ValueError:
+                                print("The number of cases must be an integer.")
+                                continue
+                            print("Attributes: case_id, date, severity, status")
+                            print("Example: severity desc, date asc")
+                            try:
+                                sort_keys = SortingAlgorithm.parse_sort_keys(
+                                    input("Enter sort order: ")
+                                )
+                            except ValueError as e:
+                                print(str(e))
+                                continue
+                            print("Leave a field empty to include all cases.")
+                            crime_type = self.choose_crime_type(allow_any=True)
+                            status = self.choose_status(allow_any=True)
 
-                        elif sort_choice == "4":
-                            results = self.case_archive.sort_cases("status")
-                            print(f"\n=== Results sorted by status ===")
+                            results = self.case_archive.top_cases(
+                                k, sort_keys, crime_type=crime_type, status=status
+                            )
+                            print(f"\n=== Top {k} cases ===")
                             self.print_case_results(results)
                             break
 
-                        elif sort_choice == "5":
+                        elif sort_choice == "7":
                             break
 
                         else:
@@ -555,6 +5354,36 @@ class Application():
                             continue
 
                 elif choice == "6":
+                    print("\n=== Summary Statistics ===")
+                    print("Group by any of: crime_type, status, severity, year")
+                    print("Example: crime_type, status (leave empty for all cases)")
+                    try:
+                        group_by = CaseAggregates.parse_dimensions(
+                            input("Enter grouping: ")
+                        )
+                    except ValueError as e:
+                        print(str(e))
+                        continue
+                    print("Leave a field empty to include all cases.")
+                    crime_type = self.choose_crime_type(allow_any=True)
+                    status = self.choose_status(allow_any=True)
+                    self.print_summary(
+                        self.case_archive.summarize(
+                            group_by, crime_type=crime_type, status=status
+                        ),
+                        group_by,
+                    )
+                    continue
+
+                elif choice == "7":
+                    self.instrumentation_menu()
+                    continue
+
+                elif choice == "8":
+                    self.export_results()
+                    continue
+
+                elif choice == "9":
                     run = False
                     break
 
@@ -567,6 +5396,25 @@ class Application():
             )
             break
      
+    def load_archive(self, filepath, snapshot_path):
+        # Restarts map the binary snapshot while it is still current. Otherwise
+        # the CSV is parsed and a fresh snapshot is written for the next start.
+        if CaseSnapshot.is_current(snapshot_path, filepath):
+            try:
+                self.case_archive.load_snapshot(snapshot_path, filepath)
+                print(f"Loaded cases from snapshot at filepath: {snapshot_path}")
+                return
+            except (OSError, ValueError) as e:
+                print(f"Snapshot could not be used: {str(e)}")
+
+        print(f"Loading cases from case_archive at filepath: {filepath}")
+        self.case_archive.load_cases(filepath)
+
+        try:
+            self.case_archive.save_snapshot(snapshot_path, filepath)
+        except (OSError, ValueError):
+            pass  # Without a snapshot the next start simply parses the CSV again.
+
     def run(self):
         while True:
             print(
@@ -583,10 +5431,8 @@ class Application():
             user_choice = input("Enter choice: ").strip()
 
             if user_choice == "1":
-                print("Loading cases from case_archive at filepath: case_archive.csv")
-
                 try:
-                    self.case_archive.load_cases("case_archive.csv")
+                    self.load_archive("case_archive.csv", "case_archive.snapshot")
                     print("Cases loaded successfully.")
                     self.menu()
                     break
@@ -622,7 +5468,375 @@ class Application():
                 continue
 
 
+# ------------------------ Batch Mode ------------------------
+
+class BatchRunner:
+    # Runs queries from a file against one loaded archive, one query per line:
+    #
+    #   suspect Unknown
+    #   victim Jane Doe
+    #   case_id 84435
+    #   filter crime_type=Arson severity=7 status=Unsolved
+    #   range start=01/01/1983 end=30/06/1985 min_severity=7
+    #   sort severity desc, date asc
+    #   top 50 severity desc status=Unsolved
+    #
+    # Option values with spaces are quoted, as in a shell:
+    # filter crime_type="Grand Theft". Names are the rest of the line.
+    # Empty lines and lines starting with # are skipped.
+    def __init__(self, case_archive, output_format="csv", output=None, timings=None):
+        if output_format not in ("csv", "jsonl"):
+            raise ValueError("Output format must be 'csv' or 'jsonl'.")
+
+        self.case_archive = case_archive
+        self.output_format = output_format
+        self.output = output or sys.stdout
+        self.timings = timings or sys.stderr
+        self.csv_writer = csv.writer(self.output, lineterminator="\n")
+        self.exporter = CaseExporter()
+
+    def split_words(text):
+        try:
+            return shlex.split(text)
+        except ValueError as e:
+            raise ValueError(f"Invalid quoting in '{text}': {str(e)}")
+
+    def parse_options(words, allowed):
+        options = {}
+        for word in words:
+            name, separator, value = word.partition("=")
+            if not separator or name not in allowed:
+                raise ValueError(f"Unknown option: {word}")
+            options[name] = value
+        return options
+
+    def run_query(self, query):
+        operation, _, argument = query.strip().partition(" ")
+        argument = argument.strip()
+
+        if operation == "suspect":
+            return self.case_archive.search_suspect(argument)
+
+        elif operation == "victim":
+            return self.case_archive.search_victim(argument)
+
+        elif operation == "case_id":
+            try:
+                case_id = int(argument)
+            except ValueError:
+                raise ValueError("Case ID must be an integer.")
+            return self.case_archive.search_case_id(case_id)
+
+        elif operation == "filter":
+            options = BatchRunner.parse_options(
+                BatchRunner.split_words(argument), ("crime_type", "severity", "status")
+            )
+            try:
+                severity = int(options["severity"]) if "severity" in options else None
+            except ValueError:
+                raise ValueError("Severity must be an integer.")
+            return self.case_archive.filter_cases(
+                options.get("crime_type"), severity, options.get("status")
+            )
+
+        elif operation == "range":
+            options = BatchRunner.parse_options(
+                BatchRunner.split_words(argument),
+                ("start", "end", "min_severity", "max_severity"),
+            )
+            try:
+                min_severity = options.get("min_severity")
+                max_severity = options.get("max_severity")
+                min_severity = int(min_severity) if min_severity else None
+                max_severity = int(max_severity) if max_severity else None
+            except ValueError:
+                raise ValueError("Severity must be an integer.")
+            start_date = options.get("start")
+            end_date = options.get("end")
+            return self.case_archive.range_query(
+                CaseParser.parse_date(start_date) if start_date else None,
+                CaseParser.parse_date(end_date) if end_date else None,
+                min_severity,
+                max_severity,
+            )
+
+        elif operation == "sort":
+            sort_keys = SortingAlgorithm.parse_sort_keys(argument)
+            return self.case_archive.sort_cases(sort_keys)
+
+        elif operation == "top":
+            count, _, rest = argument.partition(" ")
+            try:
+                k = int(count)
+            except ValueError:
+                raise ValueError("The number of cases must be an integer.")
+
+            words = BatchRunner.split_words(rest)
+            filter_words = [word for word in words if "=" in word]
+            sort_text = " ".join(word for word in words if "=" not in word)
+            options = BatchRunner.parse_options(filter_words, ("crime_type", "status"))
+            return self.case_archive.top_cases(
+                k,
+                SortingAlgorithm.parse_sort_keys(sort_text),
+                crime_type=options.get("crime_type"),
+                status=options.get("status"),
+            )
+
+        else:
+            raise ValueError(f"Unknown query type: {operation}")
+
+    def write_results(self, query_number, cases):
+        for batch in CaseExporter.batches(cases):
+            if self.output_format == "csv":
+                self.csv_writer.writerows(
+                    self.exporter.csv_rows(batch, (query_number,))
+                )
+            else:
+                self.output.write(
+                    self.exporter.jsonl_text(batch, f'"Query": {query_number}, ')
+                )
+
+    def run(self, query_lines):
+        if self.output_format == "csv":
+            self.csv_writer.writerow(("Query",) + CaseParser.columns)
+
+        query_number = 0
+        for line in query_lines:
+            query = line.strip()
+            if not query or query.startswith("#"):
+                continue
+            query_number += 1
+
+            start = time.perf_counter()
+            try:
+                results = self.run_query(query)
+            except ValueError as e:
+                print(
+                    f"Query {query_number} failed ({query}): {str(e)}",
+                    file=self.timings,
+                )
+                continue
+            elapsed = time.perf_counter() - start
+
+            self.write_results(query_number, results)
+            print(
+                f"Query {query_number} ({query}): {len(results)} results "
+                f"in {elapsed * 1000:.3f} ms",
+                file=self.timings,
+            )
+
+        self.output.flush()
+        return query_number
+
+
+def open_archive(
+    filepath,
+    backend="memory",
+    database=None,
+    workers=None,
+    columnar=False,
+    partitions=None,
+    period_years=1,
+    max_resident=None,
+    lazy=False,
+):
+    # Loads the CSV file into an archive with the given backend. A SQLite
+    # database or partition directory that was loaded from the file before
+    # only reads rows appended to it since.
+    if backend != "memory" and (workers or columnar or lazy):
+        raise ValueError(
+            "--workers, --columnar and --lazy can only be used with the memory backend."
+        )
+
+    if backend == "sqlite":
+        case_archive = SQLiteCaseArchive(database or "case_archive.db")
+        case_archive.refresh_cases(filepath)
+        return case_archive
+
+    if backend == "partitioned":
+        case_archive = PartitionedCaseArchive(
+            partitions or "case_archive_partitions", period_years, max_resident
+        )
+        case_archive.refresh_cases(filepath)
+        return case_archive
+
+    case_archive = CaseArchive(columnar=columnar, lazy=lazy)
+    if workers:
+        case_archive.load_cases_parallel(filepath, workers)
+    else:
+        case_archive.load_cases(filepath)
+    return case_archive
+
+
+def external_sort(arguments):
+    start = time.perf_counter()
+    output = sys.stdout
+    try:
+        sort_keys = SortingAlgorithm.parse_sort_keys(arguments.external_sort)
+        sorter = ExternalMergeSort(arguments.memory_limit * 1024 * 1024)
+        if arguments.output:
+            output = open(arguments.output, "w", encoding="utf-8", newline="")
+        count = sorter.write_sorted(arguments.archive, output, sort_keys)
+    except (OSError, ValueError) as e:
+        print(f"Failed to sort cases: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"Sorted {count} cases in {(time.perf_counter() - start) * 1000:.3f} ms",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="MDA Case Archive Management System. Without --queries the "
+        "interactive menu is started."
+    )
+    parser.add_argument(
+        "--archive", default="case_archive.csv", help="CSV file to load"
+    )
+    parser.add_argument(
+        "--queries", help="file with one query per line ('-' for stdin)"
+    )
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument(
+        "--output", help="file to write results to (default: stdout)"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="load the CSV with this many processes"
+    )
+    parser.add_argument(
+        "--columnar", action="store_true", help="use the NumPy columnar store"
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="only build the cases that queries return, when they are read",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("memory", "sqlite", "partitioned"),
+        default="memory",
+        help="keep the cases in memory, in a SQLite database or in partitions by date",
+    )
+    parser.add_argument(
+        "--database",
+        default="case_archive.db",
+        help="SQLite database file (with --backend sqlite)",
+    )
+    parser.add_argument(
+        "--partitions",
+        default="case_archive_partitions",
+        metavar="DIR",
+        help="partition directory (with --backend partitioned)",
+    )
+    parser.add_argument(
+        "--period",
+        type=int,
+        default=1,
+        metavar="YEARS",
+        help="years of cases per partition (default: 1)",
+    )
+    parser.add_argument(
+        "--resident",
+        type=int,
+        metavar="N",
+        help="keep at most N partitions in memory (default: all)",
+    )
+    parser.add_argument(
+        "--external-sort",
+        metavar="ORDER",
+        help="sort the CSV on disk (e.g. 'date asc') and write it to --output",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="memory to use for --external-sort (default: 64)",
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        help="print operation timings and counters to stderr at the end",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="with --instrument, also profile and trace memory allocations",
+    )
+    arguments = parser.parse_args(argv)
+
+    if arguments.instrument:
+        instrumentation.enable(
+            profile=arguments.profile, trace_memory=arguments.profile
+        )
+
+    if arguments.external_sort:
+        status = external_sort(arguments)
+        if arguments.instrument:
+            print(
+                Instrumentation.format_report(instrumentation.report()),
+                file=sys.stderr,
+            )
+        return status
+
+    if arguments.queries is None:
+        Application().run()
+        return 0
+
+    start = time.perf_counter()
+    try:
+        case_archive = open_archive(
+            arguments.archive,
+            arguments.backend,
+            arguments.database,
+            arguments.workers,
+            arguments.columnar,
+            arguments.partitions,
+            arguments.period,
+            arguments.resident,
+            arguments.lazy,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Failed to load cases: {str(e)}", file=sys.stderr)
+        return 1
+    print(
+        f"Loaded {len(case_archive)} cases in "
+        f"{(time.perf_counter() - start) * 1000:.3f} ms",
+        file=sys.stderr,
+    )
+
+    query_file = sys.stdin
+    output = sys.stdout
+    try:
+        if arguments.queries != "-":
+            query_file = open(arguments.queries, "r", encoding="utf-8")
+        if arguments.output:
+            output = open(arguments.output, "w", encoding="utf-8", newline="")
+        BatchRunner(case_archive, arguments.format, output).run(query_file)
+    except OSError as e:
+        print(f"Failed to run queries: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        if query_file is not sys.stdin:
+            query_file.close()
+        if output is not sys.stdout:
+            output.close()
+
+    if arguments.instrument:
+        print(
+            Instrumentation.format_report(case_archive.instrumentation_report()),
+            file=sys.stderr,
+        )
+    return 0
+
+
 # ------------------------ Run Program ------------------------
 
-app = Application()
-app.run()
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
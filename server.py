@@ -0,0 +1,523 @@
+# Imports
+import argparse
+import asyncio
+import functools
+import json
+import sys
+import traceback
+from urllib.parse import parse_qs, urlsplit
+
+from py_code import (
+    CaseAggregates,
+    CaseExporter,
+    CaseParser,
+    SortingAlgorithm,
+    instrumentation,
+    open_archive,
+)
+
+# ------------------------ Query Server ------------------------
+
+class ArchiveServer:
+    # A small HTTP/1.1 JSON server in front of one shared CaseArchive.
+    #
+    #   GET /search/suspect?name=Unknown
+    #   GET /search/victim?name=Jane Doe
+    #   GET /search/case_id?id=84435
+    #   GET /filter?crime_type=Arson&severity=7&status=Unsolved
+    #   GET /range?start=01/01/1983&end=30/06/1985&min_severity=7
+    #   GET /sort?order=severity desc, date asc
+    #   GET /top?k=50&order=severity desc&status=Unsolved
+    #   GET /summary?group_by=crime_type,status&year=1983
+    #   GET /stats
+    #   GET /instrumentation?enable=1&profile=1&trace_memory=1&reset=1
+    #
+    # Without page_size, results are streamed back as JSON Lines (one case per
+    # line) using chunked transfer encoding. With page_size (and an optional
+    # cursor) one page is returned as a JSON object with the next cursor.
+    #
+    # Queries run in the event loop's thread pool, so a slow query does not
+    # hold up other connections, and every refresh_interval seconds the rows
+    # appended to the CSV file since are added while the server keeps serving.
+    stream_batch_size = 1000
+
+    def __init__(self, case_archive, filepath=None, refresh_interval=None):
+        self.case_archive = case_archive
+        self.filepath = filepath
+        self.refresh_interval = refresh_interval
+
+    def parameter_int(parameters, name, default=None):
+        value = parameters.get(name)
+        if value is None or value == "":
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer.")
+
+    def parameter_date(parameters, name):
+        value = parameters.get(name)
+        if not value:
+            return None
+        return CaseParser.parse_date(value)
+
+    def run_query(self, path, parameters):
+        if path == "/search/suspect":
+            return self.case_archive.search_suspect(parameters.get("name", ""))
+
+        elif path == "/search/victim":
+            return self.case_archive.search_victim(parameters.get("name", ""))
+
+        elif path == "/search/case_id":
+            case_id = ArchiveServer.parameter_int(parameters, "id")
+            if case_id is None:
+                raise ValueError("id is required.")
+            return self.case_archive.search_case_id(case_id)
+
+        elif path == "/filter":
+            return self.case_archive.filter_cases(
+                parameters.get("crime_type") or None,
+                ArchiveServer.parameter_int(parameters, "severity"),
+                parameters.get("status") or None,
+            )
+
+        elif path == "/range":
+            return self.case_archive.range_query(
+                ArchiveServer.parameter_date(parameters, "start"),
+                ArchiveServer.parameter_date(parameters, "end"),
+                ArchiveServer.parameter_int(parameters, "min_severity"),
+                ArchiveServer.parameter_int(parameters, "max_severity"),
+            )
+
+        elif path == "/sort":
+            sort_keys = SortingAlgorithm.parse_sort_keys(
+                parameters.get("order", "case_id")
+            )
+            return self.case_archive.sort_cases(sort_keys)
+
+        elif path == "/top":
+            k = ArchiveServer.parameter_int(parameters, "k", 10)
+            sort_keys = SortingAlgorithm.parse_sort_keys(
+                parameters.get("order", "severity desc")
+            )
+            return self.case_archive.top_cases(
+                k,
+                sort_keys,
+                crime_type=parameters.get("crime_type") or None,
+                severity=ArchiveServer.parameter_int(parameters, "severity"),
+                status=parameters.get("status") or None,
+            )
+
+        return None
+
+    async def read_request(reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        # Request bodies are not used by any endpoint, but must be consumed so
+        # the next request on the connection starts at the right place.
+        content_length = int(headers.get("content-length", 0) or 0)
+        if content_length:
+            await reader.readexactly(content_length)
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("Malformed request line.")
+        return parts[0], parts[1], parts[2], headers
+
+    async def send_json(writer, status, body, keep_alive):
+        payload = json.dumps(body).encode("utf-8")
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n"
+            ).encode("latin-1")
+            + payload
+        )
+        await writer.drain()
+
+    def format_chunk(exporter, cases, start):
+        # Formats one batch of rows as a chunk of the chunked response. This
+        # is also where the cases of a lazy archive are built, so it runs in
+        # the thread pool.
+        batch = cases[start:start + ArchiveServer.stream_batch_size]
+        chunk = exporter.jsonl_text(batch).encode("utf-8")
+        return f"{len(chunk):X}\r\n".encode("latin-1") + chunk + b"\r\n"
+
+    async def stream_cases(writer, cases, keep_alive):
+        # Returns whether the connection can be kept open, which it cannot
+        # after a failure halfway through the response.
+        loop = asyncio.get_running_loop()
+        exporter = CaseExporter()
+
+        # The first batch is formatted before the status line is sent, so an
+        # error in it can still be answered with a 500 response.
+        chunks = range(0, len(cases), ArchiveServer.stream_batch_size)
+        chunk = b""
+        if chunks:
+            chunk = await loop.run_in_executor(
+                None, ArchiveServer.format_chunk, exporter, cases, 0
+            )
+
+        writer.write(
+            (
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: application/x-ndjson\r\n"
+                "Transfer-Encoding: chunked\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                "\r\n"
+            ).encode("latin-1")
+        )
+
+        # Rows are formatted one batch at a time, and each batch is awaited
+        # before the next, so one long result never starves other clients.
+        try:
+            for start in chunks:
+                if start:
+                    chunk = await loop.run_in_executor(
+                        None, ArchiveServer.format_chunk, exporter, cases, start
+                    )
+                writer.write(chunk)
+                await writer.drain()
+        except ConnectionError:
+            raise
+        except Exception:
+            # The status line has been sent, so the response is cut off
+            # without its last chunk and the client sees it as incomplete.
+            ArchiveServer.log_error("Failed to stream cases")
+            return False
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    def log_error(message):
+        print(f"{message}:\n{traceback.format_exc()}", end="", file=sys.stderr)
+
+    async def handle_request(self, method, target, keep_alive, writer):
+        # Returns whether the connection can be kept open. Errors the client
+        # did not cause are logged and answered with a 500 response instead
+        # of dropping the connection.
+        try:
+            return await self.dispatch_request(method, target, keep_alive, writer)
+        except ConnectionError:
+            raise
+        except Exception:
+            ArchiveServer.log_error(f"Failed to handle {method} {target}")
+            await ArchiveServer.send_json(
+                writer,
+                "500 Internal Server Error",
+                {"error": "Internal server error."},
+                keep_alive,
+            )
+            return keep_alive
+
+    def run_page(self, cases, version, parameters, page_size):
+        page, next_cursor = self.case_archive.paginate(
+            cases, parameters.get("cursor") or None, page_size, version
+        )
+        return {
+            "total": len(cases),
+            "cases": [case.to_record() for case in page],
+            "next_cursor": next_cursor,
+        }
+
+    async def dispatch_request(self, method, target, keep_alive, writer):
+        if method != "GET":
+            await ArchiveServer.send_json(
+                writer,
+                "405 Method Not Allowed",
+                {"error": "Only GET is supported."},
+                keep_alive,
+            )
+            return keep_alive
+
+        url = urlsplit(target)
+        parameters = {
+            name: values[-1]
+            for name, values in parse_qs(url.query, keep_blank_values=True).items()
+        }
+
+        if url.path == "/stats":
+            body = {
+                "cases": len(self.case_archive),
+                "version": self.case_archive.version,
+                "cache": self.case_archive.query_cache.stats(),
+            }
+            await ArchiveServer.send_json(writer, "200 OK", body, keep_alive)
+            return keep_alive
+
+        if url.path == "/summary":
+            await self.send_summary(parameters, keep_alive, writer)
+            return keep_alive
+
+        if url.path == "/instrumentation":
+            await self.send_instrumentation(parameters, keep_alive, writer)
+            return keep_alive
+
+        loop = asyncio.get_running_loop()
+        try:
+            # The version the results came from, which page cursors record.
+            cases, version = await loop.run_in_executor(
+                None,
+                self.case_archive.versioned_query,
+                functools.partial(self.run_query, url.path, parameters),
+            )
+            if cases is None:
+                await ArchiveServer.send_json(
+                    writer,
+                    "404 Not Found",
+                    {"error": f"Unknown path: {url.path}"},
+                    keep_alive,
+                )
+                return keep_alive
+
+            page_size = ArchiveServer.parameter_int(parameters, "page_size")
+            if page_size is not None:
+                body = await loop.run_in_executor(
+                    None, self.run_page, cases, version, parameters, page_size
+                )
+                await ArchiveServer.send_json(writer, "200 OK", body, keep_alive)
+                return keep_alive
+
+        except ValueError as e:
+            await ArchiveServer.send_json(
+                writer, "400 Bad Request", {"error": str(e)}, keep_alive
+            )
+            return keep_alive
+
+        return await ArchiveServer.stream_cases(writer, cases, keep_alive)
+
+    async def send_summary(self, parameters, keep_alive, writer):
+        # Summaries are usually rolled up from the aggregates in O(distinct
+        # values), but a lazy archive builds its aggregates from every row on
+        # the first summary, and that waits for write_lock while a load or
+        # refresh holds it. So they are answered in the thread pool.
+        try:
+            group_by = CaseAggregates.parse_dimensions(parameters.get("group_by", ""))
+            summary = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(
+                    self.case_archive.summarize,
+                    group_by,
+                    crime_type=parameters.get("crime_type") or None,
+                    status=parameters.get("status") or None,
+                    severity=ArchiveServer.parameter_int(parameters, "severity"),
+                    year=ArchiveServer.parameter_int(parameters, "year"),
+                ),
+            )
+        except ValueError as e:
+            await ArchiveServer.send_json(
+                writer, "400 Bad Request", {"error": str(e)}, keep_alive
+            )
+            return
+
+        groups = []
+        for group, statistics in summary.items():
+            record = dict(zip(group_by, group))
+            record.update(statistics)
+            groups.append(record)
+        await ArchiveServer.send_json(writer, "200 OK", {"groups": groups}, keep_alive)
+
+    def parameter_flag(parameters, name):
+        value = parameters.get(name)
+        if value is None or value == "":
+            return None
+        if value not in ("0", "1"):
+            raise ValueError(f"{name} must be 0 or 1.")
+        return value == "1"
+
+    async def send_instrumentation(self, parameters, keep_alive, writer):
+        # Turns instrumentation on or off as asked, then returns its report.
+        # The report waits for a profiled query to finish, so it is built in
+        # the thread pool rather than in the event loop.
+        try:
+            enable = ArchiveServer.parameter_flag(parameters, "enable")
+            profile = ArchiveServer.parameter_flag(parameters, "profile")
+            trace_memory = ArchiveServer.parameter_flag(parameters, "trace_memory")
+            reset = ArchiveServer.parameter_flag(parameters, "reset")
+        except ValueError as e:
+            await ArchiveServer.send_json(
+                writer, "400 Bad Request", {"error": str(e)}, keep_alive
+            )
+            return
+
+        if enable is False:
+            instrumentation.disable()
+        elif enable or profile is not None or trace_memory is not None:
+            instrumentation.enable(profile, trace_memory)
+        if reset:
+            instrumentation.reset()
+
+        body = await asyncio.get_running_loop().run_in_executor(
+            None, self.case_archive.instrumentation_report
+        )
+        await ArchiveServer.send_json(writer, "200 OK", body, keep_alive)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await ArchiveServer.read_request(reader)
+                except ValueError as e:
+                    await ArchiveServer.send_json(
+                        writer, "400 Bad Request", {"error": str(e)}, False
+                    )
+                    break
+                if request is None:
+                    break
+
+                method, target, version, headers = request
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (
+                    version == "HTTP/1.1" or connection == "keep-alive"
+                )
+
+                keep_alive = await self.handle_request(
+                    method, target, keep_alive, writer
+                )
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def refresh(self):
+        # Refreshes run in a worker thread. Queries keep using the previous
+        # version of the archive until the new rows are in.
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                refreshed = await loop.run_in_executor(
+                    None, self.case_archive.refresh_cases, self.filepath
+                )
+            except (OSError, ValueError) as e:
+                print(f"Failed to refresh cases: {str(e)}", file=sys.stderr)
+                continue
+
+            if refreshed["reloaded"]:
+                print(
+                    f"Reloaded {refreshed['cases']} cases: {self.filepath} was "
+                    "replaced or rewritten.",
+                    file=sys.stderr,
+                )
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        addresses = ", ".join(
+            f"{socket.getsockname()[0]}:{socket.getsockname()[1]}"
+            for socket in server.sockets
+        )
+        print(f"Serving {len(self.case_archive)} cases on {addresses}")
+        if self.filepath and self.refresh_interval:
+            self.refresh_task = asyncio.create_task(self.refresh())
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a case archive over HTTP.")
+    parser.add_argument(
+        "--archive", default="case_archive.csv", help="CSV file to load"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers", type=int, help="load the CSV with this many processes"
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="only build the cases that queries return, when they are read",
+    )
+    parser.add_argument(
+        "--refresh",
+        type=float,
+        metavar="SECONDS",
+        help="add rows appended to the CSV every SECONDS seconds",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=("memory", "sqlite", "partitioned"),
+        default="memory",
+        help="keep the cases in memory, in a SQLite database or in partitions by date",
+    )
+    parser.add_argument(
+        "--database",
+        default="case_archive.db",
+        help="SQLite database file (with --backend sqlite)",
+    )
+    parser.add_argument(
+        "--partitions",
+        default="case_archive_partitions",
+        metavar="DIR",
+        help="partition directory (with --backend partitioned)",
+    )
+    parser.add_argument(
+        "--period",
+        type=int,
+        default=1,
+        metavar="YEARS",
+        help="years of cases per partition (default: 1)",
+    )
+    parser.add_argument(
+        "--resident",
+        type=int,
+        metavar="N",
+        help="keep at most N partitions in memory (default: all)",
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        help="record operation timings and counters from the start",
+    )
+    arguments = parser.parse_args(argv)
+
+    if arguments.instrument:
+        instrumentation.enable()
+
+    try:
+        case_archive = open_archive(
+            arguments.archive,
+            arguments.backend,
+            arguments.database,
+            arguments.workers,
+            partitions=arguments.partitions,
+            period_years=arguments.period,
+            max_resident=arguments.resident,
+            lazy=arguments.lazy,
+        )
+    except (OSError, ValueError) as e:
+        print(f"Failed to load cases: {str(e)}", file=sys.stderr)
+        return 1
+
+    try:
+        server = ArchiveServer(case_archive, arguments.archive, arguments.refresh)
+        asyncio.run(server.serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+# Tests for the archive backends and their indexes. Run with: python -m pytest
+import os
+import random
+import shutil
+from datetime import datetime
+
+import pytest
+
+from benchmark import CaseGenerator
+from py_code import (
+    BitmapIndex,
+    Case,
+    CaseArchive,
+    CaseSnapshot,
+    NameIndex,
+    SearchAlgorithm,
+    SortedIndex,
+    Suspect,
+    Victim,
+    open_archive,
+)
+
+ROW_COUNT = 2000
+BACKENDS = ("memory", "columnar", "lazy", "sqlite", "partitioned")
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / "cases.csv")
+    CaseGenerator(seed=7).write(path, ROW_COUNT)
+    return path
+
+
+def rows(cases):
+    return [case.to_row() for case in cases]
+
+
+def append_lines(path, count, seed):
+    # Appends count generated rows (without a header) to the CSV at path.
+    with open(path, "a", encoding="utf-8") as f:
+        for row in CaseGenerator(seed).rows(count):
+            f.write(",".join(str(value) for value in row) + "\n")
+
+
+def open_backend(backend, path, tmp_path):
+    if backend == "columnar":
+        pytest.importorskip("numpy")
+        return open_archive(path, columnar=True)
+    if backend == "lazy":
+        return open_archive(path, lazy=True)
+    return open_archive(
+        path,
+        backend,
+        database=str(tmp_path / "cases.db"),
+        partitions=str(tmp_path / "partitions"),
+    )
+
+
+# ------------------------ Indexes ------------------------
+
+def test_hash_index_matches_linear_search(archive_path):
+    case_archive = open_archive(archive_path)
+    cases = case_archive.case_list
+    for case in cases[:200]:
+        for attribute, name in (("suspect", case.suspect.name), ("victim", case.victim.name)):
+            expected = SearchAlgorithm.linear_search(cases, attribute, name)
+            found = getattr(case_archive, f"search_{attribute}")(name.lower())
+            assert rows(found) == rows(expected)
+
+
+def test_bitmap_filters_match_linear_scan(archive_path):
+    case_archive = open_archive(archive_path)
+    cases = case_archive.case_list
+    for crime_type, severity, status in (
+        ("Theft", None, None),
+        (None, 5, None),
+        (None, None, "Unsolved"),
+        ("Assault", 4, "Solved"),
+        ("Arson", 99, None),
+    ):
+        expected = [
+            case
+            for case in cases
+            if crime_type in (None, case.crime_type)
+            and severity in (None, case.severity)
+            and status in (None, case.status)
+        ]
+        assert rows(case_archive.filter_cases(crime_type, severity, status)) == rows(expected)
+
+
+def test_sorted_ranges_match_linear_scan(archive_path):
+    case_archive = open_archive(archive_path)
+    cases = case_archive.case_list
+    for start, end, low, high in (
+        (datetime(1990, 1, 1), datetime(1995, 12, 31), None, None),
+        (None, None, 3, 6),
+        (datetime(2000, 1, 1), None, 8, None),
+        (None, datetime(1985, 6, 30), None, 2),
+    ):
+        expected = [
+            case
+            for case in cases
+            if CaseArchive.in_range(case.date, start, end)
+            and CaseArchive.in_range(case.severity, low, high)
+        ]
+        assert rows(case_archive.range_query(start, end, low, high)) == rows(expected)
+
+
+def test_sorted_index_runs_match_sorted_keys():
+    rng = random.Random(1)
+    index = SortedIndex()
+    entries = []
+    for row in range(3000):
+        key = rng.randrange(500)
+        index.add(key, row)
+        entries.append((key, row))
+        if row % 250 == 0:
+            index = index.freeze()
+    index = index.freeze()
+
+    for low, high in ((None, None), (100, 200), (499, None), (None, 0), (300, 250)):
+        expected = [
+            row for key, row in entries if CaseArchive.in_range(key, low, high)
+        ]
+        assert sorted(index.range_rows(low, high)) == expected
+        assert index.range_count(low, high) == len(expected)
+
+
+def test_bitmap_index_spans_segments():
+    index = BitmapIndex()
+    expected = {"a": [], "b": []}
+    for row in range(0, 3 * BitmapIndex.segment_rows, 97):
+        value = "a" if row % 3 else "b"
+        index.add(value, row)
+        expected[value].append(row)
+    index = index.freeze()
+
+    for value, value_rows in expected.items():
+        assert list(BitmapIndex.rows(index.get(value))) == value_rows
+    assert index.get("c") == 0
+
+
+def test_prefix_matches_do_not_depend_on_insertion_order():
+    names = ["AB CAS", "CAS X", "CAS", "ZED CAS", "CAS X Y", "AL CASTRO", "CASEY"]
+    results = set()
+    for seed in range(20):
+        random.Random(seed).shuffle(names)
+        index = NameIndex()
+        for name in names[:4]:
+            index.add(name)
+        index.flush()
+        for name in names[4:]:
+            index.add(name)
+        results.add(tuple(index.freeze().prefix_matches("CAS", 3)))
+    assert results == {("AB CAS", "CAS", "ZED CAS")}
+
+
+# ------------------------ Backends ------------------------
+
+def backend_queries(case_archive, sample):
+    # The results of one query of each kind for the sampled cases.
+    results = []
+    for case in sample:
+        results.append(case_archive.search_suspect(case.suspect.name))
+        results.append(case_archive.search_victim(case.victim.name))
+        results.append(case_archive.search_case_id(case.case_id))
+        results.append(case_archive.search_suspect_prefix(case.suspect.name[:3], 5))
+        results.append(case_archive.search_victim_fuzzy(case.victim.name[:-1] + "x", 5))
+        results.append(case_archive.filter_cases(case.crime_type, None, case.status))
+        results.append(
+            case_archive.range_query(case.date, None, case.severity, case.severity + 1)
+        )
+    results.append(case_archive.top_cases(10, [("severity", True), ("case_id", False)]))
+    return results
+
+
+@pytest.mark.parametrize("backend", BACKENDS[1:])
+def test_backends_return_the_same_cases(backend, archive_path, tmp_path):
+    memory = open_archive(archive_path)
+    other = open_backend(backend, archive_path, tmp_path)
+    assert len(other) == len(memory)
+
+    sample = random.Random(3).sample(memory.case_list, 20)
+    for expected, found in zip(backend_queries(memory, sample), backend_queries(other, sample)):
+        if backend == "partitioned":
+            # Partitioned results come partition by partition (see README).
+            assert sorted(rows(found)) == sorted(rows(expected))
+        else:
+            assert rows(found) == rows(expected)
+
+    summary = memory.summarize(("crime_type", "status"))
+    assert other.summarize(("crime_type", "status")) == summary
+
+
+# ------------------------ Refresh ------------------------
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_refresh_adds_appended_rows(backend, archive_path, tmp_path):
+    case_archive = open_backend(backend, archive_path, tmp_path)
+    append_lines(archive_path, 50, seed=11)
+
+    assert case_archive.refresh_cases(archive_path) == {"reloaded": False, "cases": 50}
+    assert case_archive.refresh_cases(archive_path) == {"reloaded": False, "cases": 0}
+    assert len(case_archive) == ROW_COUNT + 50
+    assert sorted(rows(case_archive.case_list)) == sorted(
+        rows(open_archive(archive_path).case_list)
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_refresh_reloads_truncated_file(backend, archive_path, tmp_path):
+    case_archive = open_backend(backend, archive_path, tmp_path)
+    CaseGenerator(seed=12).write(archive_path, 100)
+
+    assert case_archive.refresh_cases(archive_path) == {"reloaded": True, "cases": 100}
+    assert sorted(rows(case_archive.case_list)) == sorted(
+        rows(open_archive(archive_path).case_list)
+    )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_refresh_reloads_rotated_file(backend, archive_path, tmp_path):
+    case_archive = open_backend(backend, archive_path, tmp_path)
+    before = case_archive.search_suspect("Unknown")
+
+    # A rotated file is a new file under the same name, here one that starts
+    # with the same bytes as the old one.
+    os.rename(archive_path, archive_path + ".1")
+    shutil.copy(archive_path + ".1", archive_path)
+    append_lines(archive_path, 10, seed=13)
+    os.utime(archive_path)
+
+    assert case_archive.refresh_cases(archive_path) == {
+        "reloaded": True,
+        "cases": ROW_COUNT + 10,
+    }
+    assert len(case_archive) == ROW_COUNT + 10
+    # Results from before the refresh can still be read.
+    assert all(case.suspect.name == "Unknown" for case in before)
+
+
+def test_lazy_rows_survive_rewritten_file(archive_path):
+    case_archive = open_archive(archive_path, lazy=True)
+    expected = rows(open_archive(archive_path).case_list)
+    with open(archive_path, "w", encoding="utf-8") as f:
+        f.write("CaseID,Date\n")
+
+    assert rows(case_archive.case_list) == expected
+
+
+def test_lazy_load_rejects_malformed_rows(tmp_path):
+    path = str(tmp_path / "bad.csv")
+    CaseGenerator(seed=5).write(path, 10)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("1,31-12-1999,Theft,A B,C D,2,Solved\n")
+
+    with pytest.raises(ValueError):
+        open_archive(path, lazy=True)
+
+
+# ------------------------ Snapshots ------------------------
+
+def test_snapshot_round_trip(archive_path, tmp_path):
+    case_archive = open_archive(archive_path)
+    case_archive.add_case(
+        Case(1, datetime(2001, 2, 3), Suspect("A B"), Victim("C D"), "Theft", 2**40, "Solved")
+    )
+    snapshot_path = str(tmp_path / "cases.snapshot")
+    case_archive.save_snapshot(snapshot_path)
+
+    loaded = CaseArchive()
+    loaded.load_snapshot(snapshot_path)
+    assert rows(loaded.case_list) == rows(case_archive.case_list)
+    assert rows(loaded.search_severity_range(2**40, None)) == rows(
+        case_archive.search_severity_range(2**40, None)
+    )
+
+
+def test_snapshot_rejects_unrepresentable_severity(archive_path, tmp_path):
+    case_archive = open_archive(archive_path)
+    case_archive.add_case(
+        Case(1, datetime(2001, 2, 3), Suspect("A B"), Victim("C D"), "Theft", 2**63, "Solved")
+    )
+    snapshot_path = str(tmp_path / "cases.snapshot")
+    with pytest.raises(ValueError):
+        case_archive.save_snapshot(snapshot_path)
+    assert not os.path.exists(snapshot_path)
+
+
+@pytest.mark.parametrize("keep", (0, CaseSnapshot.header_size, 1000, -1))
+def test_truncated_snapshot_is_rejected(keep, archive_path, tmp_path):
+    snapshot_path = str(tmp_path / "cases.snapshot")
+    open_archive(archive_path).save_snapshot(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.truncate(keep if keep >= 0 else os.path.getsize(snapshot_path) + keep)
+
+    with pytest.raises(ValueError):
+        CaseArchive().load_snapshot(snapshot_path)
+
+
+# ------------------------ Cursors ------------------------
+
+def test_cursor_pages_through_results(archive_path):
+    case_archive = open_archive(archive_path)
+    results = case_archive.filter_cases(None, None, "Solved")
+    pages = []
+    cursor = None
+    while True:
+        page, cursor = case_archive.paginate(results, cursor, 30)
+        pages.extend(page)
+        if cursor is None:
+            break
+    assert rows(pages) == rows(results)
+
+
+def test_cursor_is_rejected_after_a_change(archive_path):
+    case_archive = open_archive(archive_path)
+    results, version = case_archive.versioned_query(
+        lambda: case_archive.filter_cases(None, None, "Solved")
+    )
+    case_archive.add_case(case_archive.case_list[0])
+
+    # The cursor records the version the results came from, not the version
+    # at the time the page was cut.
+    _, cursor = case_archive.paginate(results, None, 30, version)
+    assert cursor.startswith(f"{version}:")
+    with pytest.raises(ValueError):
+        case_archive.paginate(results, cursor, 30)
+
+    with pytest.raises(ValueError):
+        case_archive.paginate(results, "not a cursor", 30)
@@ -0,0 +1,112 @@
+# Tests for the query server's responses. Run with: python -m pytest
+import asyncio
+import json
+
+import pytest
+
+from py_code import open_archive
+from server import ArchiveServer
+
+
+@pytest.fixture
+def archive_server():
+    return ArchiveServer(open_archive("case_archive.csv"))
+
+
+async def fetch(server, request):
+    # Sends one raw request to a server on a free port and returns the status
+    # code and the parsed JSON body.
+    listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request.encode("latin-1"))
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 30)
+        writer.close()
+        await writer.wait_closed()
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, json.loads(body)
+
+
+def get(server, target):
+    return asyncio.run(
+        fetch(server, f"GET {target} HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+    )
+
+
+def test_page_and_cursor(archive_server):
+    status, body = get(archive_server, "/sort?order=date&page_size=10")
+    assert status == 200
+    assert body["total"] == 25 and len(body["cases"]) == 10
+
+    status, body = get(
+        archive_server, f"/sort?order=date&page_size=10&cursor={body['next_cursor']}"
+    )
+    assert status == 200
+    assert len(body["cases"]) == 10
+
+
+@pytest.mark.parametrize(
+    "target",
+    (
+        "/search/case_id?id=abc",
+        "/filter?severity=high",
+        "/range?start=1983-01-01",
+        "/sort?order=height",
+        "/top?k=ten&order=date",
+        "/summary?group_by=height",
+        "/sort?order=date&page_size=0",
+        "/sort?order=date&page_size=10&cursor=bogus",
+    ),
+)
+def test_invalid_parameters_are_bad_requests(archive_server, target):
+    status, body = get(archive_server, target)
+    assert status == 400
+    assert body["error"]
+
+
+def test_stale_cursor_is_a_bad_request(archive_server):
+    _, body = get(archive_server, "/sort?order=date&page_size=10")
+    archive_server.case_archive.add_case(archive_server.case_archive.case_list[0])
+
+    status, body = get(
+        archive_server, f"/sort?order=date&page_size=10&cursor={body['next_cursor']}"
+    )
+    assert status == 400
+    assert "changed" in body["error"]
+
+
+def test_unknown_path_is_not_found(archive_server):
+    assert get(archive_server, "/search/witness?name=x")[0] == 404
+
+
+def test_other_methods_are_not_allowed(archive_server):
+    status, _ = asyncio.run(
+        fetch(
+            archive_server,
+            "POST /stats HTTP/1.1\r\nConnection: close\r\nContent-Length: 2\r\n\r\n{}",
+        )
+    )
+    assert status == 405
+
+
+def test_malformed_request_line_is_a_bad_request(archive_server):
+    status, _ = asyncio.run(fetch(archive_server, "GET\r\n\r\n"))
+    assert status == 400
+
+
+def test_unexpected_errors_are_internal_errors(archive_server, capsys):
+    def fail(name):
+        raise RuntimeError("index is broken")
+
+    archive_server.case_archive.search_suspect = fail
+    status, body = get(archive_server, "/search/suspect?name=Unknown")
+    assert status == 500
+    assert body == {"error": "Internal server error."}
+    assert "index is broken" in capsys.readouterr().err